@@ -0,0 +1,290 @@
+#*****************************************************************************
+# CACHES
+#*****************************************************************************
+
+# Bounded in-process caches and set structures used in front of WikiDB
+# lookups.
+
+import math
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+#------------------------------------------------------------------------------
+# LRU Cache
+#------------------------------------------------------------------------------
+
+# Returned by LRUCache.get() when a key is not cached. None is a legitimate
+# cached value (e.g. "this topic does not exist").
+
+MISSING = object()
+
+#------------------------------------------------------------------------------
+
+# A thread safe least recently used cache holding at most <maxsize>
+# entries. Entries expire <ttl> seconds after they were stored, if a ttl is
+# given either for the cache or for the entry. When <sizeof> is given the
+# cache also holds at most <maxbytes> worth of values, as measured by
+# sizeof(value); a value larger than that is not cached.
+
+class LRUCache:
+
+    def __init__(self, maxsize=100000, ttl=None, name="", maxbytes=None,
+                 sizeof=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not MISSING
+
+    def get(self, key, default=MISSING, count=True):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires, size = entry
+                if expires is None or expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return value
+                del self.entries[key]
+                self.nbytes -= size
+                self.expirations += 1
+            if count:
+                self.misses += 1
+            return default
+
+    def put(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self.entries[key] = (value, expires, size)
+            self.nbytes += size
+            while len(self.entries) > self.maxsize or \
+                  (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                _, entry = self.entries.popitem(last=False)
+                self.nbytes -= entry[2]
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self):
+        return {'name' : self.name,
+                'size' : len(self.entries),
+                'maxsize' : self.maxsize,
+                'nbytes' : self.nbytes,
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_ratio' : self.hit_ratio(),
+                'evictions' : self.evictions,
+                'expirations' : self.expirations,
+                'invalidations' : self.invalidations}
+
+#------------------------------------------------------------------------------
+# Hashing Integer Keys
+#------------------------------------------------------------------------------
+
+# The splitmix64 finalizer, applied to an array of int64 keys. Arithmetic
+# is done on uint64 and wraps around. hash_int() computes the same hash of
+# a single key with Python integers, which is much faster than going
+# through numpy for one key.
+
+MASK64 = (1 << 64) - 1
+
+def hash_int64(keys, seed=0):
+    x = np.atleast_1d(np.asarray(keys, dtype=np.int64)).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15) * np.uint64(seed + 1)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    return x
+
+def hash_int(key, seed=0):
+    x = (key + 0x9E3779B97F4A7C15 * (seed + 1)) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+#------------------------------------------------------------------------------
+# Bloom Filter
+#------------------------------------------------------------------------------
+
+# A Bloom filter over int64 keys, sized for <capacity> keys with a false
+# positive rate of <error_rate>. Bit positions are derived from two hashes
+# of the key (Kirsch-Mitzenmacher double hashing). Both add() and
+# contains() take arrays of keys. <count> is the number of keys which set
+# at least one bit, so keys added again are not counted twice (nor are the
+# few new keys colliding with a false positive).
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def positions(self, keys):
+        h1 = hash_int64(keys, 0)
+        h2 = hash_int64(keys, 1) | np.uint64(1)
+        i = np.arange(self.hash_count, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            positions = h1[:, None] + i[None, :] * h2[:, None]
+        return (positions % np.uint64(self.size)).astype(np.int64)
+
+    def __contains__(self, key):
+        h1 = hash_int(key, 0)
+        h2 = hash_int(key, 1) | 1
+        bits = self.bits
+        for i in range(self.hash_count):
+            position = ((h1 + i * h2) & MASK64) % self.size
+            if not (bits[position >> 3] >> (position & 7)) & 1:
+                return False
+        return True
+
+    def add(self, keys):
+        positions = self.positions(np.unique(np.asarray(keys, dtype=np.int64)))
+        bits = (self.bits[positions >> 3] >> (positions & 7)) & 1
+        added = int((bits == 0).any(axis=1).sum())
+        positions = positions.ravel()
+        np.bitwise_or.at(self.bits, positions >> 3,
+                         np.left_shift(1, positions & 7).astype(np.uint8))
+        self.count += added
+        return added
+
+    def contains(self, keys):
+        positions = self.positions(keys)
+        bits = (self.bits[positions >> 3] >> (positions & 7)) & 1
+        return bits.all(axis=1)
+
+#------------------------------------------------------------------------------
+# Integer Hash Set
+#------------------------------------------------------------------------------
+
+# An exact set of non negative int64 keys in a numpy open addressing table
+# with linear probing, i.e. 8 bytes per slot instead of the ~70 bytes per
+# key of a Python set of ints. The table doubles when it is more than
+# MAX_LOAD full. Both add() and contains() take arrays of keys and probe
+# them all at once; add() returns the number of keys actually inserted.
+
+EMPTY_SLOT = -1
+
+class Int64HashSet:
+
+    MAX_LOAD = 0.6
+
+    def __init__(self, capacity=1024):
+        size = 16
+        while size * self.MAX_LOAD < capacity:
+            size *= 2
+        self.table = np.full(size, EMPTY_SLOT, dtype=np.int64)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        table = self.table
+        mask = len(table) - 1
+        slot = hash_int(key) & mask
+        while True:
+            value = table[slot]
+            if value == key:
+                return True
+            if value == EMPTY_SLOT:
+                return False
+            slot = (slot + 1) & mask
+
+    def slots(self, keys):
+        return (hash_int64(keys) & np.uint64(len(self.table) - 1)).astype(np.int64)
+
+    def contains(self, keys):
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.int64))
+        found = np.zeros(len(keys), dtype=bool)
+        active = np.arange(len(keys))
+        slots = self.slots(keys)
+        mask = len(self.table) - 1
+        while len(active) > 0:
+            values = self.table[slots]
+            hits = values == keys[active]
+            found[active[hits]] = True
+            pending = ~hits & (values != EMPTY_SLOT)
+            active = active[pending]
+            slots = (slots[pending] + 1) & mask
+        return found
+
+    def add(self, keys):
+        keys = np.unique(np.asarray(keys, dtype=np.int64))
+        keys = keys[~self.contains(keys)]
+        if len(keys) == 0:
+            return 0
+        if (self.count + len(keys)) > len(self.table) * self.MAX_LOAD:
+            self.resize(self.count + len(keys))
+        self.insert(keys)
+        return len(keys)
+
+    # Places new, unique keys. Of several keys probing the same empty slot
+    # in a round, the first takes it and the others move on.
+    def insert(self, keys):
+        self.count += len(keys)
+        mask = len(self.table) - 1
+        slots = self.slots(keys)
+        while len(keys) > 0:
+            empty = np.flatnonzero(self.table[slots] == EMPTY_SLOT)
+            unique_slots, first = np.unique(slots[empty], return_index=True)
+            winners = empty[first]
+            self.table[slots[winners]] = keys[winners]
+            placed = np.zeros(len(keys), dtype=bool)
+            placed[winners] = True
+            keys = keys[~placed]
+            slots = (slots[~placed] + 1) & mask
+
+    def resize(self, capacity):
+        keys = self.table[self.table != EMPTY_SLOT]
+        size = len(self.table)
+        while size * self.MAX_LOAD < capacity:
+            size *= 2
+        self.table = np.full(size, EMPTY_SLOT, dtype=np.int64)
+        self.count = 0
+        self.insert(keys)
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -52,6 +52,7 @@ def delete_bogus_vertex(vertex_name, conn=None):
                             " WHERE ie.source=" + str(source_id) + \
                             " AND ie. target=" + str(vertex_id) + ";")
         conn.commit()
+        clear_topic_caches()
         print ("Deleted 1 vertex, " + str(len(out_neighbors)) + " outbound edges and " + \
                str(len(in_neighbors)) + " inbound edges.")
     # Wrap up
@@ -3,13 +3,26 @@
 #------------------------------------------------------------------------
 
 # Python modules
+import io
+import os
 import pprint
+import numpy as np
 import pandas as pd
-from multiprocessing import Process, Manager, freeze_support
+import scipy.sparse as sp
+from multiprocessing import freeze_support
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
 
 
 # Pybabar
 import src.processes
+from src.database import wikidb_connection
+from src.database import VERTICES_TABLE
+from src.database import find_topic_id
+from src.database import find_topic_ids
+from src.database import find_vertex_names
+from src.database import find_out_neighbors_batch
+from src.database import find_topic_out_neighbors as find_wiki_out_neighbors
 
 #------------------------------------------------------------------------
 # Global Parameters
@@ -17,6 +30,13 @@ import src.processes
 
 DEFAULT_THRESHOLD=1
 
+# Rows of the distance matrix computed at once.
+DISTANCE_BLOCK_SIZE=1024
+
+# Rows and columns of the tiles computed by each task of
+# pgenerate_distance_matrix().
+DISTANCE_TILE_SIZE=2048
+
 #------------------------------------------------------------------------
 # Jaccard Index
 #------------------------------------------------------------------------
@@ -43,9 +63,9 @@ def get_jaccard_distance (e1, e2, matrix, indices):
 # Note: Topic1 and Topic2 are vertex namees rather than id's.
 
 def compare_topics (topic1, topic2, conn=None):
-    conn = ensure_connection(conn)
-    l1 = find_wiki_out_neighbors(topic1, conn)
-    l2 = find_wiki_out_neighbors(topic2, conn)
+    with wikidb_connection(conn) as conn:
+        l1 = find_wiki_out_neighbors(topic1, conn)
+        l2 = find_wiki_out_neighbors(topic2, conn)
     return jaccard_index(l1, l2)
 
 #------------------------------------------------------------------------
@@ -59,21 +79,75 @@ def topic_belongs_in_cluster_p(topic, cluster, threshold=DEFAULT_THRESHOLD):
     return belongs
 
 #------------------------------------------------------------------------
-# Generate Distance Matrix (serial version)
+# Sparse Jaccard Indices
+#------------------------------------------------------------------------
+
+# The out neighbors of the topics are fetched once, as vertex ids, and
+# stored as the rows of a sparse binary topic x neighbor matrix. For two
+# such matrices A and B, (A @ B.T)[i, j] is the size of the intersection of
+# the neighbors of topic i of A and topic j of B, and the size of their
+# union is the sum of the row sizes minus the intersection.
+
+# Returns the sorted out neighbor ids of each of <topics>, with one query
+# per edge table. Unknown topics have no neighbors.
+
+def topic_neighbor_ids(topics, conn=None):
+    with wikidb_connection(conn) as conn:
+        topic_ids = find_topic_ids(topics, conn)
+        neighbors = find_out_neighbors_batch(list(set(topics)), conn)
+    empty = np.zeros(0, dtype=np.int64)
+    return [neighbors.get(topic_ids[x], empty) for x in topics]
+
 #------------------------------------------------------------------------
 
-# TODO: Use an object to keep the matri and indices together
+# Returns the binary CSR matrix whose row i has a 1 in the column of each
+# element of neighbor_lists[i]. The columns are the distinct neighbors.
+
+def neighbor_matrix(neighbor_lists):
+    lengths = [len(x) for x in neighbor_lists]
+    values = np.concatenate(neighbor_lists) if sum(lengths) > 0 else \
+             np.zeros(0, dtype=np.int64)
+    columns, indices = np.unique(values, return_inverse=True)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return sp.csr_matrix((np.ones(len(values), dtype=np.float32), indices, offsets),
+                         shape=(len(lengths), len(columns)))
+
+#------------------------------------------------------------------------
 
-def generate_distance_matrix (topics1, topics2, conn=None):
-    # Populate the matrix
-    matrix = []
-    for topic1 in topics1:
-        row=[]
-        for topic2 in topics2:
-            row.append(compare_topics(topic1, topic2, conn))
-        matrix.append(row)
-    # Create and return a DataFrame
-    df = pd.DataFrame(matrix, index=topics1, columns=topics2)
+# Returns the Jaccard indices, as percentages like jaccard_index(), of the
+# rows of <m1> and <m2>. Only <block_size> rows of intersections are dense
+# at a time; the result is float32, 10GB for 50,000 x 50,000 topics.
+
+def jaccard_matrix(m1, m2, block_size=DISTANCE_BLOCK_SIZE):
+    sizes1 = np.diff(m1.indptr).astype(np.float32)
+    sizes2 = np.diff(m2.indptr).astype(np.float32)
+    m2t = m2.T.tocsr()
+    result = np.zeros((m1.shape[0], m2.shape[0]), dtype=np.float32)
+    for start in range(0, m1.shape[0], block_size):
+        end = min(start + block_size, m1.shape[0])
+        intersections = (m1[start:end] @ m2t).toarray()
+        unions = sizes1[start:end, None] + sizes2[None, :] - intersections
+        np.divide(intersections * 100, unions, out=result[start:end],
+                  where=unions > 0)
+    return result
+
+#------------------------------------------------------------------------
+# Generate Distance Matrix (serial version)
+#------------------------------------------------------------------------
+
+# Returns a DataFrame of the Jaccard indices of the out neighbors of each
+# of <topics1> (rows) and each of <topics2> (columns).
+
+def generate_distance_matrix (topics1, topics2, conn=None, block_size=DISTANCE_BLOCK_SIZE):
+    topics1, topics2 = list(topics1), list(topics2)
+    neighbor_lists = topic_neighbor_ids(topics1 + topics2, conn)
+    matrix = neighbor_matrix(neighbor_lists)
+    m1 = matrix[:len(topics1)]
+    m2 = matrix[len(topics1):]
+    # Create and return a DataFrame, wrapping the matrix without a copy
+    df = pd.DataFrame(jaccard_matrix(m1, m2, block_size), index=topics1, columns=topics2,
+                      copy=False)
     return df
 
 # def verify_distance_matrix(m):
@@ -88,93 +162,359 @@ def generate_distance_matrix (topics1, topics2, conn=None):
 # Generate Distance Matrix (parallel version)
 #------------------------------------------------------------------------
 
-def reassemble_matrix(quadrants):
-    q1 = quadrants[0]
-    q2 = quadrants[1]
-    q3 = quadrants[2]
-    q4 = quadrants[3]
-    c1 = pd.concat([q1, q2], axis=0)
-    c2 = pd.concat([q3, q4], axis=0)
-    dm = pd.concat([c1, c2], axis=1)
-    return dm
- 
-# Process four quadrants of the matrix in parallel.
-
-def pgenerate_distance_matrix (topics):
-
-    # Partition topics
-    midpoint = round(len(topics) / 2)
-    l1 = topics[:midpoint]
-    l2 = topics[midpoint:]
-
-    # Use a shared variable to collect results fromm each process
-    manager = Manager()
-    return_dict = manager.dict()
-
-    # Run four jobs, one for each quadrant of the matrix.
-    jobs = [] 
-    freeze_support()
-    p1 = Process(target=processes.pdm_worker, args=(l1, l1, 1, return_dict))
-    jobs.append(p1)
-    p1.start()
-    p2 = Process(target=processes.pdm_worker, args=(l1, l2, 2, return_dict))
-    jobs.append(p2)
-    p2.start()
-    p3 = Process(target=processes.pdm_worker, args=(l2, l1, 3, return_dict))
-    jobs.append(p3)
-    p3.start()
-    p4 = Process(target=processes.pdm_worker, args=(l2, l2, 4, return_dict))
-    jobs.append(p4)
-    p4.start()
-
-    # Gather the results
-    for proc in jobs:
-        proc.join()
-
-    # Reassemble the matrix...
-    quadrants = return_dict.values()
-    dm = reassemble_matrix (quadrants)
-    
-    # Return the distance matrix
-    return dm
+# The Jaccard matrix of <topics> with themselves is split into tiles of
+# <tile_size> x <tile_size> topics. Since it is symmetric only the tiles on
+# or above the diagonal are computed, each by one task of a process pool,
+# and a worker writes its tile and the transposed tile straight into a
+# shared memory buffer, so no results go back through pickling. The
+# neighbor matrix is handed to each worker once, when it starts.
 
+def distance_matrix_tiles(n, tile_size=DISTANCE_TILE_SIZE):
+    bounds = list(range(0, n, tile_size)) + [n]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    return [(r1, r2) for i, r1 in enumerate(ranges) for r2 in ranges[i:]]
+
+#------------------------------------------------------------------------
+
+def pgenerate_distance_matrix (topics, tile_size=DISTANCE_TILE_SIZE, workers=None,
+                               conn=None):
+    topics = list(topics)
+    n = len(topics)
+    matrix = neighbor_matrix(topic_neighbor_ids(topics, conn))
+    workers = workers if workers is not None else os.cpu_count()
+    shm = SharedMemory(create=True, size=max(n * n * 4, 1))
+    try:
+        freeze_support()
+        with ProcessPoolExecutor(workers, initializer=src.processes.init_pdm_worker,
+                                 initargs=(shm.name, n, matrix.indptr, matrix.indices,
+                                           matrix.shape[1])) as executor:
+            list(executor.map(src.processes.pdm_tile_worker,
+                              distance_matrix_tiles(n, tile_size)))
+        # The only copy: the shared buffer goes away with the pool.
+        result = np.ndarray((n, n), dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return pd.DataFrame(result, index=topics, columns=topics, copy=False)
 
 #------------------------------------------------------------------------
 # Cluster Class
 #------------------------------------------------------------------------
 
+# The members of a cluster are the vertex ids of its topics, in the order
+# they joined, held in a growing int32 array. Membership is looked up in
+# the vertex -> cluster array of the clustering it belongs to.
+
 class Cluster:
 
-    def __init__(self, members, name=""):
-        self.name = name
-        self.members = members
+    __slots__ = ('name', 'index', 'clustering', 'ids', 'size')
 
-    def add_member(self, member):
-        self.members.append(member)
+    def __init__(self, clustering, index, members=(), name=""):
+        self.name = name
+        self.index = index
+        self.clustering = clustering
+        self.ids = np.array(members, dtype=np.int32)
+        self.size = len(self.ids)
+
+    def __len__(self):
+        return self.size
+
+    def member_ids(self):
+        return self.ids[:self.size]
+
+    # The topic names of the members.
+    @property
+    def members(self):
+        ids = self.member_ids().tolist()
+        names = find_vertex_names(ids)
+        return [names[x] for x in ids if x in names]
+
+    def add_member(self, vertex_id):
+        if self.size == len(self.ids):
+            ids = np.empty(max(4, 2 * len(self.ids)), dtype=np.int32)
+            ids[:self.size] = self.ids
+            self.ids = ids
+        self.ids[self.size] = vertex_id
+        self.size += 1
 
     def member_p (self, elmt):
-        return elmt in self.members
-
+        return self.clustering.cluster_of(elmt) is self
 
 #------------------------------------------------------------------------
 # SR Clustering
 #------------------------------------------------------------------------
 
-def sr_clustering(topics, threshold=DEFAULT_THRESHOLD):
-    clusters = []
-    cluster_count = 0
-    for topic in topics:
-        found = False
-        for cluster in clusters:
-            if topic_belongs_in_cluster_p(topic, cluster):
-                cluster.add_member(topic)
-                found = True
+# A topic joins the first cluster all of whose members have a Jaccard
+# index of at least <threshold> with it, otherwise it starts a new
+# cluster. The neighbor ids of the topics are fetched once per call to
+# add_topics(), and an inverted index maps each neighbor to the clusters
+# having a member linked to it. With a positive threshold a topic can only
+# join a cluster with which it shares a neighbor, so only those clusters
+# are checked. Topics can be added at any time; existing clusters are
+# not recomputed.
+#
+# Topics are identified by vertex id and topics which are not in
+# wiki_vertices are left out. <assignments> maps each vertex id to the
+# index of its cluster, or -1, i.e. 4 bytes per vertex up to the largest
+# id clustered. The neighbor sets and the inverted index are only needed
+# to add topics; a loaded clustering rebuilds them on its first addition.
+
+class Clustering:
+
+    __slots__ = ('threshold', 'clusters', 'assignments', 'neighbors', 'postings',
+                 'indexed_p')
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.clusters = []
+        self.assignments = np.full(0, -1, dtype=np.int32)
+        self.neighbors = {}
+        self.postings = {}
+        self.indexed_p = True
+
+    def __len__(self):
+        return len(self.clusters)
+
+    #--------------------------------------------------------------------
+    # Lookups
+
+    # Returns the cluster of <topic>, a name or a vertex id, or None.
+    def cluster_of(self, topic, conn=None):
+        vertex_id = topic if not isinstance(topic, str) else find_topic_id(topic, conn)
+        if vertex_id is None or not 0 <= vertex_id < len(self.assignments):
+            return None
+        index = self.assignments[vertex_id]
+        return self.clusters[index] if index >= 0 else None
+
+    def assigned_p(self, vertex_id):
+        return vertex_id < len(self.assignments) and self.assignments[vertex_id] >= 0
+
+    def assign(self, vertex_ids, index):
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        if len(vertex_ids) == 0:
+            return
+        size = int(vertex_ids.max()) + 1
+        if size > len(self.assignments):
+            assignments = np.full(max(size, 2 * len(self.assignments)), -1, dtype=np.int32)
+            assignments[:len(self.assignments)] = self.assignments
+            self.assignments = assignments
+        self.assignments[vertex_ids] = index
+
+    def new_cluster(self, members=(), name=None):
+        index = len(self.clusters)
+        name = name if name is not None else "Cluster " + str(index + 1)
+        cluster = Cluster(self, index, members, name)
+        self.clusters.append(cluster)
+        self.assign(cluster.member_ids(), index)
+        return cluster
+
+    #--------------------------------------------------------------------
+    # Adding Topics
+
+    def fetch_neighbors(self, vertex_ids, conn=None):
+        missing = [x for x in vertex_ids if x not in self.neighbors]
+        if missing != []:
+            neighbors = find_out_neighbors_batch(missing, conn)
+            for vertex_id in missing:
+                ids = neighbors.get(vertex_id)
+                self.neighbors[vertex_id] = frozenset(ids.tolist()) if ids is not None \
+                                            else frozenset()
+
+    def ensure_index(self, conn=None):
+        if self.indexed_p:
+            return
+        self.fetch_neighbors([x for c in self.clusters for x in c.member_ids().tolist()],
+                             conn)
+        for cluster in self.clusters:
+            for vertex_id in cluster.member_ids().tolist():
+                for neighbor in self.neighbors[vertex_id]:
+                    self.postings.setdefault(neighbor, set()).add(cluster.index)
+        self.indexed_p = True
+
+    def add_topics(self, topics, conn=None):
+        with wikidb_connection(conn) as conn:
+            names = [x for x in topics if isinstance(x, str)]
+            topic_ids = find_topic_ids(names, conn) if names != [] else {}
+            vertex_ids = [topic_ids[x] if isinstance(x, str) else int(x) for x in topics]
+            new_ids = list(dict.fromkeys([x for x in vertex_ids \
+                                          if x is not None and not self.assigned_p(x)]))
+            if new_ids == []:
+                return self.clusters
+            self.ensure_index(conn)
+            self.fetch_neighbors(new_ids, conn)
+        for vertex_id in new_ids:
+            self.add_topic(vertex_id)
+        return self.clusters
+
+    def candidate_clusters(self, neighbors):
+        if self.threshold <= 0:
+            return range(len(self.clusters))
+        candidates = set()
+        for neighbor in neighbors:
+            candidates.update(self.postings.get(neighbor, ()))
+        return sorted(candidates)
+
+    def belongs_p(self, neighbors, cluster):
+        for member in cluster.member_ids().tolist():
+            if set_jaccard_index(neighbors, self.neighbors[member]) < self.threshold:
+                return False
+        return True
+
+    def add_topic(self, vertex_id):
+        neighbors = self.neighbors[vertex_id]
+        for index in self.candidate_clusters(neighbors):
+            cluster = self.clusters[index]
+            if self.belongs_p(neighbors, cluster):
+                cluster.add_member(vertex_id)
+                self.assign([vertex_id], index)
                 break
-        if found==False:
-            cluster_count += 1
-            new_cluster = Cluster([topic], "Cluster " + str(cluster_count))
-            clusters.append (new_cluster)
-    return clusters
+        else:
+            cluster = self.new_cluster([vertex_id])
+        for neighbor in neighbors:
+            self.postings.setdefault(neighbor, set()).add(cluster.index)
+        return cluster
+
+    #--------------------------------------------------------------------
+    # Compact Form
+
+    # The clusters as CSR arrays: the members of cluster i are
+    # member_ids[offsets[i]:offsets[i+1]].
+    def to_arrays(self):
+        sizes = [len(c) for c in self.clusters]
+        offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        member_ids = np.concatenate([c.member_ids() for c in self.clusters]) \
+                     if self.clusters != [] else np.zeros(0, dtype=np.int32)
+        return offsets, member_ids, [c.name for c in self.clusters]
+
+    @classmethod
+    def from_arrays(cls, offsets, member_ids, names, threshold=DEFAULT_THRESHOLD):
+        clustering = cls(threshold)
+        for i, name in enumerate(names):
+            clustering.new_cluster(member_ids[offsets[i]:offsets[i+1]], name)
+        clustering.indexed_p = False
+        return clustering
+
+#------------------------------------------------------------------------
+
+def set_jaccard_index (s1, s2):
+    if len(s1)==0 or len(s2)==0:
+        return 0
+    return len(s1 & s2) * 100.0 / len(s1 | s2)
+
+#------------------------------------------------------------------------
+
+def sr_clustering(topics, threshold=DEFAULT_THRESHOLD, conn=None):
+    clustering = Clustering(threshold)
+    return clustering.add_topics(topics, conn)
+
+#------------------------------------------------------------------------
+# Saving Clusterings
+#------------------------------------------------------------------------
+
+# On disk a clustering is an .npz file of its CSR arrays, cluster names and
+# threshold.
+
+def save_clustering(clustering, pathname):
+    offsets, member_ids, names = clustering.to_arrays()
+    # np.savez() would add the extension otherwise.
+    with open(pathname, 'wb') as f:
+        np.savez(f, offsets=offsets, member_ids=member_ids,
+                 names=np.array(names, dtype=str), threshold=clustering.threshold)
+    return pathname
+
+#------------------------------------------------------------------------
+
+def load_clustering(pathname):
+    with np.load(pathname) as data:
+        return Clustering.from_arrays(data['offsets'], data['member_ids'],
+                                      data['names'].tolist(), float(data['threshold']))
+
+#------------------------------------------------------------------------
+
+# In WikiDB the clusterings are stored in one table, one row per member,
+# under a clustering name.
+
+TOPIC_CLUSTERS_TABLE = 'wiki_topic_clusters'
+
+create_topic_clusters_str = "CREATE TABLE IF NOT EXISTS " + TOPIC_CLUSTERS_TABLE + \
+                            " (clustering character varying NOT NULL, " + \
+                            "cluster integer NOT NULL, " + \
+                            "position integer NOT NULL, " + \
+                            "id integer NOT NULL, " + \
+                            "cluster_name character varying, " + \
+                            "threshold double precision, " + \
+                            "CONSTRAINT topic_clusters_id PRIMARY KEY (clustering, id));"
+
+def ensure_topic_clusters_table(conn):
+    cur = conn.cursor()
+    cur.execute(create_topic_clusters_str)
+    cur.execute("CREATE INDEX IF NOT EXISTS " + TOPIC_CLUSTERS_TABLE + "_cluster_idx ON " + \
+                TOPIC_CLUSTERS_TABLE + " (clustering, cluster);")
+    conn.commit()
+
+#------------------------------------------------------------------------
+
+# Replaces the clustering stored as <name>.
+
+def store_clustering(clustering, name, conn=None):
+    offsets, member_ids, names = clustering.to_arrays()
+    sizes = np.diff(offsets)
+    clusters = np.repeat(np.arange(len(sizes)), sizes)
+    df = pd.DataFrame({'clustering' : name,
+                       'cluster' : clusters,
+                       'position' : np.arange(len(member_ids)) - offsets[clusters],
+                       'id' : member_ids,
+                       'cluster_name' : [names[i] for i in clusters],
+                       'threshold' : clustering.threshold})
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    with wikidb_connection(conn) as conn:
+        ensure_topic_clusters_table(conn)
+        cur = conn.cursor()
+        cur.execute("DELETE FROM " + TOPIC_CLUSTERS_TABLE + " WHERE clustering=%s;", (name,))
+        cur.copy_expert("COPY " + TOPIC_CLUSTERS_TABLE + " (clustering, cluster, position, " + \
+                        "id, cluster_name, threshold) FROM STDIN WITH (FORMAT csv)", buffer)
+        conn.commit()
+    return len(df)
+
+#------------------------------------------------------------------------
+
+def load_stored_clustering(name, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT cluster, id, cluster_name, threshold FROM " + \
+                    TOPIC_CLUSTERS_TABLE + " WHERE clustering=%s " + \
+                    "ORDER BY cluster, position;", (name,))
+        rows = cur.fetchall()
+    if rows == []:
+        return None
+    clusters = np.array([row[0] for row in rows], dtype=np.int64)
+    offsets = np.zeros(int(clusters[-1]) + 2, dtype=np.int64)
+    np.cumsum(np.bincount(clusters, minlength=len(offsets) - 1), out=offsets[1:])
+    names = [""] * (len(offsets) - 1)
+    for row in rows:
+        names[row[0]] = row[2]
+    return Clustering.from_arrays(offsets, np.array([row[1] for row in rows], dtype=np.int32),
+                                  names, rows[0][3])
+
+#------------------------------------------------------------------------
+
+# Returns the member names of the cluster of <topic_name> in the stored
+# clustering <name>, without loading it.
+
+def find_topic_cluster(topic_name, name, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT wv.name FROM " + TOPIC_CLUSTERS_TABLE + " as tc " + \
+                    "JOIN " + VERTICES_TABLE + " as wv ON wv.id = tc.id " + \
+                    "WHERE tc.clustering=%s AND tc.cluster = " + \
+                    "(SELECT tc2.cluster FROM " + TOPIC_CLUSTERS_TABLE + " as tc2 " + \
+                    "JOIN " + VERTICES_TABLE + " as wv2 ON wv2.id = tc2.id " + \
+                    "WHERE tc2.clustering=%s AND LOWER(wv2.name) = LOWER(%s) LIMIT 1) " + \
+                    "ORDER BY tc.position;", (name, name, topic_name))
+        return [row[0] for row in cur.fetchall()]
 
 #------------------------------------------------------------------------
 
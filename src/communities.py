@@ -0,0 +1,595 @@
+#*****************************************************************************
+# TOPIC COMMUNITIES
+#*****************************************************************************
+#
+# Part 1: Undirected Subgraphs
+# Part 2: Triangle Counting
+# Part 3: Connected Components
+# Part 4: Label Propagation
+# Part 5: Storing Results
+# Part 6: Benchmarks
+# Part 7: Main Runtime
+#
+#*****************************************************************************
+
+# Community structure of the topics, computed over the undirected subgraph
+# of the CSR snapshot (see graph.py) formed by the 'strongly related' edges,
+# i.e. the pairs of topics which link to each other.
+
+import io
+import sys
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+# Project Imports
+from src.database import wikidb_connection
+from src.database import VERTICES_TABLE
+from src.graph import build_csr
+from src.graph import get_wiki_graph
+from src.graph import make_random_wiki_graph
+from src.traversal import edge_type_mask
+
+#------------------------------------------------------------------------------
+
+STRONGLY_RELATED = ['strongly related']
+
+# Upper bound on the number of wedges examined at once by a worker.
+WEDGE_CHUNK_SIZE = 4000000
+
+DEFAULT_LPA_ITERATIONS = 20
+DEFAULT_LPA_TOLERANCE = 0.001
+
+#*****************************************************************************
+# Part 1: Undirected Subgraphs
+#*****************************************************************************
+
+# Returns the CSR offsets and sorted neighbors of the undirected graph with
+# an edge {a, b} for every edge a->b or b->a of <graph> whose type is one of
+# <edge_types>, all the edges if it is None. Self loops are dropped.
+
+def undirected_adjacency(graph, edge_types=STRONGLY_RELATED):
+    n = graph.vertex_count()
+    sources = np.repeat(np.arange(n, dtype=np.int32), graph.outdegrees())
+    targets = graph.out_targets
+    mask = edge_type_mask(edge_types)
+    if mask is not None:
+        keep = mask[graph.out_types]
+        sources = sources[keep]
+        targets = targets[keep]
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    keys = np.concatenate([sources, targets])
+    values = np.concatenate([targets, sources])
+    offsets, neighbors, _ = build_csr(keys, values,
+                                      np.zeros(len(keys), dtype=np.uint8), n)
+    return offsets, neighbors
+
+#*****************************************************************************
+# Part 2: Triangle Counting
+#*****************************************************************************
+
+# Each undirected edge is oriented from the endpoint of lower degree to the
+# one of higher degree (ties broken by index). Every triangle then has
+# exactly one vertex u with both other vertices v, w among its forward
+# neighbors, and no vertex has more than sqrt(2m) forward neighbors, which
+# keeps hubs from producing quadratic work.
+#
+# The forward neighbors of u are sorted, and so are the keys a * n + b of
+# all the forward edges. The wedges (u, v, w), v before w in the forward
+# list of u, are enumerated in chunks of forward edges and each is closed
+# by looking up the oriented edge between v and w with one searchsorted
+# over the sorted keys, i.e. the intersection of the forward lists of u and
+# v done for all the wedges of a chunk at once.
+
+def degree_ranks(offsets):
+    degrees = np.diff(offsets)
+    ranks = np.empty(len(degrees), dtype=np.int64)
+    ranks[np.argsort(degrees, kind='stable')] = np.arange(len(degrees))
+    return ranks
+
+#------------------------------------------------------------------------------
+
+def forward_adjacency(offsets, neighbors, ranks):
+    n = len(offsets) - 1
+    sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(offsets))
+    keep = ranks[sources] < ranks[neighbors]
+    sources, targets = sources[keep], neighbors[keep]
+    forward_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=forward_offsets[1:])
+    return forward_offsets, sources, targets
+
+#------------------------------------------------------------------------------
+
+# Splits the forward edges into ranges holding about <chunk_size> wedges.
+# Forward edge p pairs with the edges after it in its row.
+
+def wedge_chunks(forward_offsets, sources, chunk_size=WEDGE_CHUNK_SIZE):
+    positions = np.arange(len(sources), dtype=np.int64)
+    partners = forward_offsets[sources + 1] - positions - 1
+    cumulative = np.cumsum(partners)
+    total = int(cumulative[-1]) if len(cumulative) > 0 else 0
+    bounds = np.searchsorted(cumulative, np.arange(chunk_size, total, chunk_size))
+    bounds = np.unique(np.concatenate([[0], bounds, [len(sources)]]))
+    return list(zip(bounds[:-1], bounds[1:])), partners, total
+
+#------------------------------------------------------------------------------
+
+class TriangleCounter:
+
+    def __init__(self, offsets, neighbors):
+        n = len(offsets) - 1
+        self.vertex_count = n
+        self.ranks = degree_ranks(offsets)
+        forward_offsets, sources, targets = forward_adjacency(offsets, neighbors,
+                                                              self.ranks)
+        self.sources = sources
+        self.targets = targets
+        # Already sorted: rows in order, targets sorted within each row.
+        self.keys = sources.astype(np.int64) * n + targets
+        self.chunks, self.partners, self.wedge_count = \
+            wedge_chunks(forward_offsets, sources)
+
+    # Adds to <counts> the triangles closing the wedges of the forward edges
+    # [start, end).
+    def count_chunk(self, start, end, counts):
+        partners = self.partners[start:end]
+        total = int(partners.sum())
+        if total == 0:
+            return 0
+        first = np.repeat(np.arange(start, end, dtype=np.int64), partners)
+        skips = np.arange(total, dtype=np.int64) - \
+                np.repeat(np.cumsum(partners) - partners, partners)
+        second = first + 1 + skips
+        v = self.targets[first]
+        w = self.targets[second]
+        swap = self.ranks[v] > self.ranks[w]
+        a = np.where(swap, w, v).astype(np.int64)
+        b = np.where(swap, v, w)
+        wanted = a * self.vertex_count + b
+        # Searching for the keys in ascending order is several times faster
+        # than in wedge order, even counting the sort.
+        order = np.argsort(wanted)
+        wanted = wanted[order]
+        positions = np.searchsorted(self.keys, wanted)
+        positions[positions == len(self.keys)] = 0
+        closed = order[self.keys[positions] == wanted]
+        n = self.vertex_count
+        counts += np.bincount(self.sources[first[closed]], minlength=n)
+        counts += np.bincount(v[closed], minlength=n)
+        counts += np.bincount(w[closed], minlength=n)
+        return len(closed)
+
+    # Each of the <threads> workers takes every threads-th chunk and keeps
+    # its own counts; numpy releases the GIL in the sorts and searches.
+    def count(self, threads=1):
+        threads = max(1, min(threads, len(self.chunks)))
+        def count_chunks(worker):
+            counts = np.zeros(self.vertex_count, dtype=np.int64)
+            triangles = 0
+            for start, end in self.chunks[worker::threads]:
+                triangles += self.count_chunk(start, end, counts)
+            return counts, triangles
+        if threads == 1:
+            results = [count_chunks(0)]
+        else:
+            with ThreadPoolExecutor(threads) as executor:
+                results = list(executor.map(count_chunks, range(threads)))
+        counts = np.zeros(self.vertex_count, dtype=np.int64)
+        for worker_counts, _ in results:
+            counts += worker_counts
+        return counts, sum([x for _, x in results])
+
+#------------------------------------------------------------------------------
+
+# Returns the undirected degree and the number of triangles of every vertex
+# of <graph>, as arrays indexed like the graph's vertices.
+
+def triangle_counts(graph, edge_types=STRONGLY_RELATED, threads=1, verbose=False):
+    start = time.perf_counter()
+    offsets, neighbors = undirected_adjacency(graph, edge_types)
+    counter = TriangleCounter(offsets, neighbors)
+    if verbose:
+        print ("Triangles: " + str(len(neighbors) // 2) + " edges, " + \
+               str(counter.wedge_count) + " wedges in " + \
+               str(len(counter.chunks)) + " chunks, prepared in " + \
+               str(round(time.perf_counter() - start, 2)) + "s")
+    triangles, total = counter.count(threads)
+    if verbose:
+        print ("Triangles: " + str(total) + " found in " + \
+               str(round(time.perf_counter() - start, 2)) + "s")
+    return np.diff(offsets), triangles
+
+#------------------------------------------------------------------------------
+
+# The local clustering coefficient of a vertex: the fraction of the pairs of
+# its neighbors which are linked, 0 for vertices with fewer than two.
+
+def clustering_coefficients(degrees, triangles):
+    pairs = degrees.astype(np.float64) * (degrees - 1) / 2
+    return np.divide(triangles, pairs, out=np.zeros(len(pairs)), where=pairs > 0)
+
+#------------------------------------------------------------------------------
+
+# The fraction of all the wedges which are closed.
+
+def transitivity(degrees, triangles):
+    wedges = (degrees.astype(np.float64) * (degrees - 1) / 2).sum()
+    return float(triangles.sum() / wedges) if wedges > 0 else 0.0
+
+#*****************************************************************************
+# Part 3: Connected Components
+#*****************************************************************************
+
+# Union-find over all the edges at once. Each round hooks the root of the
+# larger label onto the smaller one for every edge whose endpoints have
+# different roots, then compresses the paths by pointer jumping until every
+# vertex points at its root. Edges already inside a component are dropped
+# as they are found, so rounds get cheaper; a few dozen rounds suffice on
+# power law graphs.
+
+def union_find_components(n, sources, targets):
+    parent = np.arange(n, dtype=np.int64)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    while len(sources) > 0:
+        a = parent[sources]
+        b = parent[targets]
+        pending = a != b
+        sources, targets = sources[pending], targets[pending]
+        a, b = a[pending], b[pending]
+        if len(sources) == 0:
+            break
+        np.minimum.at(parent, np.maximum(a, b), np.minimum(a, b))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+#------------------------------------------------------------------------------
+
+# Returns the labels, in [0, components), and the sizes of the components.
+# Labels are numbered by decreasing size, so 0 is the largest component.
+
+def compact_labels(roots):
+    unique, labels, sizes = np.unique(roots, return_inverse=True, return_counts=True)
+    order = np.argsort(-sizes, kind='stable')
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+    return ranks[labels].astype(np.int32), sizes[order]
+
+#------------------------------------------------------------------------------
+
+# The weakly connected components of <graph>, following the edges of the
+# given types, all of them by default.
+
+def weakly_connected_components(graph, edge_types=None, verbose=False):
+    start = time.perf_counter()
+    n = graph.vertex_count()
+    sources = np.repeat(np.arange(n, dtype=np.int32), graph.outdegrees())
+    targets = graph.out_targets
+    mask = edge_type_mask(edge_types)
+    if mask is not None:
+        keep = mask[graph.out_types]
+        sources, targets = sources[keep], targets[keep]
+    labels, sizes = compact_labels(union_find_components(n, sources, targets))
+    if verbose:
+        print ("Components: " + str(len(sizes)) + " found, the largest with " + \
+               str(sizes[0] if len(sizes) > 0 else 0) + " vertices, in " + \
+               str(round(time.perf_counter() - start, 2)) + "s")
+    return labels, sizes
+
+#*****************************************************************************
+# Part 4: Label Propagation
+#*****************************************************************************
+
+# Communities by label propagation over the undirected subgraph: every
+# vertex starts with its own label and repeatedly takes the label most
+# frequent among its neighbors, keeping its label if it is one of the most
+# frequent and otherwise taking the smallest. Updating all the vertices at
+# once makes labels oscillate on bipartite parts of the graph, so each
+# iteration only updates a random half of them. Once no more than
+# <tolerance> of the vertices would change label, they all do and it stops.
+#
+# An iteration is a sort of the (vertex, neighbor label) keys, i.e. about a
+# second per 10,000,000 edges.
+
+def most_frequent_labels(offsets, neighbors, labels):
+    n = len(offsets) - 1
+    if len(neighbors) == 0:
+        return labels.copy()
+    vertices = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets))
+    keys = vertices * n + labels[neighbors]
+    keys.sort()
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    counts = np.diff(np.append(starts, len(keys)))
+    keys = keys[starts]
+    owners, candidates = keys // n, keys % n
+    # Twice the votes, plus one for the current label to win ties.
+    scores = 2 * counts + (candidates == labels[owners])
+    groups = np.flatnonzero(np.concatenate([[True], owners[1:] != owners[:-1]]))
+    best = np.maximum.reduceat(scores, groups)
+    winners = np.flatnonzero(scores == np.repeat(best, np.diff(np.append(groups, len(owners)))))
+    # The first winner of each vertex has the smallest label.
+    winners = winners[np.concatenate([[True], owners[winners][1:] != owners[winners][:-1]])]
+    result = labels.copy()
+    result[owners[winners]] = candidates[winners]
+    return result
+
+#------------------------------------------------------------------------------
+
+def label_propagation(offsets, neighbors, iterations=DEFAULT_LPA_ITERATIONS,
+                      tolerance=DEFAULT_LPA_TOLERANCE, seed=0, verbose=False):
+    n = len(offsets) - 1
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n, dtype=np.int64)
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        proposed = most_frequent_labels(offsets, neighbors, labels)
+        changed = proposed != labels
+        converged = changed.sum() <= tolerance * n
+        if not converged:
+            changed &= rng.random(n) < 0.5
+        labels[changed] = proposed[changed]
+        if verbose:
+            print ("Label propagation: iteration " + str(iteration + 1) + ", " + \
+                   str(int(changed.sum())) + " labels changed in " + \
+                   str(round(time.perf_counter() - start, 2)) + "s")
+        if converged:
+            break
+    return labels
+
+#------------------------------------------------------------------------------
+
+# The communities of the topics of <graph>, labelled by decreasing size.
+# Topics without an edge of the given types are communities of their own.
+
+def topic_communities(graph, edge_types=STRONGLY_RELATED,
+                      iterations=DEFAULT_LPA_ITERATIONS, seed=0, verbose=False):
+    start = time.perf_counter()
+    offsets, neighbors = undirected_adjacency(graph, edge_types)
+    labels, sizes = compact_labels(label_propagation(offsets, neighbors, iterations,
+                                                     seed=seed, verbose=verbose))
+    if verbose:
+        print ("Communities: " + str(int((sizes > 1).sum())) + \
+               " with more than one topic, the largest with " + \
+               str(sizes[0] if len(sizes) > 0 else 0) + " topics, in " + \
+               str(round(time.perf_counter() - start, 2)) + "s")
+    return labels, sizes
+
+#*****************************************************************************
+# Part 5: Storing Results
+#*****************************************************************************
+
+# One row per topic with at least one strongly related topic.
+
+TOPIC_CLUSTERING_TABLE = 'wiki_topic_clustering'
+
+create_topic_clustering_str = "CREATE TABLE " + TOPIC_CLUSTERING_TABLE + \
+                              " (id integer NOT NULL, " + \
+                              "degree integer, " + \
+                              "triangles bigint, " + \
+                              "clustering double precision, " + \
+                              "CONSTRAINT topic_clustering_id PRIMARY KEY (id));"
+
+def store_topic_clustering(graph, degrees, triangles, coefficients, conn=None):
+    keep = degrees > 0
+    df = pd.DataFrame({'id' : graph.ids[keep],
+                       'degree' : degrees[keep],
+                       'triangles' : triangles[keep],
+                       'clustering' : coefficients[keep]})
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, float_format='%.12g')
+    buffer.seek(0)
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("DROP TABLE IF EXISTS " + TOPIC_CLUSTERING_TABLE + ";")
+        cur.execute(create_topic_clustering_str)
+        cur.copy_expert("COPY " + TOPIC_CLUSTERING_TABLE + \
+                        " (id, degree, triangles, clustering) FROM STDIN WITH (FORMAT csv)",
+                        buffer)
+        conn.commit()
+    return len(df)
+
+#------------------------------------------------------------------------------
+
+# Counts the triangles of the strongly related subgraph of the current
+# snapshot and stores them with the clustering coefficients.
+
+def update_topics_clustering(edge_types=STRONGLY_RELATED, threads=1, graph=None,
+                             conn=None):
+    if graph is None:
+        graph = get_wiki_graph()
+    degrees, triangles = triangle_counts(graph, edge_types, threads, verbose=True)
+    coefficients = clustering_coefficients(degrees, triangles)
+    count = store_topic_clustering(graph, degrees, triangles, coefficients, conn)
+    print ("Clustering stored for " + str(count) + " topics, transitivity " + \
+           str(round(transitivity(degrees, triangles), 4)))
+    return count
+
+#------------------------------------------------------------------------------
+
+# Returns (degree, triangles, clustering) for <topic_name>, or None.
+
+def find_topic_clustering(topic_name, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT tc.degree, tc.triangles, tc.clustering " + \
+                    "FROM " + TOPIC_CLUSTERING_TABLE + " as tc " + \
+                    "JOIN " + VERTICES_TABLE + " as wv ON wv.id = tc.id " + \
+                    "WHERE LOWER(wv.name) = LOWER(%s) ORDER BY wv.id LIMIT 1;",
+                    (topic_name,))
+        rows = cur.fetchall()
+    return rows[0] if rows != [] else None
+
+#------------------------------------------------------------------------------
+
+# The component and community of each topic are stored in wiki_vertices,
+# like the PageRank scores, through a temporary table and a single
+# UPDATE ... FROM.
+
+def ensure_community_columns(conn):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE " + VERTICES_TABLE + \
+                " ADD COLUMN IF NOT EXISTS component integer, " + \
+                "ADD COLUMN IF NOT EXISTS community integer;")
+    cur.execute("CREATE INDEX IF NOT EXISTS wiki_vertices_community ON " + \
+                VERTICES_TABLE + " (community);")
+    conn.commit()
+
+#------------------------------------------------------------------------------
+
+def store_topic_communities(graph, components, communities, conn=None):
+    df = pd.DataFrame({'id' : graph.ids,
+                       'component' : components,
+                       'community' : communities})
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    with wikidb_connection(conn) as conn:
+        ensure_community_columns(conn)
+        cur = conn.cursor()
+        cur.execute("CREATE TEMP TABLE stage_communities (id integer, " + \
+                    "component integer, community integer) ON COMMIT DROP;")
+        cur.copy_expert("COPY stage_communities (id, component, community) " + \
+                        "FROM STDIN WITH (FORMAT csv)", buffer)
+        cur.execute("UPDATE " + VERTICES_TABLE + " as wv " + \
+                    "SET component = sc.component, community = sc.community " + \
+                    "FROM stage_communities as sc WHERE wv.id = sc.id;")
+        count = cur.rowcount
+        conn.commit()
+    return count
+
+#------------------------------------------------------------------------------
+
+# Labels the topics of the current snapshot with their weakly connected
+# component, over all the edges, and their community, over the strongly
+# related edges, and stores both in wiki_vertices.
+
+def update_topics_communities(edge_types=STRONGLY_RELATED,
+                              iterations=DEFAULT_LPA_ITERATIONS, graph=None,
+                              conn=None):
+    if graph is None:
+        graph = get_wiki_graph()
+    components, _ = weakly_connected_components(graph, verbose=True)
+    communities, _ = topic_communities(graph, edge_types, iterations, verbose=True)
+    count = store_topic_communities(graph, components, communities, conn)
+    print ("Communities stored for " + str(count) + " topics")
+    return count
+
+#------------------------------------------------------------------------------
+
+# Returns the names of the topics in the community of <topic_name>, by
+# decreasing weight.
+
+def find_topic_community(topic_name, limit=100, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT wv.name FROM " + VERTICES_TABLE + " as wv " + \
+                    "WHERE wv.community = (SELECT community FROM " + VERTICES_TABLE + \
+                    " WHERE LOWER(name) = LOWER(%s) ORDER BY id LIMIT 1) " + \
+                    "ORDER BY wv.weight DESC, wv.id LIMIT %s;", (topic_name, limit))
+        return [row[0] for row in cur.fetchall()]
+
+#*****************************************************************************
+# Part 6: Benchmarks
+#*****************************************************************************
+
+# Counts the triangles of a synthetic power law graph (see
+# graph.make_random_wiki_graph) with 1 to <threads> workers. All the edges
+# are used by default since the strongly related ones are a small fraction.
+
+def benchmark_triangles(vertex_count=1000000, edge_count=10000000, threads=4,
+                        edge_types=None, seed=0):
+    start = time.perf_counter()
+    graph = make_random_wiki_graph(vertex_count, edge_count, seed=seed)
+    print ("Synthetic graph: " + str(graph.vertex_count()) + " vertices, " + \
+           str(graph.edge_count()) + " edges in " + \
+           str(round(time.perf_counter() - start, 2)) + "s")
+    start = time.perf_counter()
+    offsets, neighbors = undirected_adjacency(graph, edge_types)
+    counter = TriangleCounter(offsets, neighbors)
+    prepare_s = time.perf_counter() - start
+    print ("Prepared " + str(len(neighbors) // 2) + " undirected edges, " + \
+           str(counter.wedge_count) + " wedges in " + str(round(prepare_s, 2)) + "s")
+    results = {'edges' : len(neighbors) // 2,
+               'wedges' : counter.wedge_count,
+               'prepare_s' : prepare_s}
+    workers = 1
+    while workers <= threads:
+        start = time.perf_counter()
+        _, total = counter.count(workers)
+        elapsed = time.perf_counter() - start
+        results['count_s_' + str(workers)] = elapsed
+        results['triangles'] = total
+        print ("Threads " + str(workers) + ": " + str(total) + " triangles in " + \
+               str(round(elapsed, 2)) + "s, " + \
+               str(round(counter.wedge_count / elapsed / 1e6, 1)) + "M wedges/s")
+        workers *= 2
+    return results
+
+#------------------------------------------------------------------------------
+
+# Labels the components and the communities of a synthetic power law graph
+# whose edges are all strongly related.
+
+def benchmark_communities(vertex_count=1000000, edge_count=10000000, seed=0):
+    graph = make_random_wiki_graph(vertex_count, edge_count, reciprocal=1.0,
+                                   seed=seed)
+    print ("Synthetic graph: " + str(graph.vertex_count()) + " vertices, " + \
+           str(graph.edge_count()) + " edges")
+    start = time.perf_counter()
+    _, component_sizes = weakly_connected_components(graph, verbose=True)
+    components_s = time.perf_counter() - start
+    start = time.perf_counter()
+    _, community_sizes = topic_communities(graph, verbose=True)
+    communities_s = time.perf_counter() - start
+    return {'components' : len(component_sizes),
+            'components_s' : components_s,
+            'communities' : int((community_sizes > 1).sum()),
+            'largest_community' : int(community_sizes[0]),
+            'communities_s' : communities_s}
+
+#*****************************************************************************
+# Part 7: Main Runtime
+#*****************************************************************************
+
+# Computes and stores the triangle counts and clustering coefficients or the
+# components and communities, or runs the benchmarks:
+#
+#   python -m src.communities triangles [<threads>]
+#   python -m src.communities communities [<iterations>]
+#   python -m src.communities benchmark [<vertices> <edges> <threads>]
+
+def main():
+    args = sys.argv
+    if len(args) >= 2 and args[1] == 'triangles':
+        threads = int(args[2]) if len(args) > 2 else 1
+        update_topics_clustering(threads=threads)
+        return True
+    elif len(args) >= 2 and args[1] == 'communities':
+        iterations = int(args[2]) if len(args) > 2 else DEFAULT_LPA_ITERATIONS
+        update_topics_communities(iterations=iterations)
+        return True
+    elif len(args) >= 2 and args[1] == 'benchmark':
+        sizes = [int(x) for x in args[2:5]]
+        benchmark_triangles(*sizes)
+        benchmark_communities(*sizes[:2])
+        return True
+    else:
+        print ("Usage: python -m src.communities triangles [<threads>]\n" + \
+               "       python -m src.communities communities [<iterations>]\n" + \
+               "       python -m src.communities benchmark [<vertices> <edges> <threads>]")
+        return False
+
+#------------------------------------------------------------------------------
+
+if __name__== "__main__":
+  main()
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -39,19 +39,31 @@
 #*****************************************************************************
 
 
+import io
+import os
 import sys
+import csv
+import time
 import psycopg2
 import string
 import pprint
+import weakref
+import itertools
+import threading
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from  urllib.parse import unquote
+from contextlib import contextmanager
 
+from psycopg2 import errors
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 from functools import reduce
-from multiprocessing import Process, Manager, freeze_support
 
 # Project Imports
-import src.processes as pr
+from src.caches import LRUCache, MISSING
+from src.caches import BloomFilter, Int64HashSet
 
 #******************************************************************************
 # Part 0: DB Connection and generic functions
@@ -77,47 +89,375 @@ RHOST = '35.189.76.240'
 #                                 " password='Terrapin1' host='" + LHOST + "'")
 #     return conn
 
+WIKIDB_DSN = "dbname='wikidb' user='postgres'" + \
+             " password='Terrapin1' host='" + LHOST + "'"
+
 def wikidb_connect():
-    conn = psycopg2.connect("dbname='wikidb' user='postgres'" + \
-                            " password='Terrapin1' host='" + LHOST + "'")
+    conn = psycopg2.connect(WIKIDB_DSN)
     return conn
 
 #------------------------------------------------------------------------------
 
+# NB: This opens a new unpooled connection which the caller must close.
+# Functions in this module use wikidb_connection() below instead.
+
 def ensure_connection(conn=None):
     if conn == None:
         conn = wikidb_connect()
     return(conn)
 
+#------------------------------------------------------------------------------
+# Connection Pool
+#------------------------------------------------------------------------------
+
+# A process-wide pool of connections to wikidb. A checkout blocks for up to
+# POOL_TIMEOUT seconds when all POOL_MAX_SIZE connections are in use. A
+# connection that has been idle longer than POOL_HEALTH_CHECK_INTERVAL
+# seconds is pinged before being handed out and replaced if it is dead.
+# The sizes can be set with the WIKIDB_POOL_MIN_SIZE and WIKIDB_POOL_MAX_SIZE
+# environment variables or with configure_pool().
+
+POOL_MIN_SIZE = int(os.environ.get('WIKIDB_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.environ.get('WIKIDB_POOL_MAX_SIZE', 10))
+POOL_TIMEOUT = 30.0
+POOL_HEALTH_CHECK_INTERVAL = 60.0
+
+class WikiDBPool:
+
+    def __init__(self, minconn=POOL_MIN_SIZE, maxconn=POOL_MAX_SIZE,
+                 dsn=WIKIDB_DSN, timeout=POOL_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: min=" + str(minconn) + \
+                             ", max=" + str(maxconn))
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+        self.closed = False
+        self.lock = threading.Condition()
+        # Idle connections as (conn, last_used) pairs.
+        self.idle = []
+        self.in_use = 0
+        # Counters used to size the pool.
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.connections_created = 0
+        self.health_check_failures = 0
+        for i in range(minconn):
+            self.idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        self.connections_created += 1
+        return conn
+
+    # Returns a usable connection, pinging it first if it has been idle
+    # for too long.
+    def _ensure_healthy(self, entry):
+        if entry is None:
+            return self._connect()
+        conn, last_used = entry
+        if conn.closed:
+            self.health_check_failures += 1
+            return self._connect()
+        if time.monotonic() - last_used > self.health_check_interval:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1;")
+                cur.close()
+                conn.rollback()
+            except Exception:
+                self.health_check_failures += 1
+                self._discard(conn)
+                return self._connect()
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        start = time.perf_counter()
+        with self.lock:
+            if self.closed:
+                raise PoolError("connection pool is closed")
+            waited = False
+            while not self.idle and self.in_use >= self.maxconn:
+                waited = True
+                remaining = None
+                if self.timeout is not None:
+                    remaining = self.timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        raise PoolError("connection pool exhausted")
+                self.lock.wait(remaining)
+            entry = self.idle.pop() if self.idle else None
+            self.in_use += 1
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+            self.wait_time += elapsed
+            self.max_wait_time = max(self.max_wait_time, elapsed)
+        try:
+            return self._ensure_healthy(entry)
+        except Exception:
+            with self.lock:
+                self.in_use -= 1
+                self.lock.notify()
+            raise
+
+    # Connections are returned with no transaction open. Uncommitted work
+    # is rolled back.
+    def putconn(self, conn):
+        keep = False
+        if not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn)
+            else:
+                if status != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        self._discard(conn)
+                keep = not conn.closed
+        with self.lock:
+            self.in_use -= 1
+            if keep and not self.closed and len(self.idle) < self.maxconn:
+                self.idle.append((conn, time.monotonic()))
+            elif keep:
+                self._discard(conn)
+            self.lock.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self.lock:
+            self.closed = True
+            for conn, last_used in self.idle:
+                self._discard(conn)
+            self.idle = []
+            self.lock.notify_all()
+
+    def stats(self):
+        with self.lock:
+            return {'min_size' : self.minconn,
+                    'max_size' : self.maxconn,
+                    'idle' : len(self.idle),
+                    'in_use' : self.in_use,
+                    'checkouts' : self.checkouts,
+                    'waits' : self.waits,
+                    'total_wait_time' : self.wait_time,
+                    'mean_wait_time' : self.wait_time / self.checkouts \
+                                       if self.checkouts > 0 else 0.0,
+                    'max_wait_time' : self.max_wait_time,
+                    'connections_created' : self.connections_created,
+                    'health_check_failures' : self.health_check_failures}
+
+#------------------------------------------------------------------------------
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+# A forked child (e.g. a multiprocessing worker) never reuses its parent's
+# sockets, it gets a pool of its own. The pool inherited from the parent is
+# kept here and never closed: if its connections were garbage collected,
+# libpq would terminate the sessions the parent is still using.
+
+_INHERITED_POOLS = []
+
+def release_inherited_pool():
+    global _POOL
+    if _POOL is not None and _POOL.pid != os.getpid():
+        _INHERITED_POOLS.append(_POOL)
+        _POOL = None
+
+#------------------------------------------------------------------------------
+
+# Returns the pool of the current process, creating it on first use.
+
+def get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        release_inherited_pool()
+        if _POOL is None or _POOL.closed:
+            _POOL = WikiDBPool()
+        return _POOL
+
+#------------------------------------------------------------------------------
+
+def configure_pool(minconn=POOL_MIN_SIZE, maxconn=POOL_MAX_SIZE, **kwargs):
+    global _POOL
+    with _POOL_LOCK:
+        release_inherited_pool()
+        if _POOL is not None:
+            _POOL.closeall()
+        _POOL = WikiDBPool(minconn, maxconn, **kwargs)
+        return _POOL
+
+#------------------------------------------------------------------------------
+
+def close_pool():
+    global _POOL
+    with _POOL_LOCK:
+        release_inherited_pool()
+        if _POOL is not None:
+            _POOL.closeall()
+        _POOL = None
+
+#------------------------------------------------------------------------------
+
+def pool_stats():
+    return get_pool().stats()
+
+#------------------------------------------------------------------------------
+
+# Yields <conn> unchanged when the caller supplied one, otherwise checks
+# a connection out of the pool for the duration of the block.
+
+@contextmanager
+def wikidb_connection(conn=None):
+    if conn is not None:
+        yield conn
+    else:
+        with get_pool().connection() as pooled_conn:
+            yield pooled_conn
+
 #------------------------------------------------------------------------------
 
 def execute_query(query, data=(), conn=None):
-    conn = conn if conn != None else ensure_connection()
-    cur = conn.cursor()
-    cur.execute(query, data)
-    conn.commit()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute(query, data)
+        conn.commit()
+
+#------------------------------------------------------------------------------
+# Streaming Queries
+#------------------------------------------------------------------------------
+
+# Full table scans go through a named (server side) cursor so that only
+# <itersize> rows at a time are held in memory. The cursor lives in the
+# connection's current transaction: a job that commits or rolls back while
+# iterating must scan on a connection of its own.
+
+SCAN_ITERSIZE = int(os.environ.get('WIKIDB_SCAN_ITERSIZE', 10000))
+
+_SCAN_COUNTER = itertools.count()
+
+def iter_query(query, data=None, itersize=SCAN_ITERSIZE, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor(name='wikidb_scan_' + str(next(_SCAN_COUNTER)))
+        cur.itersize = itersize
+        try:
+            cur.execute(query, data)
+            for row in cur:
+                yield row
+        finally:
+            # The cursor is already gone if its transaction has ended.
+            try:
+                cur.close()
+            except psycopg2.Error:
+                pass
 
 # -----------------------------------------------------------------------------
 
 def run_query(query, data=(), conn=None):
-    conn = conn if conn != None else ensure_connection()
-    cur = conn.cursor()
-    cur.execute(query, data)
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute(query, data)
+        rows = cur.fetchall()
     return rows
 
 # -----------------------------------------------------------------------------
 
-def get_table_columns(table):
-    conn = ensure_connection()
-    cur = conn.cursor()
-    query = "SELECT * FROM information_schema.columns " + \
-             "WHERE table_name = '" + table + "';"
-    cur.execute(query)
-    rows = cur.fetchall()
+#------------------------------------------------------------------------------
+# Prepared Statements
+#------------------------------------------------------------------------------
+
+# All queries pass their values as bind parameters. The hot lookups are
+# also run as server side prepared statements, so that Postgres parses and
+# plans them once per connection rather than on every call. Statements are
+# written with $1, $2... parameters and are prepared on a connection the
+# first time they are executed on it.
+
+_PREPARED = weakref.WeakKeyDictionary()
+_STATEMENT_COUNTER = itertools.count()
+
+#------------------------------------------------------------------------------
+
+def prepare_statement(cur, name, query):
+    statement = name + "_" + str(next(_STATEMENT_COUNTER))
+    cur.execute("PREPARE " + statement + " AS " + query + ";")
+    _PREPARED.setdefault(cur.connection, {})[name] = statement
+    return statement
+
+#------------------------------------------------------------------------------
+
+def execute_statement(cur, statement, params):
+    if len(params) > 0:
+        cur.execute("EXECUTE " + statement + " (" + \
+                    ", ".join(["%s"] * len(params)) + ");", params)
+    else:
+        cur.execute("EXECUTE " + statement + ";")
+
+#------------------------------------------------------------------------------
+
+# Executes <query> as the prepared statement <name> on the cursor's
+# connection. When a table was altered in a way that changes the result
+# type of a prepared statement, Postgres refuses to execute it; it is then
+# prepared again, provided no transaction was open that the failure would
+# have aborted.
+
+def execute_prepared(cur, name, query, params=()):
+    conn = cur.connection
+    idle_p = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    statement = _PREPARED.get(conn, {}).get(name)
+    if statement is None:
+        statement = prepare_statement(cur, name, query)
+    try:
+        execute_statement(cur, statement, params)
+    except errors.FeatureNotSupported:
+        del _PREPARED[conn][name]
+        if not idle_p:
+            raise
+        conn.rollback()
+        statement = prepare_statement(cur, name, query)
+        execute_statement(cur, statement, params)
+
+#------------------------------------------------------------------------------
+
+def run_prepared(name, query, params=(), conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, name, query, params)
+        rows = cur.fetchall()
+    return rows
+
+# -----------------------------------------------------------------------------
+
+def get_table_columns(table, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        query = "SELECT * FROM information_schema.columns " + \
+                 "WHERE table_name = %s;"
+        cur.execute(query, (table,))
+        rows = cur.fetchall()
     rows = [x[3] for x in rows]
     return rows
-    
+
 # -----------------------------------------------------------------------------
 # Count Table Rows
 # -----------------------------------------------------------------------------
@@ -125,10 +465,10 @@ def get_table_columns(table):
 # This returns as exact count (slow)
 
 def count_table_rows(table_name,conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT count(*) FROM " + table_name + ";")
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT count(*) FROM " + table_name + ";")
+        rows = cur.fetchall()
     return rows[0][0]
 
 #------------------------------------------------------------------------------
@@ -136,11 +476,11 @@ def count_table_rows(table_name,conn=None):
 # This retuns a close estimate (extremely fast):
 
 def estimate_table_rows(table,conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    query = "SELECT reltuples::bigint AS estimate FROM pg_class where relname=" + table + ";"
-    cur.execute(query)
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        query = "SELECT reltuples::bigint AS estimate FROM pg_class where relname=%s;"
+        cur.execute(query, (table,))
+        rows = cur.fetchall()
     return rows[0][0]
 
 #------------------------------------------------------------------------------
@@ -263,9 +603,9 @@ def create_root_vertices_table_indexes(conn):
 #------------------------------------------------------------------------------
     
 def create_root_vertices_tables(conn=None):
-    conn = ensure_connection(conn)
-    create_root_vertices_table(conn)
-    create_root_vertices_table_indexes(conn)
+    with wikidb_connection(conn) as conn:
+        create_root_vertices_table(conn)
+        create_root_vertices_table_indexes(conn)
 
 #------------------------------------------------------------------------------
 # Add Root Vertex
@@ -274,32 +614,32 @@ def create_root_vertices_tables(conn=None):
 root_fields = "(id, name, weight, outdegree)"
     
 def add_root_vertex(row, conn=None, commit=False):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    query = "INSERT INTO " + ROOT_TOPICS_TABLE + " " + root_fields + \
-           " VALUES " + row_to_str(row) + ";"
-    try:
-        cur.execute(query)
-        if commit == True:
-            conn.commit()
-    except Exception as err:
-        print ("Error: " + str(err))
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        query = "INSERT INTO " + ROOT_TOPICS_TABLE + " " + root_fields + \
+               " VALUES (%s, %s, %s, %s);"
+        try:
+            cur.execute(query, row)
+            if commit == True:
+                conn.commit()
+        except Exception as err:
+            print ("Error: " + str(err))
        
 #------------------------------------------------------------------------------
 # Count Root Vertices
 #------------------------------------------------------------------------------
 
 def count_root_vertices(conn=None):
-    return count_table_rows(ROOT_TOPICS_TABLE)
+    return count_table_rows(ROOT_TOPICS_TABLE, conn=conn)
 
 #------------------------------------------------------------------------------
 # Dumpings Tables as CSVs
 #------------------------------------------------------------------------------
     
 def save_vertex_table (pathname, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("copy (SELECT * FROM wiki_vertices) to " + "'" + pathname + "'  with csv")
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("copy (SELECT * FROM wiki_vertices) to %s with csv", (pathname,))
 
 #------------------------------------------------------------------------------
 
@@ -310,22 +650,84 @@ def save_edge_tables(directory, conn=None):
 # Wiki DB Edge Tables Creation
 #------------------------------------------------------------------------------
 
-def edge_table_name(letter):
-    if letter in edge_tables_suffixes():
+# The edges are stored in one of two layouts:
+#
+# 1. Letter tables (the default): one wiki_edges_<letter> table per
+#    source_name_letter() of the source name.
+#
+# 2. Hash partitions: a single wiki_edges table, partitioned by HASH (source)
+#    into EDGE_PARTITIONS tables named wiki_edges_p<i>. Postgres routes
+#    inserts and prunes the partitions of queries on source, so every edge
+#    lookup goes to EDGES_TABLE. Unlike the letter tables the partitions
+#    are of about equal size, so scans split evenly across workers.
+#
+# The hash layout is used when EDGE_PARTITIONS > 0, which is set with the
+# WIKIDB_EDGE_PARTITIONS environment variable or configure_edge_partitions().
+# migrate_edge_tables() converts a database from the letter layout.
+
+EDGES_TABLE = 'wiki_edges'
+EDGE_PARTITIONS = int(os.environ.get('WIKIDB_EDGE_PARTITIONS', 0))
+DEFAULT_EDGE_PARTITIONS = 32
+
+def hash_partitioned_p():
+    return EDGE_PARTITIONS > 0
+
+#------------------------------------------------------------------------------
+
+def letter_edge_table_name(letter):
+    if letter in EDGE_SUFFIXES:
         return edge_table_prefix + letter
     else:
         return edge_table_prefix + '0'
 
 #------------------------------------------------------------------------------
 
-def edge_tables (suffixes=edge_tables_suffixes()):
-    return [edge_table_name(x) for x in suffixes]
+# The table holding the edges whose source name starts with <letter>.
+
+def edge_table_name(letter):
+    if hash_partitioned_p():
+        return EDGES_TABLE
+    else:
+        return letter_edge_table_name(letter)
+
+#------------------------------------------------------------------------------
+
+# The tables to query to get all the edges.
+
+def edge_tables (suffixes=EDGE_SUFFIXES):
+    if hash_partitioned_p():
+        return [EDGES_TABLE]
+    else:
+        return [letter_edge_table_name(x) for x in suffixes]
+
+#------------------------------------------------------------------------------
+
+# The tables physically holding the edges, for jobs that split their work
+# by table.
+
+def edge_partition_name(index):
+    return edge_table_prefix + 'p' + str(index)
+
+def edge_partitions():
+    if hash_partitioned_p():
+        return [edge_partition_name(i) for i in range(EDGE_PARTITIONS)]
+    else:
+        return edge_tables()
+
+#------------------------------------------------------------------------------
+
+def configure_edge_partitions(partitions):
+    global EDGE_PARTITIONS
+    if partitions < 0:
+        raise ValueError("Invalid edge partition count: " + str(partitions))
+    EDGE_PARTITIONS = partitions
+    clear_topic_caches()
 
 #------------------------------------------------------------------------------
 
 def create_edge_table_str (letter):
     return "CREATE TABLE " + \
-        edge_table_name(letter) + \
+        letter_edge_table_name(letter) + \
         "(id serial NOT NULL, " + \
         "source integer NOT NULL," + \
         "target integer NOT NULL, " + \
@@ -337,10 +739,70 @@ def create_edge_table_str (letter):
 
 def create_edge_table(conn, letter):
     cur = conn.cursor()
-    cur.execute("DROP TABLE IF EXISTS " + edge_table_name(letter) + ";")
+    cur.execute("DROP TABLE IF EXISTS " + letter_edge_table_name(letter) + ";")
     cur.execute(create_edge_table_str(letter))
-    cur.execute("CREATE INDEX ON " + edge_table_name(letter) + " (source);")
-    cur.execute("CREATE INDEX ON " + edge_table_name(letter) + " (target);")
+    create_edge_table_indexes(conn, letter)
+
+#------------------------------------------------------------------------------
+
+# The (source, target) index serves both the lookups by source and the
+# existence checks on an edge.
+
+def create_edge_table_indexes(conn, letter):
+    cur = conn.cursor()
+    edge_table = letter_edge_table_name(letter)
+    cur.execute("CREATE INDEX IF NOT EXISTS " + edge_table + "_source_target_idx ON " + \
+                edge_table + " (source, target);")
+    cur.execute("CREATE INDEX IF NOT EXISTS " + edge_table + "_target_idx ON " + \
+                edge_table + " (target);")
+
+#------------------------------------------------------------------------------
+
+# Adds the (source, target) index to edge tables created before it existed.
+
+def update_edge_table_indexes(conn=None):
+    with wikidb_connection(conn) as conn:
+        if hash_partitioned_p():
+            create_partitioned_edge_table_indexes(conn)
+            conn.commit()
+        else:
+            for letter in edge_tables_suffixes():
+                create_edge_table_indexes(conn, letter)
+                conn.commit()
+
+#------------------------------------------------------------------------------
+
+# Hash partitioned layout. The primary key has to include the partition
+# key, hence (source, id).
+
+create_partitioned_edge_table_str = "CREATE TABLE " + EDGES_TABLE + \
+                                    " (id serial NOT NULL, " + \
+                                    "source integer NOT NULL, " + \
+                                    "target integer NOT NULL, " + \
+                                    "type character varying, " + \
+                                    "weight integer DEFAULT 0, " + \
+                                    "CONSTRAINT edge_id PRIMARY KEY (source, id)) " + \
+                                    "PARTITION BY HASH (source);"
+
+def create_partitioned_edge_table(conn, partitions):
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS " + EDGES_TABLE + ";")
+    cur.execute(create_partitioned_edge_table_str)
+    for i in range(partitions):
+        cur.execute("CREATE TABLE " + edge_partition_name(i) + \
+                    " PARTITION OF " + EDGES_TABLE + \
+                    " FOR VALUES WITH (MODULUS %s, REMAINDER %s);", (partitions, i))
+
+#------------------------------------------------------------------------------
+
+# Indexes created on the parent table are created on every partition.
+
+def create_partitioned_edge_table_indexes(conn):
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX IF NOT EXISTS " + EDGES_TABLE + "_source_target_idx ON " + \
+                EDGES_TABLE + " (source, target);")
+    cur.execute("CREATE INDEX IF NOT EXISTS " + EDGES_TABLE + "_target_idx ON " + \
+                EDGES_TABLE + " (target);")
 
 #------------------------------------------------------------------------------
 
@@ -353,24 +815,130 @@ def create_edge_table(conn, letter):
 def create_edge_tables(conn):
     cur = conn.cursor()
     print ("Creating Wikipedia Edge Tables...")
-    for letter in edge_tables_suffixes():
-        create_edge_table(conn,letter)
+    if hash_partitioned_p():
+        create_partitioned_edge_table(conn, EDGE_PARTITIONS)
+        create_partitioned_edge_table_indexes(conn)
+        conn.commit()
+    else:
+        for letter in edge_tables_suffixes():
+            create_edge_table(conn,letter)
+            conn.commit()
+
+#------------------------------------------------------------------------------
+# Migrating to Hash Partitioned Edges
+#------------------------------------------------------------------------------
+
+# Copies the edges of the wiki_edges_<letter> tables into a new wiki_edges
+# table hash partitioned on source into <partitions> tables, then switches
+# this process to the hash layout. The edges get new ids since the ids of the
+# letter tables overlap. Each letter table is copied in its own transaction
+# and the indexes are built once all the rows are in. The letter tables are
+# kept unless <drop_p> is true.
+#
+# Other processes keep using the letter tables until they are started with
+# WIKIDB_EDGE_PARTITIONS=<partitions>.
+
+def migrate_edge_tables(partitions=DEFAULT_EDGE_PARTITIONS, drop_p=False, conn=None):
+    if partitions < 1:
+        raise ValueError("Invalid edge partition count: " + str(partitions))
+    start = time.perf_counter()
+    letter_tables = [letter_edge_table_name(x) for x in EDGE_SUFFIXES]
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        print ("Creating " + EDGES_TABLE + " with " + str(partitions) + " hash partitions...")
+        create_partitioned_edge_table(conn, partitions)
         conn.commit()
+        total = 0
+        for edge_table in letter_tables:
+            if table_exists_p(edge_table, conn):
+                cur.execute("INSERT INTO " + EDGES_TABLE + " (source, target, type, weight) " + \
+                            "SELECT source, target, type, weight FROM " + edge_table + ";")
+                total += cur.rowcount
+                conn.commit()
+                print ("Copied " + str(cur.rowcount) + " edges from " + edge_table)
+        print ("Creating indexes...")
+        create_partitioned_edge_table_indexes(conn)
+        cur.execute("ANALYZE " + EDGES_TABLE + ";")
+        conn.commit()
+        if drop_p:
+            for edge_table in letter_tables:
+                cur.execute("DROP TABLE IF EXISTS " + edge_table + ";")
+            conn.commit()
+    configure_edge_partitions(partitions)
+    print ("Migrated " + str(total) + " edges in " + \
+           str(round(time.perf_counter() - start, 2)) + "s. " + \
+           "Set WIKIDB_EDGE_PARTITIONS=" + str(partitions) + " to use them.")
+    return total
+
+#------------------------------------------------------------------------------
+
+# The number of edges in each partition, to check the balance.
+
+def edge_partition_sizes(conn=None):
+    with wikidb_connection(conn) as conn:
+        return {x : count_table_rows(x, conn=conn) for x in edge_partitions()}
     
+#------------------------------------------------------------------------------
+# Wiki DB Reverse Edge Table Creation
+#------------------------------------------------------------------------------
+
+# The edge tables are partitioned by source, so finding the in-neighbors of
+# a topic means querying every one of them. The reverse edge table mirrors
+# all the edges keyed by (target, source), which makes an in-neighbor lookup
+# a single index range scan. It is kept up to date by add_wiki_edge() and
+# can be rebuilt from the edge tables with rebuild_reverse_edges().
+
+REVERSE_EDGES_TABLE = 'wiki_reverse_edges'
+
+create_reverse_edges_str = "CREATE TABLE " + REVERSE_EDGES_TABLE + \
+                           " (target integer NOT NULL, " + \
+                           "source integer NOT NULL, " + \
+                           "type character varying, " + \
+                           "CONSTRAINT reverse_edge_id PRIMARY KEY (target, source));"
+
+#------------------------------------------------------------------------------
+
+def create_reverse_edges_table(conn):
+    global _REVERSE_EDGES_P
+    cur = conn.cursor()
+    print ("Creating Wikipedia Reverse Edges Table...")
+    cur.execute("DROP TABLE IF EXISTS " + REVERSE_EDGES_TABLE + ";")
+    cur.execute(create_reverse_edges_str)
+    conn.commit()
+    _REVERSE_EDGES_P = True
+
+#------------------------------------------------------------------------------
+
+# Whether the reverse edge table exists. This is checked once per process.
+
+_REVERSE_EDGES_P = None
+
+def reverse_edges_p(conn=None):
+    global _REVERSE_EDGES_P
+    if _REVERSE_EDGES_P is None:
+        with wikidb_connection(conn) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT to_regclass(%s);", (REVERSE_EDGES_TABLE,))
+            _REVERSE_EDGES_P = cur.fetchone()[0] is not None
+    return _REVERSE_EDGES_P
+
 #------------------------------------------------------------------------------
 # Crete WikiDb Tables
 #------------------------------------------------------------------------------
 
 def create_wiki_db_graph_tables():
-    conn = wikidb_connect()
-    # Vertices
-    create_vertices_table(conn)
-    create_vertices_table_indexes(conn)
-    conn.commit()
-    # Root Verticees
-    create_root_vertices()
-    # Edges
-    create_edge_tables(conn)
+    with wikidb_connection() as conn:
+        # Vertices
+        create_vertices_table(conn)
+        create_vertices_table_indexes(conn)
+        conn.commit()
+        # Root Verticees
+        create_root_vertices_tables(conn)
+        # Edges
+        create_edge_tables(conn)
+        create_reverse_edges_table(conn)
+    clear_topic_caches()
+    clear_edge_index()
     return True
 
 
@@ -384,52 +952,184 @@ def create_wiki_db_graph_tables():
 # Vertex Table Retrieval Operations
 #------------------------------------------------------------------------------
 
+VERTEX_BY_ID_QUERY = "SELECT * FROM " + VERTICES_TABLE + " WHERE id=$1"
+VERTEX_BY_NAME_QUERY = "SELECT * FROM " + VERTICES_TABLE + \
+                       " WHERE LOWER(name)=LOWER($1)"
+
+#------------------------------------------------------------------------------
+
 def get_wiki_vertex(vertex_id, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + VERTICES_TABLE + " WHERE id=" + str(vertex_id) + ";")
-    rows = cur.fetchall()
+    rows = run_prepared('vertex_by_id', VERTEX_BY_ID_QUERY, (vertex_id,), conn)
     return rows[0] if rows != [] else None
 
 #------------------------------------------------------------------------------
 
 def find_topic(vertex_name, conn=None):
-    if "'" in vertex_name:
-        return None
-    else:
-        conn = ensure_connection(conn)
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM " + VERTICES_TABLE + " " + \
-                    "WHERE LOWER(name)=LOWER('" + vertex_name + "');")
-        rows = cur.fetchall()
-        return rows[0] if rows != [] else None
+    rows = run_prepared('vertex_by_name', VERTEX_BY_NAME_QUERY, (vertex_name,), conn)
+    return rows[0] if rows != [] else None
 
 #------------------------------------------------------------------------------
 
 def find_topic_by_id(id, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + VERTICES_TABLE + " " + \
-                "WHERE id=" + str(id) + ";")
-    rows = cur.fetchall()
-    return rows[0] if rows != [] else None
+    return get_wiki_vertex(id, conn)
 
 #------------------------------------------------------------------------------
     
-def find_topic_id(topic_name, conn=None):
-    topic = find_topic(topic_name)
-    if topic is not None:
-        return topic[0]
+#------------------------------------------------------------------------------
+# Topic Id Cache
+#------------------------------------------------------------------------------
+
+# Topic names are resolved to ids many times per logical operation, so the
+# name->id and id->name mappings are cached per process. Unknown names are
+# cached too, but only for NEGATIVE_CACHE_TTL seconds since another process
+# may add them. Names are cached lower cased, as they are matched.
+
+TOPIC_ID_CACHE_SIZE = 200000
+NEGATIVE_CACHE_TTL = 60
+
+TOPIC_ID_CACHE = LRUCache(TOPIC_ID_CACHE_SIZE, name='topic ids')
+TOPIC_NAME_CACHE = LRUCache(TOPIC_ID_CACHE_SIZE, name='topic names')
+
+#------------------------------------------------------------------------------
+
+def cache_topic_id(topic_name, topic_id):
+    if topic_id is None:
+        TOPIC_ID_CACHE.put(topic_name.lower(), None, ttl=NEGATIVE_CACHE_TTL)
     else:
+        TOPIC_ID_CACHE.put(topic_name.lower(), topic_id)
+
+#------------------------------------------------------------------------------
+
+def invalidate_topic_id(topic_name):
+    TOPIC_ID_CACHE.invalidate(topic_name.lower())
+
+#------------------------------------------------------------------------------
+
+def clear_topic_caches():
+    TOPIC_ID_CACHE.clear()
+    TOPIC_NAME_CACHE.clear()
+    clear_neighbor_caches()
+
+#------------------------------------------------------------------------------
+
+def topic_cache_stats():
+    return {'ids' : TOPIC_ID_CACHE.stats(),
+            'names' : TOPIC_NAME_CACHE.stats(),
+            'out_neighbors' : OUT_NEIGHBOR_CACHE.stats(),
+            'in_neighbors' : IN_NEIGHBOR_CACHE.stats(),
+            'strongly_related' : STRONGLY_RELATED_CACHE.stats()}
+
+#------------------------------------------------------------------------------
+# Neighbor Cache
+#------------------------------------------------------------------------------
+
+# The out neighbors, in neighbors and strongly related topics of a topic are
+# cached as sorted int32 arrays of vertex ids, keyed by the topic's id, and
+# turned back into names with the topic name cache. Each cache holds at most
+# NEIGHBOR_CACHE_SIZE topics and NEIGHBOR_CACHE_MB megabytes of ids, which
+# can be set with the WIKIDB_NEIGHBOR_CACHE_SIZE and WIKIDB_NEIGHBOR_CACHE_MB
+# environment variables.
+#
+# Adding or deleting an edge through this module invalidates the entries of
+# both its endpoints. Changes made by other processes are seen once the
+# entries expire, after NEIGHBOR_CACHE_TTL seconds.
+
+NEIGHBOR_CACHE_SIZE = int(os.environ.get('WIKIDB_NEIGHBOR_CACHE_SIZE', 50000))
+NEIGHBOR_CACHE_MB = int(os.environ.get('WIKIDB_NEIGHBOR_CACHE_MB', 256))
+NEIGHBOR_CACHE_TTL = 600
+
+def make_neighbor_cache(name):
+    return LRUCache(NEIGHBOR_CACHE_SIZE, NEIGHBOR_CACHE_TTL, name=name,
+                    maxbytes=NEIGHBOR_CACHE_MB * 2**20, sizeof=lambda x: x.nbytes)
+
+OUT_NEIGHBOR_CACHE = make_neighbor_cache('out neighbors')
+IN_NEIGHBOR_CACHE = make_neighbor_cache('in neighbors')
+STRONGLY_RELATED_CACHE = make_neighbor_cache('strongly related')
+
+NEIGHBOR_CACHES = [OUT_NEIGHBOR_CACHE, IN_NEIGHBOR_CACHE, STRONGLY_RELATED_CACHE]
+
+#------------------------------------------------------------------------------
+
+# Returns the neighbor names of <topic_id> held in <cache>, or None.
+
+def cached_neighbor_names(cache, topic_id, conn=None):
+    neighbor_ids = cache.get(topic_id)
+    if neighbor_ids is MISSING:
         return None
+    names = find_vertex_names(neighbor_ids.tolist(), conn)
+    return list(set(names.values()))
+
+#------------------------------------------------------------------------------
+
+# Caches the neighbors of <topic_id> given as (id, name) rows and returns
+# their names.
+
+def cache_neighbor_rows(cache, topic_id, rows):
+    for vertex_id, name in rows:
+        TOPIC_NAME_CACHE.put(vertex_id, name)
+    cache.put(topic_id, np.unique(np.array([row[0] for row in rows], dtype=np.int32)))
+    return list(set([row[1] for row in rows]))
+
+#------------------------------------------------------------------------------
+
+def invalidate_topic_neighbors(vertex_ids):
+    for vertex_id in vertex_ids:
+        for cache in NEIGHBOR_CACHES:
+            cache.invalidate(int(vertex_id))
+
+#------------------------------------------------------------------------------
+
+def clear_neighbor_caches():
+    for cache in NEIGHBOR_CACHES:
+        cache.clear()
+
+#------------------------------------------------------------------------------
     
+def find_topic_id(topic_name, conn=None):
+    topic_id = TOPIC_ID_CACHE.get(topic_name.lower())
+    if topic_id is not MISSING:
+        return topic_id
+    topic = find_topic(topic_name, conn)
+    topic_id = topic[0] if topic is not None else None
+    cache_topic_id(topic_name, topic_id)
+    return topic_id
+
+#------------------------------------------------------------------------------
+
+# Returns a dictionary mapping each of <topic_names> to its id, or None.
+# Uncached names are resolved with a single query.
+
+def find_topic_ids(topic_names, conn=None):
+    topic_ids = {}
+    unknown = {}
+    for name in topic_names:
+        topic_id = TOPIC_ID_CACHE.get(name.lower())
+        if topic_id is MISSING:
+            unknown.setdefault(name.lower(), []).append(name)
+        else:
+            topic_ids[name] = topic_id
+    if unknown != {}:
+        with wikidb_connection(conn) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT LOWER(name), MIN(id) FROM " + VERTICES_TABLE + \
+                        " WHERE LOWER(name) = ANY(%s) GROUP BY LOWER(name);",
+                        (list(unknown.keys()),))
+            found = dict(cur.fetchall())
+        for key, names in unknown.items():
+            topic_id = found.get(key)
+            cache_topic_id(key, topic_id)
+            for name in names:
+                topic_ids[name] = topic_id
+    return topic_ids
+
 #------------------------------------------------------------------------------
 
 def vertex_id_name(vertex_id,  conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + VERTICES_TABLE + " WHERE id=" + str(vertex_id) + ";")
-    rows = cur.fetchall()
+    name = TOPIC_NAME_CACHE.get(vertex_id)
+    if name is not MISSING:
+        return name
+    rows = run_prepared('vertex_by_id', VERTEX_BY_ID_QUERY, (vertex_id,), conn)
+    TOPIC_NAME_CACHE.put(vertex_id, rows[0][1])
     return rows[0][1]
 
 #------------------------------------------------------------------------------
@@ -444,43 +1144,39 @@ def vertex_row_name(vertex_row):
 # Returns a list of vertex names
 
 def find_topics(vertex_pattern, conn=None):
-    if "'" in vertex_pattern:
-        return None
-    else:
-        conn = ensure_connection(conn)
+    with wikidb_connection(conn) as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM " + VERTICES_TABLE + " " + \
-                    "WHERE LOWER(name) like LOWER('" + vertex_pattern + "');")
+                    "WHERE LOWER(name) like LOWER(%s);", (vertex_pattern,))
         rows = cur.fetchall()
-        return  rows
+    return  rows
 
 #------------------------------------------------------------------------------
 
 def find_potential_subtopics(topic, conn=None):
-    if "'" in topic:
-        return None
-    else:
-        p1 = "%\_" + topic.lower() + "\_%"
-        p2 = "%\_" + topic.lower()
-        p3 = topic.lower() + "\_%"
-        conn = ensure_connection(conn)
+    p1 = "%\_" + topic.lower() + "\_%"
+    p2 = "%\_" + topic.lower()
+    p3 = topic.lower() + "\_%"
+    with wikidb_connection(conn) as conn:
         cur = conn.cursor()
         query = "SELECT * FROM " + VERTICES_TABLE + " " + \
-                "WHERE LOWER(name) like '" + p1 + "' " + \
-                "OR LOWER(name) like '" + p2 + "' " + \
-                "OR LOWER(name) like '" + p3 + "'; "
-        cur.execute(query)
+                "WHERE LOWER(name) like %s " + \
+                "OR LOWER(name) like %s " + \
+                "OR LOWER(name) like %s; "
+        cur.execute(query, (p1, p2, p3))
         rows = cur.fetchall()
-        return  rows
+    return  rows
 
 #------------------------------------------------------------------------------
 
-def find_all_topics ():
-    conn = ensure_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + VERTICES_TABLE + ";")
-    rows = cur.fetchall()
-    return  rows
+def iter_all_topics (itersize=SCAN_ITERSIZE, conn=None):
+    return iter_query("SELECT * FROM " + VERTICES_TABLE + ";",
+                      itersize=itersize, conn=conn)
+
+#------------------------------------------------------------------------------
+
+def find_all_topics (conn=None):
+    return list(iter_all_topics(conn=conn))
 
 #------------------------------------------------------------------------------
     
@@ -509,50 +1205,49 @@ def root_vertex_name_p (vertex_name):
 # Identifies root vertices in  vertices table for specified pattern
 
 def identify_root_vertices (pattern, conn=None):
-    conn = ensure_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + VERTICES_TABLE + " as wv " + \
-                "WHERE wv.name NOT SIMILAR TO '%\_%' " + \
-                "AND wv.name NOT SIMILAR TO '%\#%'" + \
-                "AND LOWER(wv.name) like LOWER('" + pattern + "');")
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM " + VERTICES_TABLE + " as wv " + \
+                    "WHERE wv.name NOT SIMILAR TO '%%\_%%' " + \
+                    "AND wv.name NOT SIMILAR TO '%%\#%%'" + \
+                    "AND LOWER(wv.name) like LOWER(%s);", (pattern,))
+        rows = cur.fetchall()
     return rows
     
 #------------------------------------------------------------------------------
 # Root Vertex Table Retrieval Operations
 #------------------------------------------------------------------------------
 
+def iter_root_vertices(itersize=SCAN_ITERSIZE, conn=None):
+    return iter_query("SELECT * FROM " + ROOT_TOPICS_TABLE + ";",
+                      itersize=itersize, conn=conn)
+
+#------------------------------------------------------------------------------
+
 def get_root_vertices(conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + ROOT_TOPICS_TABLE + ";")
-    rows = cur.fetchall()
-    return rows
+    return list(iter_root_vertices(conn=conn))
 
 #------------------------------------------------------------------------------
 
 def find_root_topic(vertex_name, conn=None):
-    if "'" in vertex_name:
-        return None
-    else:
-        conn = ensure_connection(conn)
+    with wikidb_connection(conn) as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM " + ROOT_TOPICS_TABLE + " " + \
-                    "WHERE LOWER(name)=LOWER('" + vertex_name + "');")
+                    "WHERE LOWER(name)=LOWER(%s);", (vertex_name,))
         rows = cur.fetchall()
-        return rows[0] if rows != [] else None
+    return rows[0] if rows != [] else None
 
 #------------------------------------------------------------------------------
 # Find Root Topic
 #------------------------------------------------------------------------------
 
-def find_root_topic_by_name(topic_name):
-    conn = ensure_connection()
-    cur = conn.cursor()
-    query = "SELECT * FROM " + ROOT_TOPICS_TABLE  + \
-            " WHERE LOWER(name)=LOWER('" + topic_name + "');"
-    cur.execute(query)
-    rows = cur.fetchall()
+def find_root_topic_by_name(topic_name, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        query = "SELECT * FROM " + ROOT_TOPICS_TABLE  + \
+                " WHERE LOWER(name)=LOWER(%s);"
+        cur.execute(query, (topic_name,))
+        rows = cur.fetchall()
     if rows != []:
         return rows[0]
     else:
@@ -560,20 +1255,204 @@ def find_root_topic_by_name(topic_name):
 
 #------------------------------------------------------------------------------
 
-def find_related_root_topics (vertex_name):
-    related_topics = find_topic_out_neighbors(vertex_name)
+def find_related_root_topics (vertex_name, conn=None):
+    related_topics = find_topic_out_neighbors(vertex_name, conn)
     return [topic for topic in related_topics if root_vertex_name_p(topic)]
 
+#------------------------------------------------------------------------------
+# Edge Index
+#------------------------------------------------------------------------------
+
+# An in-memory index of the edges, so that checking whether an edge exists
+# needs no query. Edges are keyed by (source_id << 32) | target_id. A Bloom
+# filter rejects most absent edges with a few bit tests; behind it an exact
+# hash set of the keys answers the rest. Without the exact set (exact=False,
+# for a fraction of the memory) edges the filter may contain are checked in
+# the database.
+#
+# The index is off until load_edge_index() is called. It is kept in sync
+# with the edges added by this process; edges added by other processes are
+# not seen until it is reloaded. So an edge missing from the index is only
+# taken to be absent when the index is authoritative, i.e. when this process
+# is the only one writing edges. Edges inserted but not yet committed, and
+# deleted edges, are unsettled: they are always checked in the database.
+
+EDGE_INDEX = None
+
+def edge_key(source_id, target_id):
+    return (int(source_id) << 32) | int(target_id)
+
+def edge_keys(source_ids, target_ids):
+    return (np.asarray(source_ids, dtype=np.int64) << 32) | \
+           np.asarray(target_ids, dtype=np.int64)
+
+#------------------------------------------------------------------------------
+
+class EdgeIndex:
+
+    def __init__(self, capacity, error_rate=0.01, exact=True, authoritative=False):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.keys = Int64HashSet(capacity) if exact else None
+        self.capacity = capacity
+        self.authoritative = authoritative
+        self.lookups = 0
+        self.rejections = 0
+        # Keys can't be removed from the filter or the set.
+        self.unsettled = set()
+
+    # Adds the keys of committed edges.
+    def add(self, keys):
+        self.bloom.add(keys)
+        if self.keys is not None:
+            self.keys.add(keys)
+        if self.unsettled:
+            self.unsettled.difference_update(np.atleast_1d(keys).tolist())
+
+    # Adds the keys of edges inserted by a transaction still open.
+    def add_pending(self, keys):
+        self.bloom.add(keys)
+        self.unsettled.update(np.atleast_1d(keys).tolist())
+
+    def discard(self, key):
+        self.unsettled.add(key)
+
+    # Returns True or False, or None when only the database can tell.
+    def contains(self, key):
+        self.lookups += 1
+        if key in self.unsettled:
+            return None
+        elif key not in self.bloom:
+            self.rejections += 1
+            return False if self.authoritative else None
+        elif self.keys is None:
+            return None
+        elif key in self.keys:
+            return True
+        else:
+            return False if self.authoritative else None
+
+    def stats(self):
+        return {'edges' : self.keys.count if self.keys is not None else self.bloom.count,
+                'capacity' : self.capacity,
+                'exact' : self.keys is not None,
+                'authoritative' : self.authoritative,
+                'lookups' : self.lookups,
+                'bloom_rejections' : self.rejections,
+                'nbytes' : self.bloom.bits.nbytes + \
+                           (self.keys.table.nbytes if self.keys is not None else 0)}
+
+#------------------------------------------------------------------------------
+
+# Reads the edges of every edge table with COPY. The Bloom filter is sized
+# for twice the current number of edges to leave room for new ones. The
+# edges are counted rather than estimated from the table statistics, which
+# are missing or stale for tables that have not been analyzed.
+
+def load_edge_index(exact=True, error_rate=0.01, authoritative=False, conn=None,
+                    verbose=True):
+    global EDGE_INDEX
+    start = time.perf_counter()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        count = sum([count_table_rows(x, conn) for x in edge_partitions()])
+        index = EdgeIndex(max(2 * count, 1024), error_rate, exact, authoritative)
+        for edge_table in edge_partitions():
+            buffer = io.StringIO()
+            cur.copy_expert("COPY (SELECT source, target FROM " + edge_table + \
+                            ") TO STDOUT WITH CSV", buffer)
+            buffer.seek(0)
+            df = pd.read_csv(buffer, header=None, names=['source', 'target'],
+                             dtype=np.int64)
+            index.add(edge_keys(df['source'], df['target']))
+    EDGE_INDEX = index
+    if verbose:
+        print ("Edge index: " + str(index.stats()['edges']) + " edges loaded in " + \
+               str(round(time.perf_counter() - start, 2)) + "s")
+    return index
+
+#------------------------------------------------------------------------------
+
+def clear_edge_index():
+    global EDGE_INDEX
+    EDGE_INDEX = None
+
+#------------------------------------------------------------------------------
+
+def index_edges(source_ids, target_ids):
+    if EDGE_INDEX is not None:
+        EDGE_INDEX.add(edge_keys(source_ids, target_ids))
+
+def index_pending_edges(source_ids, target_ids):
+    if EDGE_INDEX is not None:
+        EDGE_INDEX.add_pending(edge_keys(source_ids, target_ids))
+
+def unindex_edge(source_id, target_id):
+    if EDGE_INDEX is not None:
+        EDGE_INDEX.discard(edge_key(source_id, target_id))
+
+#------------------------------------------------------------------------------
+
+# Brings the edge index, the neighbor caches and the edge listeners up to
+# date with edges added ('add') or deleted ('delete') by a committed
+# transaction. Callers
+# of add_wiki_edge() or delete_wiki_edge() that commit their own
+# connection call this once they have committed.
+
+def publish_edge_changes(event, source_ids, target_ids):
+    if event == 'add':
+        index_edges(source_ids, target_ids)
+    else:
+        for source_id, target_id in zip(source_ids, target_ids):
+            unindex_edge(source_id, target_id)
+    invalidate_topic_neighbors(np.unique(np.concatenate(
+        [np.asarray(source_ids, dtype=np.int64),
+         np.asarray(target_ids, dtype=np.int64)])).tolist())
+    notify_edges(event, source_ids, target_ids)
+
+#------------------------------------------------------------------------------
+# Edge Listeners
+#------------------------------------------------------------------------------
+
+# Functions called as fn(event, source_ids, target_ids) after this process
+# has committed added ('add') or deleted ('delete') edges, so that indexes
+# derived from the edges (e.g. minhash.py) can be kept current. The ids are
+# numpy arrays.
+
+EDGE_LISTENERS = []
+
+def add_edge_listener(fn):
+    if fn not in EDGE_LISTENERS:
+        EDGE_LISTENERS.append(fn)
+
+def remove_edge_listener(fn):
+    if fn in EDGE_LISTENERS:
+        EDGE_LISTENERS.remove(fn)
+
+def notify_edges(event, source_ids, target_ids):
+    for fn in EDGE_LISTENERS:
+        fn(event, np.asarray(source_ids, dtype=np.int64),
+           np.asarray(target_ids, dtype=np.int64))
+
+#------------------------------------------------------------------------------
+
+# Checks the edge index first, then <edge_table> when needed.
+
+def edge_exists_p(edge_table, source_id, target_id, conn=None):
+    if EDGE_INDEX is not None:
+        found = EDGE_INDEX.contains(edge_key(source_id, target_id))
+        if found is not None:
+            return found
+    return find_edge_by_id(edge_table, source_id, target_id, conn) is not None
+
 #------------------------------------------------------------------------------
 # Edge Table Retrieval Operations
 #------------------------------------------------------------------------------
 
 def find_edge_by_id(edge_table, source_id, target_id, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + edge_table + " " + \
-                "WHERE source=" + str(source_id) + " AND target=" + str(target_id) + ";")
-    rows = cur.fetchall()
+    rows = run_prepared('edge_' + edge_table,
+                        "SELECT * FROM " + edge_table + " " + \
+                        "WHERE source=$1 AND target=$2",
+                        (source_id, target_id), conn)
     if rows==[]:
         return None
     else:
@@ -582,15 +1461,15 @@ def find_edge_by_id(edge_table, source_id, target_id, conn=None):
 #------------------------------------------------------------------------------
 
 def find_edge(source_name, target_name, conn=None):
-    conn = ensure_connection(conn)
-    source_id = find_topic_id(source_name, conn)
-    target_id = find_topic_id(target_name, conn)
-    letter = source_name_letter(source_name)
-    edge_table = edge_table_name(letter)
-    if source_id==None or target_id==None:
-        return None
-    else:
-        return find_edge_by_id(edge_table,source_id, target_id, conn)
+    with wikidb_connection(conn) as conn:
+        source_id = find_topic_id(source_name, conn)
+        target_id = find_topic_id(target_name, conn)
+        letter = source_name_letter(source_name)
+        edge_table = edge_table_name(letter)
+        if source_id==None or target_id==None:
+            return None
+        else:
+            return find_edge_by_id(edge_table,source_id, target_id, conn)
 
 #------------------------------------------------------------------------------
 
@@ -607,19 +1486,18 @@ def ensure_source_id(source, conn=None):
 # NB: <source> can be an id or a name.
 
 def find_edges(source_name, edge_type=DEFAULT_EDGE_TYPE, conn=None):
-    conn = ensure_connection(conn)
-    source_id = ensure_source_id(source_name, conn)
-    #source_id = source_id[0] if source_id is not None else source_id
-    letter = source_name_letter(source_name)
-    edge_table = edge_table_name(letter)
-    if source_id==None:
-        return None
-    else:
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM " + edge_table + " " + \
-                    "WHERE source=" + str(source_id) + " AND type='" + edge_type + "';")
-        rows = cur.fetchall()
-        return rows
+    with wikidb_connection(conn) as conn:
+        source_id = ensure_source_id(source_name, conn)
+        #source_id = source_id[0] if source_id is not None else source_id
+        letter = source_name_letter(source_name)
+        edge_table = edge_table_name(letter)
+        if source_id==None:
+            return None
+        else:
+            return run_prepared('edges_' + edge_table,
+                                "SELECT * FROM " + edge_table + " " + \
+                                "WHERE source=$1 AND type=$2",
+                                (source_id, edge_type), conn)
 
 #------------------------------------------------------------------------------
 # Topic Out Neighbors
@@ -630,26 +1508,27 @@ def find_edges(source_name, edge_type=DEFAULT_EDGE_TYPE, conn=None):
 # query one table.
 
 def find_topic_out_neighbors(topic, conn=None):
-    conn = ensure_connection(conn)
-    topic_id = find_topic_id(topic, conn)
-    cur = conn.cursor()
-    if topic_id == None:
-        return []
-    else:
+    with wikidb_connection(conn) as conn:
+        topic_id = find_topic_id(topic, conn)
+        if topic_id == None:
+            return []
+        names = cached_neighbor_names(OUT_NEIGHBOR_CACHE, topic_id, conn)
+        if names is not None:
+            return names
         letter = source_name_letter(topic)
         edge_table = edge_table_name(letter)
-        cur.execute("SELECT * FROM " + edge_table + " as we " + \
-                    "JOIN " + VERTICES_TABLE + " as wv on we.target = wv.id " + \
-                    "WHERE source=" + str(topic_id) + ";")
-        rows = cur.fetchall()
-        return list(set([row[6] for row in rows]))
+        rows = run_prepared('out_neighbors_' + edge_table,
+                            "SELECT wv.id, wv.name FROM " + edge_table + " as we " + \
+                            "JOIN " + VERTICES_TABLE + " as wv on we.target = wv.id " + \
+                            "WHERE we.source=$1",
+                            (topic_id,), conn)
+        return cache_neighbor_rows(OUT_NEIGHBOR_CACHE, topic_id, rows)
 
 
 #------------------------------------------------------------------------------
 
 def count_topic_out_neighbors(topic, conn=None):
-    conn = ensure_connection(conn)
-    return len(find_topic_out_neighbors(topic))
+    return len(find_topic_out_neighbors(topic, conn))
 
 #------------------------------------------------------------------------------
 
@@ -664,138 +1543,288 @@ def count_topic_out_neighbors(topic, conn=None):
 # Topic In Neighbors
 #------------------------------------------------------------------------------
 
-# Returns a list of neighbor topic names that point to <topic_name>. These will
-# necessarily be scattered across several tables, so we need to query each of
-# them.
+# Returns a list of neighbor topic names that point to <topic_name>. These are
+# read from the reverse edge table with a single query. Until that table has
+# been built they are gathered from every edge table instead.
+
+def find_topic_in_neighbors(topic_name, conn=None):
+    with wikidb_connection(conn) as conn:
+        topic_id = find_topic_id(topic_name, conn)
+        if topic_id == None:
+            return []
+        names = cached_neighbor_names(IN_NEIGHBOR_CACHE, topic_id, conn)
+        if names is not None:
+            return names
+        if reverse_edges_p(conn):
+            rows = run_prepared('in_neighbors',
+                                "SELECT wv.id, wv.name FROM " + REVERSE_EDGES_TABLE + " as re " + \
+                                "JOIN " + VERTICES_TABLE + " as wv on re.source = wv.id " + \
+                                "WHERE re.target=$1",
+                                (topic_id,), conn)
+        else:
+            rows = _find_topic_in_neighbor_rows(topic_id, conn=conn)
+        return cache_neighbor_rows(IN_NEIGHBOR_CACHE, topic_id, rows)
+
+#------------------------------------------------------------------------------
+
+# Returns the in-neighbors of <topic_name> found in the edge <tables>, by
+# default all of them. These will necessarily be scattered across several
+# tables, so we need to query each of them.
  
 def _find_topic_in_neighbors(topic_name, tables=None, conn=None):
-    conn = ensure_connection(conn)
-    topic_id = find_topic_id(topic_name, conn)
-    if topic_id == None:
-        return []
-    else:
+    with wikidb_connection(conn) as conn:
+        topic_id = find_topic_id(topic_name, conn)
+        if topic_id == None:
+            return []
+        else:
+            rows = _find_topic_in_neighbor_rows(topic_id, tables, conn)
+            return list(set([row[1] for row in rows]))
+
+#------------------------------------------------------------------------------
+
+def _find_topic_in_neighbor_rows(topic_id, tables=None, conn=None):
+    with wikidb_connection(conn) as conn:
         if tables == None:
             tables = edge_tables()
         cur = conn.cursor()
         all_rows = []
         for edge_table in tables:
-            cur.execute("SELECT * FROM " + edge_table + " as we " + \
+            cur.execute("SELECT wv.id, wv.name FROM " + edge_table + " as we " + \
                         "JOIN " + VERTICES_TABLE + " as wv on we.source = wv.id " + \
-                        "WHERE target=" + str(topic_id) + ";")
-            rows = cur.fetchall()
-            all_rows += rows
-        return list(set([row[6] for row in all_rows]))
+                        "WHERE we.target=%s;", (topic_id,))
+            all_rows += cur.fetchall()
+        return all_rows
 
 #------------------------------------------------------------------------------
-# Topic In Neigbors (PARALLEL Version)
+# Batch Neighbor Retrieval
 #------------------------------------------------------------------------------
 
-def find_topic_in_neighbors(topic_name, conn=None, threads=8):
-    conn = ensure_connection(conn)
-    topic_id = find_topic_id(topic_name, conn)
-    if topic_id == None:
-        return []
+# These take a list of topic names or vertex ids and return a dictionary of
+# vertex id to a sorted numpy array of neighbor ids, with one query per
+# edge table involved instead of one query per topic. Unknown topics are
+# left out.
 
-    lists = split_list(edge_tables(), threads)
+# Returns a dictionary of vertex id to name for <vertex_ids>.
 
-    # Use a shared variable to collect results fromm each process
-    manager = Manager()
-    return_dict = manager.dict()
+def find_vertex_names(vertex_ids, conn=None):
+    names = {}
+    unknown = []
+    for vertex_id in vertex_ids:
+        name = TOPIC_NAME_CACHE.get(vertex_id)
+        if name is MISSING:
+            unknown.append(vertex_id)
+        else:
+            names[vertex_id] = name
+    if unknown != []:
+        with wikidb_connection(conn) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, name FROM " + VERTICES_TABLE + \
+                        " WHERE id = ANY(%s);", (unknown,))
+            for vertex_id, name in cur.fetchall():
+                TOPIC_NAME_CACHE.put(vertex_id, name)
+                names[vertex_id] = name
+    return names
 
-    # Run four jobs, one for each quadrant of the matrix.
-    jobs = [] 
-    freeze_support()
-    for index, piece in enumerate(lists):
-        p = Process(target=pr.neighbor_worker,
-                    args=(topic_name, piece, index, return_dict))
-        jobs.append(p)
-        p.start()
+#------------------------------------------------------------------------------
 
-    # Gather the results
-    for proc in jobs:
-        proc.join()
+# Returns a dictionary of vertex id to name for topics given either way.
 
-    # Join all the neighbors
-    neighbors = return_dict.values()
-    if neighbors == []:
-        return []
-    else:
-        return reduce(lambda a, b : a + b, neighbors)
+def resolve_topics(topics, conn=None):
+    names = [x for x in topics if isinstance(x, str)]
+    ids = [int(x) for x in topics if not isinstance(x, str)]
+    resolved = find_vertex_names(ids, conn) if ids != [] else {}
+    for name, topic_id in find_topic_ids(names, conn).items():
+        if topic_id is not None:
+            resolved[topic_id] = name
+    return resolved
+
+#------------------------------------------------------------------------------
+
+def group_neighbor_rows(keys, rows):
+    neighbors = {key : [] for key in keys}
+    for key, neighbor in rows:
+        neighbors[key].append(neighbor)
+    return {key : np.unique(np.array(values, dtype=np.int64)) \
+            for key, values in neighbors.items()}
+
+#------------------------------------------------------------------------------
+
+def find_out_neighbors_batch(topics, conn=None):
+    with wikidb_connection(conn) as conn:
+        resolved = resolve_topics(topics, conn)
+        partitions = {}
+        for topic_id, name in resolved.items():
+            edge_table = edge_table_name(source_name_letter(name))
+            partitions.setdefault(edge_table, []).append(topic_id)
+        cur = conn.cursor()
+        rows = []
+        for edge_table, ids in partitions.items():
+            cur.execute("SELECT source, target FROM " + edge_table + \
+                        " WHERE source = ANY(%s);", (ids,))
+            rows += cur.fetchall()
+    return group_neighbor_rows(resolved.keys(), rows)
+
+#------------------------------------------------------------------------------
+
+def find_in_neighbors_batch(topics, conn=None):
+    with wikidb_connection(conn) as conn:
+        resolved = resolve_topics(topics, conn)
+        ids = list(resolved.keys())
+        cur = conn.cursor()
+        rows = []
+        if reverse_edges_p(conn):
+            cur.execute("SELECT target, source FROM " + REVERSE_EDGES_TABLE + \
+                        " WHERE target = ANY(%s);", (ids,))
+            rows = cur.fetchall()
+        else:
+            for edge_table in edge_tables():
+                cur.execute("SELECT target, source FROM " + edge_table + \
+                            " WHERE target = ANY(%s);", (ids,))
+                rows += cur.fetchall()
+    return group_neighbor_rows(ids, rows)
 
 #------------------------------------------------------------------------------
 # Compute Topic Outdegree
 #------------------------------------------------------------------------------
 
 def compute_topic_outdegree(source_name, conn=None):
-    conn = ensure_connection(conn)
-    id = ensure_source_id(source_name, conn=conn)
-    if id is None:
-        return None
-    else:
-        letter = source_name_letter(source_name)
-        table = edge_table_name(letter)
-        cur = conn.cursor()
-        query = "SELECT count(*) FROM " + table + " WHERE source=" + str(id) + ";"
-        cur.execute(query)                    
-        rows = cur.fetchall()
-        return rows[0][0] if rows != [] else 0
+    with wikidb_connection(conn) as conn:
+        id = ensure_source_id(source_name, conn=conn)
+        if id is None:
+            return None
+        else:
+            letter = source_name_letter(source_name)
+            table = edge_table_name(letter)
+            rows = run_prepared('outdegree_' + table,
+                                "SELECT count(*) FROM " + table + " WHERE source=$1",
+                                (id,), conn)
+            return rows[0][0] if rows != [] else 0
 
 #------------------------------------------------------------------------------
 # Compute Topic Indegree
 #------------------------------------------------------------------------------
 
 def compute_topic_indegree(topic_name, source_id=None, conn=None):
-    return len (find_topic_in_neighbors(topic_name))
+    return len (find_topic_in_neighbors(topic_name, conn=conn))
 
 #------------------------------------------------------------------------------
 # Update Topic Indegree and Outdegree
 #------------------------------------------------------------------------------
 
 # This computes and stores the indegree, outdegree and weight of all
-# the topics in the VERTICES_TABLE.
+# the topics in the VERTICES_TABLE with set based queries: a reset of all
+# the degrees, then one UPDATE ... FROM a GROUP BY per edge table, then
+# one UPDATE of the weights (indegree + outdegree + subtopics).
+#
+# Each step is committed together with a row in DEGREE_PROGRESS_TABLE, so
+# an interrupted job resumes after the last completed step when it is run
+# again. The progress table is dropped once the job completes; pass
+# restart=True to discard an interrupted run and start over.
+
+DEGREE_PROGRESS_TABLE = 'wiki_degree_progress'
+
+#------------------------------------------------------------------------------
 
-def update_topics_degrees():
-    conn = ensure_connection()
+def ensure_degree_columns(conn):
     cur = conn.cursor()
-    rows = find_all_topics()
-    count = 0
-    try:
-        for row in rows:
-            id = row[0]
-            name = row[1]
-            if row[5] is None or row[5]==0:
-                try:
-                    indegree = compute_topic_indegree(name)
-                    outdegree = compute_topic_outdegree(name)
-                    subtopics = count_topic_subtopics(name)
-                    weight = indegree + outdegree + subtopics
-                    query = "UPDATE " + VERTICES_TABLE + " SET " + \
-                        "indegree = " + str(indegree) + ", " + \
-                        "outdegree = " + str(outdegree) + ", " + \
-                        "weight = " + str(weight) + " " + \
-                        "WHERE id=" + str(id) + ";"
-                    cur.execute(query)
-                    count += 1
-                    if count%200==0:
-                        print ('Topics updated: ' + str(count))
-                    conn.commit()
-                except Exception as err:
-                    print ("Error: " + str(err))
-        conn.close()
+    cur.execute("ALTER TABLE " + VERTICES_TABLE + \
+                " ADD COLUMN IF NOT EXISTS indegree integer DEFAULT 0, " + \
+                " ADD COLUMN IF NOT EXISTS outdegree integer DEFAULT 0;")
+    conn.commit()
+
+#------------------------------------------------------------------------------
+
+def table_exists_p(table, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+        return cur.fetchone()[0]
+
+#------------------------------------------------------------------------------
+
+# Returns the steps of the degree job in the order they are run, each as
+# a (step name, query) pair.
+
+def degree_job_steps(conn):
+    steps = [('reset', "UPDATE " + VERTICES_TABLE + \
+                       " SET indegree = 0, outdegree = 0;")]
+    # The edge tables are partitioned by source, so each table holds all
+    # the out edges of its sources and adds to the indegree of its targets.
+    for edge_table in edge_partitions():
+        steps.append((edge_table + ':out',
+                      "UPDATE " + VERTICES_TABLE + " AS wv SET outdegree = d.n " + \
+                      "FROM (SELECT source, count(*) AS n FROM " + edge_table + \
+                      " GROUP BY source) AS d WHERE wv.id = d.source;"))
+        steps.append((edge_table + ':in',
+                      "UPDATE " + VERTICES_TABLE + " AS wv SET indegree = wv.indegree + d.n " + \
+                      "FROM (SELECT target, count(DISTINCT source) AS n FROM " + edge_table + \
+                      " GROUP BY target) AS d WHERE wv.id = d.target;"))
+    if table_exists_p(ROOT_SUBTOPICS_TABLE, conn):
+        subtopics = "(SELECT count(*) FROM " + ROOT_SUBTOPICS_TABLE + " AS sb " + \
+                    "JOIN " + VERTICES_TABLE + " AS vt ON vt.id = sb.subtopic_id " + \
+                    "WHERE sb.root_id = wv.id)"
+    else:
+        subtopics = "0"
+    steps.append(('weight', "UPDATE " + VERTICES_TABLE + " AS wv " + \
+                            "SET weight = wv.indegree + wv.outdegree + " + subtopics + ";"))
+    return steps
+
+#------------------------------------------------------------------------------
+
+def degree_job_progress(conn=None):
+    with wikidb_connection(conn) as conn:
+        if not table_exists_p(DEGREE_PROGRESS_TABLE, conn):
+            return []
+        cur = conn.cursor()
+        cur.execute("SELECT step FROM " + DEGREE_PROGRESS_TABLE + ";")
+        return [row[0] for row in cur.fetchall()]
+
+#------------------------------------------------------------------------------
+
+def update_topics_degrees(restart=False, conn=None):
+    with wikidb_connection(conn) as conn:
+        ensure_degree_columns(conn)
+        cur = conn.cursor()
+        if restart:
+            cur.execute("DROP TABLE IF EXISTS " + DEGREE_PROGRESS_TABLE + ";")
+        cur.execute("CREATE TABLE IF NOT EXISTS " + DEGREE_PROGRESS_TABLE + \
+                    " (step character varying PRIMARY KEY, " + \
+                    "rows integer, seconds real);")
+        conn.commit()
+        done = set(degree_job_progress(conn))
+        if done:
+            print ("Resuming degree job, steps already done: " + str(len(done)))
+        steps = degree_job_steps(conn)
+        job_start = time.perf_counter()
+        for i, (step, query) in enumerate(steps):
+            if step in done:
+                continue
+            start = time.perf_counter()
+            try:
+                cur.execute(query)
+                rows = cur.rowcount
+                seconds = time.perf_counter() - start
+                cur.execute("INSERT INTO " + DEGREE_PROGRESS_TABLE + \
+                            " (step, rows, seconds) VALUES (%s, %s, %s);",
+                            (step, rows, seconds))
+                conn.commit()
+            except Exception as err:
+                print ("Error: " + str(err))
+                conn.rollback()
+                return False
+            print ("Degrees: " + step + " (" + str(i+1) + "/" + str(len(steps)) + \
+                   "), " + str(rows) + " topics updated in " + \
+                   str(round(seconds, 2)) + "s")
+        cur.execute("DROP TABLE " + DEGREE_PROGRESS_TABLE + ";")
+        conn.commit()
+        print ("Degree job completed in " + \
+               str(round(time.perf_counter() - job_start, 2)) + "s")
         return True
-    except Exception as err:
-        print ("Error: " + str(err))
-        conn.close()
-        return False
 
 #------------------------------------------------------------------------------
 
-def count_processed_degrees():
-    conn = ensure_connection()
-    cur = conn.cursor()
-    rows = find_all_topics()
-    x = list(filter(lambda row: row[5] is not None, rows))
-    return len(x)
+def count_processed_degrees(conn=None):
+    return sum(1 for row in iter_all_topics(conn=conn) if row[5] is not None)
 
 #******************************************************************************
 # Part 3: Status Operations
@@ -821,19 +1850,16 @@ def count_vertex_out_neighbors (vertex, conn=None):
 # Retturn a dictionary of table_namme and edge_count.
 
 def count_wiki_edges_by_table(conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    edge_counts = {}
-    for letter in edge_tables_suffixes():
-        edge_table = edge_table_name(letter)
-        count = count_table_rows(edge_table, conn=conn)
-        edge_counts.update({edge_table : count})
+    with wikidb_connection(conn) as conn:
+        edge_counts = {}
+        for edge_table in edge_partitions():
+            count = count_table_rows(edge_table, conn=conn)
+            edge_counts.update({edge_table : count})
     return edge_counts
     
 #------------------------------------------------------------------------------
 
 def count_wiki_edges(conn=None):
-    conn = ensure_connection(conn)
     counts = count_wiki_edges_by_table (conn)
     return sum(counts.values())
 
@@ -846,24 +1872,21 @@ def count_wiki_edges(conn=None):
 #------------------------------------------------------------------------------
 
 def add_wiki_vertex(vertex_name, conn=None, commit_p=False):
-    if "'" in vertex_name:
-        return []
-    else:
-        conn = ensure_connection(conn)
+    with wikidb_connection(conn) as conn:
         cur = conn.cursor()
         if find_topic_id(vertex_name, conn) == None:
             cur.execute("INSERT INTO " + VERTICES_TABLE + \
-                        " (name) VALUES ('" + vertex_name + "');")
+                        " (name) VALUES (%s);", (vertex_name,))
+            invalidate_topic_id(vertex_name)
             if commit_p == True:
                 conn.commit()
 
 #------------------------------------------------------------------------------
 
+# NB: This uses the bulk loader below.
+
 def add_wiki_vertices(vertices, conn=None):
-    conn = ensure_connection(conn)
-    for vertex in vertices:
-        add_wiki_vertex(vertex, conn, True)
-    conn.commit()
+    bulk_add_wiki_vertices(vertices, conn=conn, verbose=False)
 
 #------------------------------------------------------------------------------
 
@@ -906,12 +1929,12 @@ def add_wiki_vertices(vertices, conn=None):
 
 # A little of a hack too ensure the root vertices table has all it's weights.
 
-def ensure_root_vertex_weight(row):
+def ensure_root_vertex_weight(row, conn=None):
     id = row[0]
     weight = row[2]
     #outdegree = row[3]
     if weight == 0:
-        weight = count_vertex_out_neighbors(row[1])
+        weight = count_vertex_out_neighbors(row[1], conn=conn)
     #if outdegree == 0:
     #    outdegree = weight
     return [id, row[1], weight, weight]
@@ -923,23 +1946,21 @@ def ensure_root_vertex_weight(row):
 # pattern and add them to the root vertex table
 
 def generate_root_vertices_for_prefix (pattern):
-    try:
-        conn = ensure_connection()
-        cur = conn.cursor()
-        rows = identify_root_vertices(pattern, conn)
-        print ("Found " + str(len(rows)) + " vertices matching " + pattern)
-        count = 0
-        for  row in rows:
-            vertex_id = row[0]
-            count += 1
-            if count%1000==0:
-                print ("Added " + str(count) + " new root vertices...")
-            row = ensure_root_vertex_weight(row)
-            add_root_vertex(row, conn=conn)
-    except Exception as err:
-        print (err)
-    conn.commit()
-    conn.close()
+    with wikidb_connection() as conn:
+        try:
+            rows = identify_root_vertices(pattern, conn)
+            print ("Found " + str(len(rows)) + " vertices matching " + pattern)
+            count = 0
+            for  row in rows:
+                vertex_id = row[0]
+                count += 1
+                if count%1000==0:
+                    print ("Added " + str(count) + " new root vertices...")
+                row = ensure_root_vertex_weight(row, conn)
+                add_root_vertex(row, conn=conn)
+        except Exception as err:
+            print (err)
+        conn.commit()
 
 #------------------------------------------------------------------------------
 
@@ -955,165 +1976,465 @@ def generate_root_vertices():
 # Wiki DB Edge Table Maintenace
 #------------------------------------------------------------------------------
 
+# The edge is marked as pending in the edge index as soon as it is
+# inserted. The edge index and the edge listeners are only updated once the
+# insert is committed, i.e. when <commit_p> is True; otherwise see
+# publish_edge_changes().
+
 def add_wiki_edge(source_name, target_name, edge_type=DEFAULT_EDGE_TYPE,
                   conn=None, commit_p=False):
-    conn = ensure_connection(conn)
-    letter = source_name_letter(source_name)
-    edge_table = edge_table_name(letter)
-    source_id = find_topic_id(source_name, conn)
-    target_id = find_topic_id(target_name, conn)
-    if source_id==None or target_id==None:
-        return None
-    else:
-        if find_edge_by_id(edge_table, source_id, target_id, conn) == None:
-            cur = conn.cursor()
-            cur.execute("INSERT INTO " + edge_table + " (source, target, type) " +\
-                        "VALUES (" + str(source_id) + ", " + str(target_id) + ", '" +\
-                        edge_type + "');")
-            if commit_p == True:
-                conn.commit()
+    with wikidb_connection(conn) as conn:
+        letter = source_name_letter(source_name)
+        edge_table = edge_table_name(letter)
+        source_id = find_topic_id(source_name, conn)
+        target_id = find_topic_id(target_name, conn)
+        if source_id==None or target_id==None:
+            return None
+        else:
+            if not edge_exists_p(edge_table, source_id, target_id, conn):
+                cur = conn.cursor()
+                cur.execute("INSERT INTO " + edge_table + " (source, target, type) " +\
+                            "VALUES (%s, %s, %s);", (source_id, target_id, edge_type))
+                add_reverse_edge(source_id, target_id, edge_type, conn)
+                index_pending_edges([source_id], [target_id])
+                invalidate_topic_neighbors([source_id, target_id])
+                if commit_p == True:
+                    conn.commit()
+                    publish_edge_changes('add', [source_id], [target_id])
+
+#------------------------------------------------------------------------------
+
+# Deletes the edge from <source_name> to <target_name> and its mirror in the
+# reverse edge table. Returns the number of edges deleted. As with
+# add_wiki_edge(), the edge index and the edge listeners are only updated
+# when <commit_p> is True.
+
+def delete_wiki_edge(source_name, target_name, conn=None, commit_p=False):
+    with wikidb_connection(conn) as conn:
+        edge_table = edge_table_name(source_name_letter(source_name))
+        source_id = find_topic_id(source_name, conn)
+        target_id = find_topic_id(target_name, conn)
+        if source_id==None or target_id==None:
+            return 0
+        cur = conn.cursor()
+        cur.execute("DELETE FROM " + edge_table + " WHERE source=%s AND target=%s;",
+                    (source_id, target_id))
+        count = cur.rowcount
+        if reverse_edges_p(conn):
+            cur.execute("DELETE FROM " + REVERSE_EDGES_TABLE + \
+                        " WHERE target=%s AND source=%s;", (target_id, source_id))
+        unindex_edge(source_id, target_id)
+        invalidate_topic_neighbors([source_id, target_id])
+        if commit_p == True:
+            conn.commit()
+            if count > 0:
+                publish_edge_changes('delete', [source_id], [target_id])
+        return count
 
 #------------------------------------------------------------------------------
 
+# NB: This uses the bulk loader below.
+
 def add_wiki_edges(source_name, target_names, edge_type='related', conn=None):
-    conn = ensure_connection(conn)
-    for target_name in target_names:
-        add_wiki_edge(source_name, target_name, edge_type=edge_type, conn=conn)
-    conn.commit()
+    edges = [(source_name, target_name, edge_type) for target_name in target_names]
+    bulk_add_wiki_edges(edges, conn=conn, verbose=False)
+
+#------------------------------------------------------------------------------
+# Reverse Edge Table Maintenance
+#------------------------------------------------------------------------------
+
+# These are no-ops until the reverse edge table has been created.
+
+def add_reverse_edge(source_id, target_id, edge_type=DEFAULT_EDGE_TYPE, conn=None):
+    with wikidb_connection(conn) as conn:
+        if reverse_edges_p(conn):
+            cur = conn.cursor()
+            cur.execute("INSERT INTO " + REVERSE_EDGES_TABLE + \
+                        " (target, source, type) VALUES (%s, %s, %s) " + \
+                        "ON CONFLICT (target, source) DO UPDATE SET type=EXCLUDED.type;",
+                        (target_id, source_id, edge_type))
+
+#------------------------------------------------------------------------------
+
+def update_reverse_edge_type(source_id, target_id, edge_type, conn=None):
+    with wikidb_connection(conn) as conn:
+        if reverse_edges_p(conn):
+            cur = conn.cursor()
+            cur.execute("UPDATE " + REVERSE_EDGES_TABLE + " SET type=%s " + \
+                        "WHERE target=%s AND source=%s;",
+                        (edge_type, target_id, source_id))
+
+#------------------------------------------------------------------------------
+
+# Recreates the reverse edge table from the edge tables, with one
+# INSERT ... SELECT per edge table. Rows are inserted in key order to keep
+# the primary key index build local.
+
+def rebuild_reverse_edges(conn=None):
+    with wikidb_connection(conn) as conn:
+        create_reverse_edges_table(conn)
+        cur = conn.cursor()
+        count = 0
+        for edge_table in edge_tables():
+            cur.execute("INSERT INTO " + REVERSE_EDGES_TABLE + " (target, source, type) " + \
+                        "SELECT target, source, type FROM " + edge_table + \
+                        " ORDER BY target, source " + \
+                        "ON CONFLICT (target, source) DO NOTHING;")
+            count += cur.rowcount
+            conn.commit()
+            print ("Reverse edges added from " + edge_table + ": " + str(cur.rowcount))
+        cur.execute("ANALYZE " + REVERSE_EDGES_TABLE + ";")
+        conn.commit()
+        print ("Total reverse edges: " + str(count))
+    return count
+
+#------------------------------------------------------------------------------
+# Bulk Loading
+#------------------------------------------------------------------------------
+
+# Loading one row at a time costs several round trips per row: a
+# find_topic_id() per name, a find_edge_by_id() and an INSERT per edge. The
+# bulk loaders below stage a whole batch with COPY FROM STDIN into a
+# temporary table and then resolve, deduplicate and insert it with a few
+# set-based statements, one per edge table for edges. Each batch is loaded
+# in a single transaction which is committed on success.
+
+def copy_rows(cur, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert("COPY " + table + " (" + ", ".join(columns) + ") " + \
+                    "FROM STDIN WITH (FORMAT csv)", buffer)
+
+#------------------------------------------------------------------------------
+
+def bulk_load_report(label, rows, inserted, start, verbose=True):
+    seconds = time.perf_counter() - start
+    rate = rows / seconds if seconds > 0 else 0.0
+    if verbose:
+        print (label + ": " + str(rows) + " rows, " + str(inserted) + \
+               " inserted in " + str(round(seconds, 2)) + "s (" + \
+               str(int(rate)) + " rows/sec)")
+    return {'rows' : rows, 'inserted' : inserted, 'seconds' : seconds,
+            'rows_per_second' : rate}
+
+#------------------------------------------------------------------------------
+
+# Adds the <names> that are not yet in VERTICES_TABLE. Names are compared
+# case insensitively, like find_topic(). The vertex table is locked against
+# concurrent writers (not readers) so that two loaders cannot add the same
+# name twice.
+
+def bulk_add_wiki_vertices(names, conn=None, verbose=True):
+    start = time.perf_counter()
+    rows = [(position, name) for position, name in enumerate(names) if name]
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("CREATE TEMP TABLE stage_vertices (position integer, " + \
+                    "name character varying) ON COMMIT DROP;")
+        copy_rows(cur, 'stage_vertices', ['position', 'name'], rows)
+        cur.execute("LOCK TABLE " + VERTICES_TABLE + " IN SHARE ROW EXCLUSIVE MODE;")
+        # New vertices get their ids in the order the names were given.
+        cur.execute("INSERT INTO " + VERTICES_TABLE + " (name) " + \
+                    "SELECT nv.name FROM (" + \
+                    "SELECT DISTINCT ON (LOWER(sv.name)) sv.position, sv.name " + \
+                    "FROM stage_vertices as sv " + \
+                    "WHERE NOT EXISTS (SELECT 1 FROM " + VERTICES_TABLE + " as wv " + \
+                    "WHERE LOWER(wv.name)=LOWER(sv.name)) " + \
+                    "ORDER BY LOWER(sv.name), sv.position) as nv " + \
+                    "ORDER BY nv.position;")
+        inserted = cur.rowcount
+        conn.commit()
+    for position, name in rows:
+        invalidate_topic_id(name)
+    return bulk_load_report('Vertices', len(rows), inserted, start, verbose)
+
+#------------------------------------------------------------------------------
+
+# <edges> is a list of (source_name, target_name, edge_type) triples; the type
+# can be omitted, in which case it is DEFAULT_EDGE_TYPE. Names are resolved
+# to vertex ids with a single join and edges whose source or target is not a
+# vertex are skipped, as in add_wiki_edge(). Each edge goes to the table
+# edge_table_name() gives for its source and existing edges are left untouched.
+
+def bulk_add_wiki_edges(edges, conn=None, verbose=True):
+    start = time.perf_counter()
+    rows = []
+    for edge in edges:
+        source_name, target_name = edge[0], edge[1]
+        edge_type = edge[2] if len(edge) > 2 else DEFAULT_EDGE_TYPE
+        rows.append((source_name, target_name, edge_type,
+                     edge_table_name(source_name_letter(source_name))))
+    tables = sorted(set(row[3] for row in rows))
+    inserted = 0
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        # Stage the batch
+        cur.execute("CREATE TEMP TABLE stage_edges (source character varying, " + \
+                    "target character varying, type character varying, " + \
+                    "edge_table character varying) ON COMMIT DROP;")
+        copy_rows(cur, 'stage_edges', ['source', 'target', 'type', 'edge_table'], rows)
+        # Resolve the names, keeping the smallest id of duplicated names
+        cur.execute("CREATE TEMP TABLE stage_ids ON COMMIT DROP AS " + \
+                    "SELECT LOWER(wv.name) as key, MIN(wv.id) as id " + \
+                    "FROM " + VERTICES_TABLE + " as wv " + \
+                    "WHERE LOWER(wv.name) IN (SELECT LOWER(source) FROM stage_edges " + \
+                    "UNION SELECT LOWER(target) FROM stage_edges) " + \
+                    "GROUP BY LOWER(wv.name);")
+        cur.execute("CREATE TEMP TABLE stage_resolved ON COMMIT DROP AS " + \
+                    "SELECT DISTINCT ON (s.id, t.id) se.edge_table, s.id as source, " + \
+                    "t.id as target, se.type " + \
+                    "FROM stage_edges as se " + \
+                    "JOIN stage_ids as s on s.key = LOWER(se.source) " + \
+                    "JOIN stage_ids as t on t.key = LOWER(se.target);")
+        # One INSERT per edge table, mirrored into the reverse edge table
+        mirror_p = reverse_edges_p(conn)
+        for edge_table in tables:
+            cur.execute("LOCK TABLE " + edge_table + " IN SHARE ROW EXCLUSIVE MODE;")
+            query = "INSERT INTO " + edge_table + " (source, target, type) " + \
+                    "SELECT sr.source, sr.target, sr.type FROM stage_resolved as sr " + \
+                    "WHERE sr.edge_table = %s AND NOT EXISTS (SELECT 1 FROM " + \
+                    edge_table + " as we " + \
+                    "WHERE we.source = sr.source AND we.target = sr.target) " + \
+                    "RETURNING source, target, type"
+            if mirror_p:
+                query = "WITH inserted as (" + query + ") " + \
+                        "INSERT INTO " + REVERSE_EDGES_TABLE + " (target, source, type) " + \
+                        "SELECT target, source, type FROM inserted " + \
+                        "ON CONFLICT (target, source) DO NOTHING;"
+            cur.execute(query, (edge_table,))
+            inserted += cur.rowcount
+        # All the resolved edges exist now, whether or not they were new.
+        track_p = EDGE_INDEX is not None or EDGE_LISTENERS != [] or \
+                  any([len(x) > 0 for x in NEIGHBOR_CACHES])
+        if track_p:
+            cur.execute("SELECT source, target FROM stage_resolved;")
+            pairs = np.array(cur.fetchall(), dtype=np.int64).reshape(-1, 2)
+        conn.commit()
+        if track_p:
+            publish_edge_changes('add', pairs[:, 0], pairs[:, 1])
+    return bulk_load_report('Edges', len(rows), inserted, start, verbose)
 
 #*****************************************************************************
 # Part 6: Vertex and Edge Types
 #*****************************************************************************
 
-def strongly_related_p (topic1, topic2):
-    edge1 = find_edge(topic1, topic2)
-    edge2 = find_edge(topic2, topic1)
-    if edge1 is not None and edge2 is not None:
-        return True
-    else:
-        return False
+def strongly_related_p (topic1, topic2, conn=None):
+    with wikidb_connection(conn) as conn:
+        topic_ids = find_topic_ids([topic1, topic2], conn)
+        id1, id2 = topic_ids[topic1], topic_ids[topic2]
+        if id1 is None or id2 is None:
+            return False
+        table1 = edge_table_name(source_name_letter(topic1))
+        table2 = edge_table_name(source_name_letter(topic2))
+        return edge_exists_p(table1, id1, id2, conn) and \
+               edge_exists_p(table2, id2, id1, conn)
+
+#------------------------------------------------------------------------------
+
+# Returns the topics linked to <topic_name> in both directions. With the
+# reverse edge table this is a single join, otherwise the intersection of
+# the out and in neighbors.
+
+def find_strongly_related_topics(topic_name, conn=None):
+    with wikidb_connection(conn) as conn:
+        topic_id = find_topic_id(topic_name, conn)
+        if topic_id is None:
+            return []
+        elif reverse_edges_p(conn):
+            names = cached_neighbor_names(STRONGLY_RELATED_CACHE, topic_id, conn)
+            if names is not None:
+                return names
+            rows = _find_strongly_related_rows(topic_name, topic_id, conn)
+            return cache_neighbor_rows(STRONGLY_RELATED_CACHE, topic_id, rows)
+        else:
+            in_neighbors = set(find_topic_in_neighbors(topic_name, conn))
+            return [x for x in find_topic_out_neighbors(topic_name, conn) \
+                    if x in in_neighbors]
+
+#------------------------------------------------------------------------------
+
+# Same as above but returns the ids of the strongly related topics, as
+# selected from the edge tables rather than looked up again by name.
+
+def find_strongly_related_ids(topic_name, conn=None):
+    with wikidb_connection(conn) as conn:
+        topic_id = find_topic_id(topic_name, conn)
+        if topic_id is None:
+            return np.zeros(0, dtype=np.int32)
+        elif reverse_edges_p(conn):
+            neighbor_ids = STRONGLY_RELATED_CACHE.get(topic_id)
+            if neighbor_ids is MISSING:
+                rows = _find_strongly_related_rows(topic_name, topic_id, conn)
+                cache_neighbor_rows(STRONGLY_RELATED_CACHE, topic_id, rows)
+                neighbor_ids = np.unique(np.array([row[0] for row in rows], dtype=np.int32))
+            return neighbor_ids
+        else:
+            out_ids = find_out_neighbors_batch([topic_id], conn)[topic_id]
+            in_ids = [row[0] for row in _find_topic_in_neighbor_rows(topic_id, conn=conn)]
+            return np.intersect1d(out_ids, in_ids).astype(np.int32)
 
 #------------------------------------------------------------------------------
 
-def compute_strongly_related_neighbors(topic1):
-    topics = find_topic_out_neighbors(topic1)
-    results = []
-    for x in topics:
-        if strongly_related_p(topic1, x):
-            results.append(x)
-    return results
+def _find_strongly_related_rows(topic_name, topic_id, conn):
+    edge_table = edge_table_name(source_name_letter(topic_name))
+    return run_prepared('strongly_related_' + edge_table,
+                        "SELECT wv.id, wv.name FROM " + edge_table + " as we " + \
+                        "JOIN " + REVERSE_EDGES_TABLE + " as re " + \
+                        "on re.target = we.source AND re.source = we.target " + \
+                        "JOIN " + VERTICES_TABLE + " as wv on wv.id = we.target " + \
+                        "WHERE we.source=$1",
+                        (topic_id,), conn)
 
-    
 #------------------------------------------------------------------------------
 
-def update_strongly_related_edges():
-    conn = ensure_connection()
-    cur = conn.cursor()
-    count = 0
-
-    for letter in EDGE_SUFFIXES:
-
-        print ('\n\nProcessing letter: ' + str(letter) + '...')
-        table1 = edge_table_name(letter)
-        query = "SELECT id, source, target FROM " + table1 + \
-                " WHERE LOWER(type)='related'"
-        cur.execute(query)
-        edges = cur.fetchall()
-        for edge1 in edges:
-            source_id = edge1[1]
-            target_id = edge1[2]
-            target = find_topic_by_id(target_id)
-            if target is not None:
-                target_name = target[1]
-                letter2 = source_name_letter(target_name)
-                table2 = edge_table_name(letter2)
-                if find_edge_by_id(table2, target_id, source_id, conn) is not None:
-                    query1 = "UPDATE " + table1 + \
-                             " SET type='strongly related' " + \
-                             " WHERE source=" + str(source_id) + \
-                             " AND target=" + str(target_id) + ";"
-                    query2 = "UPDATE " + table2 + \
-                             " SET type='strongly related' " + \
-                             " WHERE source=" + str(target_id) + \
-                             " AND target=" + str(source_id) + ";"
-                    cur.execute(query1)
-                    cur.execute(query2)
-            count += 1
-            if count%1000==0:
-                print ('Edges processed: ' + str(count))
+def compute_strongly_related_neighbors(topic1, conn=None):
+    return find_strongly_related_topics(topic1, conn)
+
+#------------------------------------------------------------------------------
+
+# All the edges, for joins on (source, target) across the partitions.
+
+def all_edges_query(conn=None):
+    if reverse_edges_p(conn):
+        return REVERSE_EDGES_TABLE
+    else:
+        return "(" + " UNION ALL ".join(["SELECT source, target, type FROM " + x \
+                                         for x in edge_tables()]) + ")"
+
+#------------------------------------------------------------------------------
+
+# Sets the type of every 'related' edge a->b for which b->a exists, and of
+# that reverse edge, to 'strongly related'. The reciprocal pairs are found
+# first, with one join per edge table against all the edges, and then
+# every table is updated with one UPDATE ... FROM. Returns the number of
+# edges updated.
+
+def update_strongly_related_edges(conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        start = time.perf_counter()
+        all_edges = all_edges_query(conn)
+        cur.execute("CREATE TEMP TABLE related_pairs (source integer, target integer) " + \
+                    "ON COMMIT DROP;")
+        for edge_table in edge_tables():
+            cur.execute("INSERT INTO related_pairs (source, target) " + \
+                        "SELECT we.source, we.target FROM " + edge_table + " as we " + \
+                        "JOIN " + all_edges + " as ae " + \
+                        "on ae.source = we.target AND ae.target = we.source " + \
+                        "WHERE LOWER(we.type)='related';")
+        cur.execute("CREATE TEMP TABLE reciprocal_edges ON COMMIT DROP AS " + \
+                    "SELECT source, target FROM related_pairs " + \
+                    "UNION SELECT target, source FROM related_pairs;")
+        cur.execute("CREATE INDEX ON reciprocal_edges (source, target);")
+        cur.execute("ANALYZE reciprocal_edges;")
+        print ("Reciprocal edges found: " + str(count_table_rows('reciprocal_edges', conn)))
+        count = 0
+        for edge_table in edge_tables():
+            cur.execute("UPDATE " + edge_table + " as we SET type='strongly related' " + \
+                        "FROM reciprocal_edges as rc " + \
+                        "WHERE we.source = rc.source AND we.target = rc.target " + \
+                        "AND we.type IS DISTINCT FROM 'strongly related';")
+            count += cur.rowcount
+            print ("Edges updated in " + edge_table + ": " + str(cur.rowcount))
+        if reverse_edges_p(conn):
+            cur.execute("UPDATE " + REVERSE_EDGES_TABLE + " as re " + \
+                        "SET type='strongly related' " + \
+                        "FROM reciprocal_edges as rc " + \
+                        "WHERE re.target = rc.target AND re.source = rc.source " + \
+                        "AND re.type IS DISTINCT FROM 'strongly related';")
         conn.commit()
-    conn.close()
-    return True
+        print ("Strongly related edges updated: " + str(count) + " in " + \
+               str(round(time.perf_counter() - start, 2)) + "s")
+    return count
         
 #------------------------------------------------------------------------------
 
-def update_root_edge_types():
-    conn = ensure_connection()
-    cur = conn.cursor()
+# Sets the type of the edges given as (source_id, target_id) pairs, with one
+# UPDATE per edge table. <tables> can restrict the update to the tables of
+# the sources, when they are known.
+
+def set_edge_types(pairs, edge_type, conn=None, tables=None):
+    if len(pairs) == 0:
+        return 0
+    if tables is None:
+        tables = edge_tables()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        sources = [pair[0] for pair in pairs]
+        targets = [pair[1] for pair in pairs]
+        count = 0
+        for edge_table in tables:
+            cur.execute("UPDATE " + edge_table + " as we SET type=%s " + \
+                        "FROM unnest(%s::integer[], %s::integer[]) as p (source, target) " + \
+                        "WHERE we.source = p.source AND we.target = p.target;",
+                        (edge_type, sources, targets))
+            count += cur.rowcount
+        if reverse_edges_p(conn):
+            cur.execute("UPDATE " + REVERSE_EDGES_TABLE + " as re SET type=%s " + \
+                        "FROM unnest(%s::integer[], %s::integer[]) as p (source, target) " + \
+                        "WHERE re.target = p.target AND re.source = p.source;",
+                        (edge_type, sources, targets))
+    return count
+
+#------------------------------------------------------------------------------
+
+def update_root_edge_types(itersize=SCAN_ITERSIZE):
+    with wikidb_connection() as scan_conn, wikidb_connection() as conn:
+        cur = conn.cursor()
     
-    # Get the root vertices
-    cur.execute("SELECT id, name FROM " + ROOT_TOPICS_TABLE + ";")
-    rows = cur.fetchall()
-    print ('\nTotal root vertices: ' + str(count_root_vertices()))
-
-    # Get the strongly related neighbors of each vertex and
-    # update the corresponding edge types in both directions.
-    count = 0
-    for row in rows:
-        topic1_id = row[0]
-        topic1 = row[1]
-        if len(topic1) > 0:
-            letter1 = source_name_letter(topic1)
-            edge_table1 = edge_table_name(letter1)
-            topics = compute_strongly_related_neighbors(topic1)
-            for topic2 in topics:
-                topic2_id = find_topic_id(topic2)
-                letter2 = source_name_letter(topic2)
-                edge_table2 = edge_table_name(letter2)
-                query1 = "UPDATE " + edge_table1 + \
-                         " SET type='strongly related' " + \
-                         " WHERE source=" + str(topic1_id) + \
-                         " AND target=" + str(topic2_id) + ";"
-                query2 = "UPDATE " + edge_table2 + \
-                         " SET type='strongly related' " + \
-                         " WHERE source=" + str(topic2_id) + \
-                         " AND target=" + str(topic1_id) + ";"
-                cur.execute(query1)
-                cur.execute(query2)
-            conn.commit()
-            count += 1
-            if count%100==0:
-                print ("Root topics updated: " + str(count))
-    conn.close()
+        # Get the root vertices
+        rows = iter_query("SELECT id, name FROM " + ROOT_TOPICS_TABLE + ";",
+                          itersize=itersize, conn=scan_conn)
+        print ('\nTotal root vertices: ' + str(count_root_vertices(conn)))
+
+        # Get the strongly related neighbors of each vertex and
+        # update the corresponding edge types in both directions.
+        count = 0
+        for row in rows:
+            topic1_id = row[0]
+            topic1 = row[1]
+            if len(topic1) > 0:
+                topic_ids = find_strongly_related_ids(topic1, conn).tolist()
+                topics = find_vertex_names(topic_ids, conn)
+                pairs = [(topic1_id, x) for x in topic_ids]
+                pairs += [(target, source) for source, target in pairs]
+                tables = set([edge_table_name(source_name_letter(x)) \
+                              for x in [topic1] + list(topics.values())])
+                set_edge_types(pairs, 'strongly related', conn, tables)
+                conn.commit()
+                count += 1
+                if count%100==0:
+                    print ("Root topics updated: " + str(count))
     return True
 
 #------------------------------------------------------------------------------
 
 def update_root_vertex_types():
-    conn = ensure_connection()
-    cur = conn.cursor()
+    with wikidb_connection() as conn:
+        cur = conn.cursor()
     
-    # Get the Untyped root vertices
-    cur.execute("SELECT id, name FROM " + ROOT_TOPICS_TABLE + " WHERE type IS NULL;")
-    rows = cur.fetchall()
-    print ('\nTotal root vertices: ' + str(count_root_vertices()))
-    print ('Untyped root vertices: ' + str(len(rows)) + '\n')
-
-    # Update those vertices that have a category in the dictionary.
-    count = 0
-    for row in rows:
-        word_entry = find_dictionary_word(row[1])
-        if word_entry is not None:
-            id = row[0]
-            word_type = word_entry[4]
-            if type != '' or type=='NIL':
-                query = "UPDATE " + ROOT_TOPICS_TABLE + " SET type='" + word_type + \
-                        "' WHERE id=" + str(id) + ";"
-                cur.execute(query)
-                conn.commit()
-                count += 1
-                if count%10==0:
-                    print ("Root vertices updated: " + str(count))
+        # Get the Untyped root vertices
+        cur.execute("SELECT id, name FROM " + ROOT_TOPICS_TABLE + " WHERE type IS NULL;")
+        rows = cur.fetchall()
+        print ('\nTotal root vertices: ' + str(count_root_vertices(conn)))
+        print ('Untyped root vertices: ' + str(len(rows)) + '\n')
+
+        # Update those vertices that have a category in the dictionary.
+        count = 0
+        for row in rows:
+            word_entry = find_dictionary_word(row[1], conn)
+            if word_entry is not None:
+                id = row[0]
+                word_type = word_entry[4]
+                if type != '' or type=='NIL':
+                    query = "UPDATE " + ROOT_TOPICS_TABLE + " SET type=%s WHERE id=%s;"
+                    cur.execute(query, (word_type, id))
+                    conn.commit()
+                    count += 1
+                    if count%10==0:
+                        print ("Root vertices updated: " + str(count))
     return True
 
 
@@ -1157,9 +2478,9 @@ def create_root_subtopics_indexes(conn):
 #------------------------------------------------------------------------------
     
 def create_root_subtopics_tables(conn=None):
-    conn = ensure_connection(conn)
-    create_root_subtopics_table(conn)
-    create_root_subtopics_indexes(conn)
+    with wikidb_connection(conn) as conn:
+        create_root_subtopics_table(conn)
+        create_root_subtopics_indexes(conn)
 
 #------------------------------------------------------------------------------
 # Find Root SubTopics
@@ -1169,25 +2490,26 @@ def create_root_subtopics_tables(conn=None):
 # this with the VERTICES_TABLE thus providing details of each subtopic.
 
 def find_root_subtopics_by_id(root_id, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    query = "SELECT * from " + ROOT_SUBTOPICS_TABLE + " as sb "+ \
-            " JOIN " + VERTICES_TABLE + " as vt on vt.id = sb.subtopic_id " + \
-            " WHERE sb.root_id=" + str(root_id) + ";"
-    cur.execute(query)
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        query = "SELECT * from " + ROOT_SUBTOPICS_TABLE + " as sb "+ \
+                " JOIN " + VERTICES_TABLE + " as vt on vt.id = sb.subtopic_id " + \
+                " WHERE sb.root_id=%s;"
+        cur.execute(query, (root_id,))
+        rows = cur.fetchall()
     return rows
 
 #------------------------------------------------------------------------------
 
 def find_root_subtopics_by_name(topic_name, conn=None):
-    topic = find_root_topic_by_name(topic_name)
-    if topic is not None:
-        root_id = topic[0]
-        rows = find_root_subtopics_by_id(root_id)
-        return rows
-    else:
-        return None
+    with wikidb_connection(conn) as conn:
+        topic = find_root_topic_by_name(topic_name, conn)
+        if topic is not None:
+            root_id = topic[0]
+            rows = find_root_subtopics_by_id(root_id, conn)
+            return rows
+        else:
+            return None
     
 #------------------------------------------------------------------------------
 
@@ -1196,12 +2518,13 @@ def count_root_subtopics(conn=None):
 
 #------------------------------------------------------------------------------
 
-def count_topic_subtopics(topic_name):
-    topic = find_root_topic(topic_name)
-    if topic is not None:
-        return len(find_root_subtopics_by_id(topic[0]))
-    else:
-        return 0
+def count_topic_subtopics(topic_name, conn=None):
+    with wikidb_connection(conn) as conn:
+        topic = find_root_topic(topic_name, conn)
+        if topic is not None:
+            return len(find_root_subtopics_by_id(topic[0], conn))
+        else:
+            return 0
     
 #------------------------------------------------------------------------------
 # Insert Root Subtopics
@@ -1209,62 +2532,61 @@ def count_topic_subtopics(topic_name):
 
 # Inserts potential subtopics of each root vertex.
 
-def insert_root_subtopics():
-    conn = ensure_connection()
-    cur = conn.cursor()
-    root_topics = get_root_vertices(conn=conn)
-    count = 0
-    for root_topic in root_topics:
-        root_id = root_topic[0]
-        vertex_name = root_topic[1]
-        query ="SELECT * FROM " + ROOT_SUBTOPICS_TABLE + \
-               " WHERE root_id=" + str(root_id) + ";"
-        cur.execute(query)
-        processed = cur.fetchall()
-        # Only process if unprocessed
-        if processed == []:
-            # Get all potential_subtopics
-            query = "SELECT * FROM " + VERTICES_TABLE + \
-                    " WHERE lower(name) LIKE LOWER('%" + vertex_name + "%');"
-            cur.execute(query)
-            subtopics = cur.fetchall()
-            # print ("Root topic: " + vertex_name + ", Subtopics: " + str(len(subtopics)))
-            for subtopic in subtopics:
-                if len(subtopic) > 1:
-                    subtopic_tokens = list(map (lambda x: x.lower(),
-                                                subtopic[1].split('_')))
-                    if vertex_name.lower() in subtopic_tokens:
-                        query = "INSERT INTO " + ROOT_SUBTOPICS_TABLE + \
-                                " (root_id, subtopic_id) " + \
-                                " VALUES (%s, %s);"
-                        execute_query(query, data=(root_id, subtopic[0]), conn=conn)
-            conn.commit()
-            count += 1
-            if count%100==0:
-                x = count_root_subtopics()
-                print ("Root topics processed: " + str(count))
-                print ("Total subtopics added: " + str(x))
-                print ("-------------------------------------------------")
-    conn.close()
+def insert_root_subtopics(itersize=SCAN_ITERSIZE):
+    with wikidb_connection() as scan_conn, wikidb_connection() as conn:
+        cur = conn.cursor()
+        root_topics = iter_root_vertices(itersize, scan_conn)
+        count = 0
+        for root_topic in root_topics:
+            root_id = root_topic[0]
+            vertex_name = root_topic[1]
+            query ="SELECT * FROM " + ROOT_SUBTOPICS_TABLE + \
+                   " WHERE root_id=%s;"
+            cur.execute(query, (root_id,))
+            processed = cur.fetchall()
+            # Only process if unprocessed
+            if processed == []:
+                # Get all potential_subtopics
+                query = "SELECT * FROM " + VERTICES_TABLE + \
+                        " WHERE lower(name) LIKE LOWER(%s);"
+                cur.execute(query, ('%' + vertex_name + '%',))
+                subtopics = cur.fetchall()
+                # print ("Root topic: " + vertex_name + ", Subtopics: " + str(len(subtopics)))
+                for subtopic in subtopics:
+                    if len(subtopic) > 1:
+                        subtopic_tokens = list(map (lambda x: x.lower(),
+                                                    subtopic[1].split('_')))
+                        if vertex_name.lower() in subtopic_tokens:
+                            query = "INSERT INTO " + ROOT_SUBTOPICS_TABLE + \
+                                    " (root_id, subtopic_id) " + \
+                                    " VALUES (%s, %s);"
+                            execute_query(query, data=(root_id, subtopic[0]), conn=conn)
+                conn.commit()
+                count += 1
+                if count%100==0:
+                    x = count_root_subtopics(conn)
+                    print ("Root topics processed: " + str(count))
+                    print ("Total subtopics added: " + str(x))
+                    print ("-------------------------------------------------")
     return True
 
 #------------------------------------------------------------------------------
 
-def count_unprocessed_subtopics():
-    conn = ensure_connection()
-    cur = conn.cursor()
-    root_topics = get_root_vertices(conn=conn)
-    count = 0
-    for root_topic in root_topics:
-        root_id = root_topic[0]
-        vertex_name = root_topic[1]
-        query ="SELECT * FROM " + ROOT_SUBTOPICS_TABLE + \
-               " WHERE root_id=" + str(root_id) + ";"
-        cur.execute(query)
-        processed = cur.fetchall()
-        # Only process if unprocessed
-        if processed == []:
-            count += 1
+def count_unprocessed_subtopics(conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        root_topics = iter_root_vertices(conn=conn)
+        count = 0
+        for root_topic in root_topics:
+            root_id = root_topic[0]
+            vertex_name = root_topic[1]
+            query ="SELECT * FROM " + ROOT_SUBTOPICS_TABLE + \
+                   " WHERE root_id=%s;"
+            cur.execute(query, (root_id,))
+            processed = cur.fetchall()
+            # Only process if unprocessed
+            if processed == []:
+                count += 1
     return count
 
 
@@ -1311,35 +2633,36 @@ def create_dictionary_indexes(conn):
 #------------------------------------------------------------------------------
     
 def create_dictionary_tables(conn=None):
-    conn = ensure_connection(conn)
-    create_dictionary_table(conn)
-    create_dictionary_indexes(conn)
+    with wikidb_connection(conn) as conn:
+        create_dictionary_table(conn)
+        create_dictionary_indexes(conn)
 
 #------------------------------------------------------------------------------
 # Find Dictionary Word
 #------------------------------------------------------------------------------
 
 def find_dictionary_word(word, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    try: 
-        cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
-                    "WHERE LOWER(word)=LOWER('" + word + "');")
-        rows = cur.fetchall()
-        return rows[0] if rows != [] else None
-    except Exception:
-        return None
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        try: 
+            cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
+                        "WHERE LOWER(word)=LOWER(%s);", (word,))
+            rows = cur.fetchall()
+            return rows[0] if rows != [] else None
+        except Exception:
+            conn.rollback()
+            return None
 
 #------------------------------------------------------------------------------
 # Find Dictionary Word
 #------------------------------------------------------------------------------
 
 def find_dictionary_word_by_id(id, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    query = "SELECT * FROM " + DICTIONARY_TABLE + " WHERE id=" + str(id) + ";"
-    cur.execute(query)
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        query = "SELECT * FROM " + DICTIONARY_TABLE + " WHERE id=%s;"
+        cur.execute(query, (id,))
+        rows = cur.fetchall()
     return rows[0] if rows != [] else None
 
 #------------------------------------------------------------------------------
@@ -1347,33 +2670,36 @@ def find_dictionary_word_by_id(id, conn=None):
 #------------------------------------------------------------------------------
 
 def find_dictionary_words(word, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
-                "WHERE LOWER(word) LIKE('%" + word + "%');")
-    return cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
+                    "WHERE LOWER(word) LIKE(%s);", ('%' + word + '%',))
+        return cur.fetchall()
 
 #------------------------------------------------------------------------------
 # Find Dictionary Definitions
 #------------------------------------------------------------------------------
 
 def find_dictionary_definitions(definition, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
-                "WHERE LOWER(definition) LIKE LOWER('%" + definition + "%');")
-    return cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
+                    "WHERE LOWER(definition) LIKE LOWER(%s);", ('%' + definition + '%',))
+        return cur.fetchall()
 
 #------------------------------------------------------------------------------
 # Find Defined Words
 #------------------------------------------------------------------------------
 
+def iter_defined_words(itersize=SCAN_ITERSIZE, conn=None):
+    return iter_query("SELECT * FROM " + DICTIONARY_TABLE + " " + \
+                      "WHERE definition IS NOT NULL;",
+                      itersize=itersize, conn=conn)
+
+#------------------------------------------------------------------------------
+
 def find_defined_words(conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
-                "WHERE definition IS NOT NULL;")
-    rows = cur.fetchall()
+    rows = list(iter_defined_words(conn=conn))
     return rows if rows != [] else None
 
 #------------------------------------------------------------------------------
@@ -1381,11 +2707,11 @@ def find_defined_words(conn=None):
 #------------------------------------------------------------------------------
 
 def find_undefined_words(conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
-                "WHERE definition IS NULL;")
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM " + DICTIONARY_TABLE + " " + \
+                    "WHERE definition IS NULL;")
+        rows = cur.fetchall()
     return rows if rows != [] else None
 
 #------------------------------------------------------------------------------
@@ -1398,43 +2724,39 @@ def find_undefined_words(conn=None):
 # word_entry: [<word> <pos> <base> <definition>]
 
 def add_dictionary_word(word_entry, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
 
-    # Destructure and process
-    word, pos, base, definition = word_entry
-    if type(pos)==list:
-        if len(pos) > 1:
-            other_pos = pos[1]
+        # Destructure and process
+        word, pos, base, definition = word_entry
+        if type(pos)==list:
+            if len(pos) > 1:
+                other_pos = pos[1]
+            else:
+                other_pos = pos[0]
+            pos = pos[0]
         else:
-            other_pos = pos[0]
-        pos = pos[0]
-    else:
-        other_pos = pos
-
-    # print ('Other Pos: ' + other_pos)
-    # Insert or Update
-    if find_dictionary_word(word) is None:
-        query = "INSERT INTO " + DICTIONARY_TABLE +\
-                "(word, base, pos, category, all_pos, definition) " +\
-                "VALUES (%s, %s, %s, %s, %s, %s);"
-        data = [word, base, pos, pos, other_pos, definition]
-        cur.execute(query, data)
+            other_pos = pos
+
+        # print ('Other Pos: ' + other_pos)
+        # Insert or Update
+        if find_dictionary_word(word, conn) is None:
+            query = "INSERT INTO " + DICTIONARY_TABLE +\
+                    "(word, base, pos, category, all_pos, definition) " +\
+                    "VALUES (%s, %s, %s, %s, %s, %s);"
+            data = [word, base, pos, pos, other_pos, definition]
+            cur.execute(query, data)
     
-    else:
-        query = "UPDATE " + DICTIONARY_TABLE + " SET " +\
-                "pos='" + pos + "'," + \
-                "base='" + base + "', " + \
-                "all_pos='" + other_pos + "', " + \
-                "definition='" + definition + "' " + \
-                "WHERE word='" + word + "';"
-        cur.execute(query)
+        else:
+            query = "UPDATE " + DICTIONARY_TABLE + " SET " +\
+                    "pos=%s, base=%s, all_pos=%s, definition=%s " + \
+                    "WHERE word=%s;"
+            cur.execute(query, (pos, base, other_pos, definition, word))
         
-    # Insert the words 
+        # Insert the words 
      
-    # Commit and close
-    conn.commit()
-    conn.close()
+        # Commit
+        conn.commit()
         
     return True
 
@@ -1443,21 +2765,20 @@ def add_dictionary_word(word_entry, conn=None):
 # Inserts a df of dictionary words into DICTIONARY_TABLE
 
 def add_dictionary_words(df, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
     
-    # Inset string
-    insert_str = "INSERT INTO " + DICTIONARY_TABLE +\
-                 "(word, base, pos, category, all_pos) " +\
-                 "VALUES (%s, %s, %s, %s, %s);"
-
-    # Insert the words 
-    data_list = [list(row) for row in df.itertuples(index=False)]
-    cur.executemany(insert_str, data_list)
+        # Inset string
+        insert_str = "INSERT INTO " + DICTIONARY_TABLE +\
+                     "(word, base, pos, category, all_pos) " +\
+                     "VALUES (%s, %s, %s, %s, %s);"
+
+        # Insert the words 
+        data_list = [list(row) for row in df.itertuples(index=False)]
+        cur.executemany(insert_str, data_list)
      
-    # Commit and close
-    conn.commit()
-    conn.close()
+        # Commit
+        conn.commit()
         
     return True
 
@@ -1468,13 +2789,12 @@ def add_dictionary_words(df, conn=None):
 # This commits on each update.
 
 def update_word_definition(id, definition, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    update_str = "UPDATE " + DICTIONARY_TABLE + " SET definition='" + \
-                 definition + \
-                 "' WHERE id=" + str(id) + ";"
-    cur.execute(update_str)
-    conn.commit()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        update_str = "UPDATE " + DICTIONARY_TABLE + " SET definition=%s " + \
+                     "WHERE id=%s;"
+        cur.execute(update_str, (definition, id))
+        conn.commit()
     return True
 
 #------------------------------------------------------------------------------
@@ -1487,8 +2807,6 @@ def count_dictionary_words(conn=None):
 #------------------------------------------------------------------------------
 
 def count_word_definitions(conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
     result = run_query ("SELECT count(*) from " + DICTIONARY_TABLE + \
                         " WHERE definition IS NOT NULL;",
                         conn=conn)
@@ -1502,7 +2820,6 @@ def count_word_definitions(conn=None):
 # generted data. THese functions clean up those values.
 
 def get_nil_category_entries(conn=None):
-    conn = ensure_connection(conn)
     query = "SELECT id, category from " + DICTIONARY_TABLE + \
             " WHERE category='NIL'" + \
             " OR category='';"
@@ -1515,20 +2832,19 @@ def get_nil_category_entries(conn=None):
 # a NULL DB value.
 
 def update_nil_category_entries():
-    conn = ensure_connection()
-    cur = conn.cursor()
-    results = get_nil_category_entries(conn=conn)
-    count = 0
-    print ('\nTotal entries to update: ' + str(len(results)) + '\n')
-    for result in results:
-        id = result[0]
-        update_str = "UPDATE " + DICTIONARY_TABLE + " SET category = NULL" +\
-                     " WHERE id = " + str(id) + ";"
-        execute_query(update_str)
-        count += 1
-        if count%1000==0:
-            print ('Categories updated: ' + str(count))
-    conn.commit()
+    with wikidb_connection() as conn:
+        results = get_nil_category_entries(conn=conn)
+        count = 0
+        print ('\nTotal entries to update: ' + str(len(results)) + '\n')
+        for result in results:
+            id = result[0]
+            update_str = "UPDATE " + DICTIONARY_TABLE + " SET category = NULL" +\
+                         " WHERE id = %s;"
+            execute_query(update_str, data=(id,), conn=conn)
+            count += 1
+            if count%1000==0:
+                print ('Categories updated: ' + str(count))
+        conn.commit()
     return True
 
 #------------------------------------------------------------------------------
@@ -1564,20 +2880,20 @@ def create_unknown_words_indexes(conn):
 #------------------------------------------------------------------------------
     
 def create_unknown_words_tables(conn=None):
-    conn = ensure_connection(conn)
-    create_unknown_words_table(conn)
-    create_unknown_words_indexes(conn)
+    with wikidb_connection(conn) as conn:
+        create_unknown_words_table(conn)
+        create_unknown_words_indexes(conn)
 
 #------------------------------------------------------------------------------
 # Find Unknown Words Word
 #------------------------------------------------------------------------------
 
 def find_unknown_word(word, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM " + UNKNOWN_WORDS_TABLE + " " + \
-                "WHERE LOWER(word)=LOWER('" + word + "');")
-    rows = cur.fetchall()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM " + UNKNOWN_WORDS_TABLE + " " + \
+                    "WHERE LOWER(word)=LOWER(%s);", (word,))
+        rows = cur.fetchall()
     return rows[0] if rows != [] else None
     
 #------------------------------------------------------------------------------
@@ -1585,27 +2901,27 @@ def find_unknown_word(word, conn=None):
 #------------------------------------------------------------------------------
 
 def add_unknown_word(word, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
 
-    if find_unknown_word(word) is None:
-        try:
-            # Insert string
-            insert_str = "INSERT INTO " + UNKNOWN_WORDS_TABLE +\
-                " (word, status) " +\
-                "VALUES ('" + word + "', 'unknown');"
-
-            print ("Insert str: " + insert_str)
-            # Insert the words 
-            cur.execute(insert_str)
+        if find_unknown_word(word, conn) is None:
+            try:
+                # Insert string
+                insert_str = "INSERT INTO " + UNKNOWN_WORDS_TABLE +\
+                    " (word, status) " +\
+                    "VALUES (%s, 'unknown');"
+
+                print ("Insert word: " + word)
+                # Insert the words 
+                cur.execute(insert_str, (word,))
      
-            # Commit and close
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as err:
-            print ('Error: ' + str(err))
-            return False
+                # Commit
+                conn.commit()
+                return True
+            except Exception as err:
+                print ('Error: ' + str(err))
+                conn.rollback()
+                return False
     return False
 
 #------------------------------------------------------------------------------
@@ -1613,21 +2929,20 @@ def add_unknown_word(word, conn=None):
 #------------------------------------------------------------------------------
 
 def add_unknown_words(df, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
     
-    # Inset string
-    insert_str = "INSERT INTO " + UNKNOWN_WORDS_TABLE +\
-                 " (word, status) " +\
-                 "VALUES (%s, %s);"
-
-    # Insert the words 
-    data_list = [list(row) for row in df.itertuples(index=False)]
-    cur.executemany(insert_str, data_list)
+        # Inset string
+        insert_str = "INSERT INTO " + UNKNOWN_WORDS_TABLE +\
+                     " (word, status) " +\
+                     "VALUES (%s, %s);"
+
+        # Insert the words 
+        data_list = [list(row) for row in df.itertuples(index=False)]
+        cur.executemany(insert_str, data_list)
      
-    # Commit and close
-    conn.commit()
-    conn.close()
+        # Commit
+        conn.commit()
         
     return True
 
@@ -1682,9 +2997,9 @@ def create_quotes_indexes(conn):
 #------------------------------------------------------------------------------
     
 def create_quotes_tables(conn=None):
-    conn = ensure_connection(conn)
-    create_quotes_table(conn)
-    create_quotes_indexes(conn)
+    with wikidb_connection(conn) as conn:
+        create_quotes_table(conn)
+        create_quotes_indexes(conn)
     
 #------------------------------------------------------------------------------
 # Add Topic Quotes
@@ -1694,27 +3009,22 @@ def create_quotes_tables(conn=None):
 # author, quote, topic, source, source_url, timestamp
 
 def add_topic_quotes_1(df, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
     
-    # Inset string
-    insert_str = "INSERT INTO " + QUOTES_TABLE +\
-                 " (author, quote, topic, source, source_url, created_on) " +\
-                 "VALUES (%s, %s, %s, %s, %s, %s);"
-
-    # Insert the quotes
-    for index, row in df.iterrows():
-        data = list(row)
-        try:
-            cur.execute(insert_str, data)
-            conn.commit()
-        except Exception as err:
-            conn.close()
-            conn = ensure_connection()
-            cur = conn.cursor()
-     
-    # Commit and close
-    conn.close()
+        # Inset string
+        insert_str = "INSERT INTO " + QUOTES_TABLE +\
+                     " (author, quote, topic, source, source_url, created_on) " +\
+                     "VALUES (%s, %s, %s, %s, %s, %s);"
+
+        # Insert the quotes
+        for index, row in df.iterrows():
+            data = list(row)
+            try:
+                cur.execute(insert_str, data)
+                conn.commit()
+            except Exception as err:
+                conn.rollback()
         
 #------------------------------------------------------------------------------
 
@@ -1722,21 +3032,20 @@ def add_topic_quotes_1(df, conn=None):
 # author, quote, topic, source, source_url, timestamp
 
 def add_topic_quotes_2(df, conn=None):
-    conn = ensure_connection(conn)
-    cur = conn.cursor()
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
     
-    # Inset string
-    insert_str = "INSERT INTO " + QUOTES_TABLE +\
-                 " (author, quote, topic, source, source_url, created_on) " +\
-                 "VALUES (%s, %s, %s, %s, %s, %s);"
-
-    # Insert the words 
-    data_list = [list(row) for row in df.itertuples(index=False)]
-    cur.executemany(insert_str, data_list)
+        # Inset string
+        insert_str = "INSERT INTO " + QUOTES_TABLE +\
+                     " (author, quote, topic, source, source_url, created_on) " +\
+                     "VALUES (%s, %s, %s, %s, %s, %s);"
+
+        # Insert the words 
+        data_list = [list(row) for row in df.itertuples(index=False)]
+        cur.executemany(insert_str, data_list)
      
-    # Commit and close
-    conn.commit()
-    conn.close()
+        # Commit
+        conn.commit()
         
     return True
 
@@ -0,0 +1,720 @@
+#*****************************************************************************
+# IN-MEMORY WIKI GRAPH
+#*****************************************************************************
+#
+# Part 1: Edge Types
+# Part 2: Compressed Sparse Row Graph
+# Part 3: Loading the Graph from WikiDB
+# Part 4: On-Disk Graph Format
+# Part 5: Main Runtime
+#
+#*****************************************************************************
+
+# The wiki_vertices and wiki_edges_<letter> tables hold about 50,000,000
+# edges. Answering neighbor queries from Postgres costs one query for the
+# out-neighbors of a topic and one query per edge table for its
+# in-neighbors. This module loads a snapshot of the whole graph into
+# compressed sparse row (CSR) arrays, in both directions, so that the same
+# queries are answered from memory.
+#
+# Vertices are renumbered densely from 0 to n-1 in vertex id order. The
+# out-neighbors of vertex i are out_targets[out_offsets[i]:out_offsets[i+1]]
+# and its in-neighbors are in_sources[in_offsets[i]:in_offsets[i+1]]. Both
+# slices are sorted. With int32 targets and uint8 edge types an edge costs
+# 10 bytes (5 per direction), i.e. about 500MB for 50,000,000 edges.
+
+import io
+import os
+import sys
+import struct
+import numpy as np
+import pandas as pd
+
+# Project Imports
+from src.utils import PYBAR_DIR
+from src.utils import make_data_pathname
+from src.database import wikidb_connection
+from src.database import edge_partitions
+from src.database import VERTICES_TABLE
+from src.database import DEFAULT_EDGE_TYPE
+
+#*****************************************************************************
+# Part 1: Edge Types
+#*****************************************************************************
+
+# Edge types are stored as one byte per edge. Any type not listed here is
+# stored as OTHER_EDGE_TYPE.
+
+EDGE_TYPES = [DEFAULT_EDGE_TYPE, 'strongly related', 'subtopic', 'supertopic']
+
+OTHER_EDGE_TYPE = 255
+
+#------------------------------------------------------------------------------
+
+def edge_type_code(edge_type):
+    if edge_type in EDGE_TYPES:
+        return EDGE_TYPES.index(edge_type)
+    else:
+        return OTHER_EDGE_TYPE
+
+#------------------------------------------------------------------------------
+
+def edge_type_name(code):
+    if code < len(EDGE_TYPES):
+        return EDGE_TYPES[code]
+    else:
+        return None
+
+#------------------------------------------------------------------------------
+
+def edge_type_codes(types):
+    codes = pd.Series(types, dtype=object).str.lower().map(
+        {edge_type : code for code, edge_type in enumerate(EDGE_TYPES)})
+    return codes.fillna(OTHER_EDGE_TYPE).to_numpy(dtype=np.uint8)
+
+#*****************************************************************************
+# Part 2: Compressed Sparse Row Graph
+#*****************************************************************************
+
+#------------------------------------------------------------------------------
+# Building CSR Arrays
+#------------------------------------------------------------------------------
+
+# Given edges as parallel arrays of dense vertex indices, returns the CSR
+# offsets, neighbors and edge types keyed on <keys>. Duplicate edges are
+# dropped and each neighbor list is sorted.
+
+def build_csr(keys, values, types, vertex_count):
+    # A stable sort on a single int64 key gives the same order as
+    # np.lexsort((values, keys)) in less than half the time.
+    order = np.argsort(np.asarray(keys, dtype=np.int64) * vertex_count + values,
+                       kind='stable')
+    keys = keys[order]
+    values = values[order]
+    types = types[order]
+    if len(keys) > 0:
+        unique = np.empty(len(keys), dtype=bool)
+        unique[0] = True
+        unique[1:] = (keys[1:] != keys[:-1]) | (values[1:] != values[:-1])
+        keys = keys[unique]
+        values = values[unique]
+        types = types[unique]
+    offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=vertex_count), out=offsets[1:])
+    return offsets, values.astype(np.int32), types.astype(np.uint8)
+
+#------------------------------------------------------------------------------
+# Wiki Graph Class
+#------------------------------------------------------------------------------
+
+# <ids> are the wiki_vertices ids in ascending order and <names> the
+# corresponding topic names. Topic names are matched case insensitively,
+# like database.find_topic().
+
+class WikiGraph:
+
+    def __init__(self, ids, names, out_offsets, out_targets, out_types,
+                 in_offsets, in_sources, in_types, name_index=None):
+        self.ids = ids
+        self.names = names
+        self.out_offsets = out_offsets
+        self.out_targets = out_targets
+        self.out_types = out_types
+        self.in_offsets = in_offsets
+        self.in_sources = in_sources
+        self.in_types = in_types
+        if name_index is None:
+            name_index = make_name_index(names)
+        self.name_index = name_index
+
+    #--------------------------------------------------------------------------
+    # Sizes
+
+    def vertex_count(self):
+        return len(self.ids)
+
+    def edge_count(self):
+        return len(self.out_targets)
+
+    def nbytes(self):
+        arrays = [self.ids, self.out_offsets, self.out_targets, self.out_types,
+                  self.in_offsets, self.in_sources, self.in_types]
+        return sum(a.nbytes for a in arrays)
+
+    #--------------------------------------------------------------------------
+    # Vertices
+
+    # Returns the dense index of a topic name, or None.
+    def vertex_index(self, topic_name):
+        return self.name_index.get(topic_name.lower())
+
+    # Returns the dense index of a wiki_vertices id, or None.
+    def id_index(self, vertex_id):
+        index = int(np.searchsorted(self.ids, vertex_id))
+        if index < len(self.ids) and self.ids[index] == vertex_id:
+            return index
+        else:
+            return None
+
+    # Topics can be given as a name or as a wiki_vertices id.
+    def ensure_index(self, topic):
+        if type(topic) == str:
+            return self.vertex_index(topic)
+        else:
+            return self.id_index(topic)
+
+    def vertex_name(self, index):
+        return self.names[index]
+
+    def vertex_id(self, index):
+        return int(self.ids[index])
+
+    def vertex_names(self, indices):
+        return [self.names[i] for i in indices]
+
+    #--------------------------------------------------------------------------
+    # Neighbor Indices
+
+    def out_neighbor_indices(self, index):
+        return self.out_targets[self.out_offsets[index]:self.out_offsets[index+1]]
+
+    def in_neighbor_indices(self, index):
+        return self.in_sources[self.in_offsets[index]:self.in_offsets[index+1]]
+
+    def out_edge_types(self, index):
+        return self.out_types[self.out_offsets[index]:self.out_offsets[index+1]]
+
+    def in_edge_types(self, index):
+        return self.in_types[self.in_offsets[index]:self.in_offsets[index+1]]
+
+    def outdegree(self, index):
+        return int(self.out_offsets[index+1] - self.out_offsets[index])
+
+    def indegree(self, index):
+        return int(self.in_offsets[index+1] - self.in_offsets[index])
+
+    def outdegrees(self):
+        return np.diff(self.out_offsets)
+
+    def indegrees(self):
+        return np.diff(self.in_offsets)
+
+    #--------------------------------------------------------------------------
+    # Reciprocal Edges
+
+    # Both neighbor arrays are sorted, so the vertices linked both ways are
+    # their intersection.
+    def reciprocal_neighbor_indices(self, index):
+        return np.intersect1d(self.out_neighbor_indices(index),
+                              self.in_neighbor_indices(index),
+                              assume_unique=True)
+
+    # Returns a boolean array parallel to out_targets which is True for the
+    # edges a->b such that b->a is also an edge. The out edges, encoded as
+    # source * n + target, are already in ascending order, so each reverse
+    # edge is looked up with a single searchsorted.
+    def reciprocal_edge_mask(self):
+        n = self.vertex_count()
+        sources = np.repeat(np.arange(n, dtype=np.int64), self.outdegrees())
+        targets = self.out_targets.astype(np.int64)
+        keys = sources * n + targets
+        reverse_keys = targets * n + sources
+        positions = np.searchsorted(keys, reverse_keys)
+        positions[positions == len(keys)] = 0
+        return keys[positions] == reverse_keys if len(keys) > 0 \
+            else np.zeros(0, dtype=bool)
+
+    #--------------------------------------------------------------------------
+    # Neighbor Topics
+    #
+    # These mirror the functions of the same name in database.py.
+
+    def find_topic_out_neighbors(self, topic):
+        index = self.ensure_index(topic)
+        if index is None:
+            return []
+        else:
+            return self.vertex_names(self.out_neighbor_indices(index))
+
+    def find_topic_in_neighbors(self, topic):
+        index = self.ensure_index(topic)
+        if index is None:
+            return []
+        else:
+            return self.vertex_names(self.in_neighbor_indices(index))
+
+    def find_strongly_related_topics(self, topic):
+        index = self.ensure_index(topic)
+        if index is None:
+            return []
+        else:
+            return self.vertex_names(self.reciprocal_neighbor_indices(index))
+
+    # Batch versions of the functions of the same name in database.py:
+    # dictionaries of vertex id to sorted arrays of neighbor ids.
+
+    def find_out_neighbors_batch(self, topics):
+        return self.neighbors_batch(topics, self.out_neighbor_indices)
+
+    def find_in_neighbors_batch(self, topics):
+        return self.neighbors_batch(topics, self.in_neighbor_indices)
+
+    def neighbors_batch(self, topics, neighbor_indices):
+        neighbors = {}
+        for topic in topics:
+            index = self.ensure_index(topic)
+            if index is not None:
+                neighbors[int(self.ids[index])] = self.ids[neighbor_indices(index)]
+        return neighbors
+
+    def count_topic_out_neighbors(self, topic):
+        index = self.ensure_index(topic)
+        return 0 if index is None else self.outdegree(index)
+
+    def count_topic_in_neighbors(self, topic):
+        index = self.ensure_index(topic)
+        return 0 if index is None else self.indegree(index)
+
+    def find_edge_type(self, source, target):
+        source = self.ensure_index(source)
+        target = self.ensure_index(target)
+        if source is None or target is None:
+            return None
+        targets = self.out_neighbor_indices(source)
+        position = int(np.searchsorted(targets, target))
+        if position < len(targets) and targets[position] == target:
+            return edge_type_name(self.out_edge_types(source)[position])
+        else:
+            return None
+
+#------------------------------------------------------------------------------
+
+# Maps lower cased topic names to dense indices. When names only differ in
+# case the vertex with the smallest id wins.
+
+def make_name_index(names):
+    name_index = {}
+    for index, name in enumerate(names):
+        if isinstance(name, str):
+            name_index.setdefault(name.lower(), index)
+    return name_index
+
+#------------------------------------------------------------------------------
+
+# Builds a WikiGraph from edges given as parallel arrays of dense indices.
+
+def make_csr_graph(ids, names, sources, targets, types):
+    n = len(ids)
+    out_offsets, out_targets, out_types = build_csr(sources, targets, types, n)
+    in_offsets, in_sources, in_types = build_csr(targets, sources, types, n)
+    return WikiGraph(np.asarray(ids, dtype=np.int32), names,
+                     out_offsets, out_targets, out_types,
+                     in_offsets, in_sources, in_types)
+
+#------------------------------------------------------------------------------
+
+# Builds a WikiGraph from a vertex list and edges given as wiki_vertices ids.
+# Edges whose endpoints are not vertices are ignored.
+
+def make_wiki_graph(ids, names, sources, targets, types=None):
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    names = [names[i] for i in order]
+    sources = vertex_id_indices(ids, sources)
+    targets = vertex_id_indices(ids, targets)
+    if types is None:
+        types = np.zeros(len(sources), dtype=np.uint8)
+    types = np.asarray(types, dtype=np.uint8)
+    valid = (sources >= 0) & (targets >= 0)
+    return make_csr_graph(ids, names, sources[valid], targets[valid],
+                          types[valid])
+
+#------------------------------------------------------------------------------
+
+# Converts wiki_vertices ids to dense indices. Unknown ids map to -1.
+
+def vertex_id_indices(ids, vertex_ids):
+    vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+    indices = np.searchsorted(ids, vertex_ids)
+    indices = np.minimum(indices, max(len(ids) - 1, 0))
+    found = ids[indices] == vertex_ids if len(ids) > 0 else \
+            np.zeros(len(vertex_ids), dtype=bool)
+    return np.where(found, indices, -1).astype(np.int32)
+
+#------------------------------------------------------------------------------
+# Synthetic Graphs
+#------------------------------------------------------------------------------
+
+# Draws <size> ranks in [0, n) by inverting the CDF of the continuous power
+# law with density proportional to x ** -exponent over [1, n+1).
+
+def power_law_ranks(rng, n, size, exponent):
+    u = rng.random(size)
+    if exponent == 1:
+        x = np.exp(u * np.log(n + 1))
+    else:
+        e = 1 - exponent
+        x = (1 + u * ((n + 1) ** e - 1)) ** (1 / e)
+    return np.minimum(x.astype(np.int64) - 1, n - 1)
+
+#------------------------------------------------------------------------------
+
+# Builds a random graph for benchmarks. Sources and targets are drawn
+# independently from a power law over the vertices (the probability of the
+# vertex of rank r is proportional to r ** -exponent), so that, as in
+# Wikipedia, a few hubs have very large in and out degrees. A fraction
+# <reciprocal> of the edges also get their reverse edge, both typed
+# 'strongly related'; the others are typed DEFAULT_EDGE_TYPE.
+
+def make_random_wiki_graph(vertex_count, edge_count, exponent=0.8,
+                           reciprocal=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = rng.permutation(vertex_count)
+    sources = labels[power_law_ranks(rng, vertex_count, edge_count, exponent)]
+    targets = labels[power_law_ranks(rng, vertex_count, edge_count, exponent)]
+    keep = sources != targets
+    sources = sources[keep]
+    targets = targets[keep]
+    types = np.full(len(sources), edge_type_code(DEFAULT_EDGE_TYPE), dtype=np.uint8)
+    mutual = rng.random(len(sources)) < reciprocal
+    types[mutual] = edge_type_code('strongly related')
+    sources, targets = np.concatenate([sources, targets[mutual]]), \
+                       np.concatenate([targets, sources[mutual]])
+    types = np.concatenate([types, types[mutual]])
+    names = ['Topic_' + str(i) for i in range(vertex_count)]
+    return make_csr_graph(np.arange(1, vertex_count + 1), names,
+                          sources, targets, types)
+
+#*****************************************************************************
+# Part 3: Loading the Graph from WikiDB
+#*****************************************************************************
+
+# Tables are read with COPY ... TO STDOUT, which is much faster than
+# fetching rows through a cursor.
+
+def copy_query_to_df(query, columns, conn, dtype=None):
+    buffer = io.StringIO()
+    cur = conn.cursor()
+    cur.copy_expert("COPY (" + query + ") TO STDOUT WITH CSV", buffer)
+    buffer.seek(0)
+    return pd.read_csv(buffer, header=None, names=columns, dtype=dtype,
+                       keep_default_na=False)
+
+#------------------------------------------------------------------------------
+
+def load_wiki_vertices(conn=None):
+    with wikidb_connection(conn) as conn:
+        df = copy_query_to_df("SELECT id, name FROM " + VERTICES_TABLE + \
+                              " ORDER BY id", ['id', 'name'], conn,
+                              dtype={'id' : np.int64, 'name' : object})
+    return df['id'].to_numpy(), list(df['name'])
+
+#------------------------------------------------------------------------------
+
+# Returns the edges of one edge table as dense index arrays.
+
+def load_wiki_edge_table(edge_table, ids, conn=None):
+    with wikidb_connection(conn) as conn:
+        df = copy_query_to_df("SELECT source, target, type FROM " + edge_table,
+                              ['source', 'target', 'type'], conn,
+                              dtype={'source' : np.int64, 'target' : np.int64,
+                                     'type' : object})
+    sources = vertex_id_indices(ids, df['source'].to_numpy())
+    targets = vertex_id_indices(ids, df['target'].to_numpy())
+    types = edge_type_codes(df['type'])
+    valid = (sources >= 0) & (targets >= 0)
+    return sources[valid], targets[valid], types[valid]
+
+#------------------------------------------------------------------------------
+
+def load_wiki_graph(conn=None, tables=None, verbose=True):
+    if tables is None:
+        tables = edge_partitions()
+    with wikidb_connection(conn) as conn:
+        ids, names = load_wiki_vertices(conn)
+        if verbose:
+            print ("Loaded " + str(len(ids)) + " vertices.")
+        all_sources, all_targets, all_types = [], [], []
+        for edge_table in tables:
+            sources, targets, types = load_wiki_edge_table(edge_table, ids, conn)
+            all_sources.append(sources)
+            all_targets.append(targets)
+            all_types.append(types)
+            if verbose:
+                print ("Loaded " + str(len(sources)) + " edges from " + edge_table)
+    sources = np.concatenate(all_sources) if all_sources else np.zeros(0, np.int32)
+    targets = np.concatenate(all_targets) if all_targets else np.zeros(0, np.int32)
+    types = np.concatenate(all_types) if all_types else np.zeros(0, np.uint8)
+    del all_sources, all_targets, all_types
+    graph = make_csr_graph(ids, names, sources, targets, types)
+    if verbose:
+        print ("Graph snapshot: " + str(graph.vertex_count()) + " vertices, " + \
+               str(graph.edge_count()) + " edges, " + \
+               str(round(graph.nbytes() / 2**20, 1)) + " MB of arrays.")
+    return graph
+
+#*****************************************************************************
+# Part 4: On-Disk Graph Format
+#*****************************************************************************
+
+# A snapshot is exported once to a single binary file which every process
+# (server workers, the Process() children used for in-neighbor and distance
+# matrix computations) opens with np.memmap. Opening costs a few
+# milliseconds and all the processes share one copy in the page cache.
+#
+# Layout (all integers little endian):
+#
+#   Header, GRAPH_HEADER_SIZE bytes:
+#     magic          8 bytes, GRAPH_MAGIC
+#     version        uint32, GRAPH_FORMAT_VERSION
+#     section count  uint32
+#     vertex count   uint64
+#     edge count     uint64
+#     then, for each section of GRAPH_SECTIONS, its offset and size in
+#     bytes as two uint64.
+#
+#   Sections, each starting on a GRAPH_ALIGNMENT byte boundary:
+#     ids           int32[n]    wiki_vertices ids in ascending order
+#     name_offsets  int64[n+1]  offsets of the names in name_bytes
+#     name_bytes    uint8[]     UTF-8 encoded names, back to back
+#     name_order    int32[n]    vertices sorted by lower cased name
+#     out_offsets   int64[n+1]
+#     out_targets   int32[m]
+#     out_types     uint8[m]
+#     in_offsets    int64[n+1]
+#     in_sources    int32[m]
+#     in_types      uint8[m]
+
+GRAPH_MAGIC = b'WIKIGRPH'
+GRAPH_FORMAT_VERSION = 1
+GRAPH_HEADER_SIZE = 512
+GRAPH_ALIGNMENT = 64
+
+GRAPH_SECTIONS = [('ids', '<i4'),
+                  ('name_offsets', '<i8'),
+                  ('name_bytes', 'u1'),
+                  ('name_order', '<i4'),
+                  ('out_offsets', '<i8'),
+                  ('out_targets', '<i4'),
+                  ('out_types', 'u1'),
+                  ('in_offsets', '<i8'),
+                  ('in_sources', '<i4'),
+                  ('in_types', 'u1')]
+
+GRAPH_FILENAME = 'wikigraph.bin'
+
+#------------------------------------------------------------------------------
+
+# NB: This is None when the PYBAR_DIR environment variable is not set.
+
+def wiki_graph_pathname():
+    if PYBAR_DIR is None:
+        return None
+    return make_data_pathname(GRAPH_FILENAME)
+
+#------------------------------------------------------------------------------
+# Name Table
+#------------------------------------------------------------------------------
+
+# Vertex names stored as a UTF-8 blob. Names are decoded on access and
+# looked up by binary search over <order>, the vertices sorted by lower
+# cased name, so nothing has to be built when the file is opened. It can
+# be used both as WikiGraph.names and as WikiGraph.name_index.
+
+class NameTable:
+
+    def __init__(self, offsets, blob, order):
+        self.offsets = offsets
+        self.blob = blob
+        self.order = order
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start = self.offsets[index]
+        end = self.offsets[index+1]
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+    # Returns the index of the vertex whose lower cased name is <key>.
+    def get(self, key, default=None):
+        low = 0
+        high = len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            if self[self.order[middle]].lower() < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.order):
+            index = int(self.order[low])
+            if self[index].lower() == key:
+                return index
+        return default
+
+#------------------------------------------------------------------------------
+
+# Returns name_offsets, name_bytes and name_order for a list of names.
+# The sort is stable so that, as in make_name_index(), the vertex with the
+# smallest id wins when names only differ in case.
+
+def encode_names(names):
+    encoded = [(name if isinstance(name, str) else '').encode('utf-8') \
+               for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)),
+              out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    lowered = [name.decode('utf-8').lower() for name in encoded]
+    order = np.array(sorted(range(len(lowered)), key=lowered.__getitem__),
+                     dtype=np.int32)
+    return offsets, blob, order
+
+#------------------------------------------------------------------------------
+# Saving a Graph
+#------------------------------------------------------------------------------
+
+def align(position):
+    return (position + GRAPH_ALIGNMENT - 1) // GRAPH_ALIGNMENT * GRAPH_ALIGNMENT
+
+#------------------------------------------------------------------------------
+
+# The file is written next to <pathname> and then renamed, so processes
+# that have the previous snapshot mapped keep a consistent view.
+
+def save_wiki_graph(graph, pathname=None):
+    if pathname is None:
+        pathname = wiki_graph_pathname()
+    if pathname is None:
+        raise ValueError("No pathname given and PYBAR_DIR is not set.")
+    name_offsets, name_bytes, name_order = encode_names(graph.names)
+    arrays = {'ids' : graph.ids,
+              'name_offsets' : name_offsets,
+              'name_bytes' : name_bytes,
+              'name_order' : name_order,
+              'out_offsets' : graph.out_offsets,
+              'out_targets' : graph.out_targets,
+              'out_types' : graph.out_types,
+              'in_offsets' : graph.in_offsets,
+              'in_sources' : graph.in_sources,
+              'in_types' : graph.in_types}
+    # Lay out the sections
+    sections = []
+    position = GRAPH_HEADER_SIZE
+    for name, dtype in GRAPH_SECTIONS:
+        array = np.ascontiguousarray(arrays[name], dtype=dtype)
+        sections.append((array, position))
+        position = align(position + array.nbytes)
+    header = GRAPH_MAGIC + struct.pack('<IIQQ', GRAPH_FORMAT_VERSION,
+                                       len(GRAPH_SECTIONS),
+                                       graph.vertex_count(), graph.edge_count())
+    for array, offset in sections:
+        header += struct.pack('<QQ', offset, array.nbytes)
+    # Write the file
+    temp_pathname = pathname + '.tmp'
+    with open(temp_pathname, 'wb') as f:
+        f.write(header.ljust(GRAPH_HEADER_SIZE, b'\0'))
+        for array, offset in sections:
+            f.seek(offset)
+            array.tofile(f)
+        f.truncate(position)
+    os.replace(temp_pathname, pathname)
+    return pathname
+
+#------------------------------------------------------------------------------
+# Opening a Graph
+#------------------------------------------------------------------------------
+
+def read_graph_header(data):
+    header = bytes(data[:GRAPH_HEADER_SIZE])
+    if header[:8] != GRAPH_MAGIC:
+        raise ValueError("Not a wiki graph file.")
+    version, section_count, vertex_count, edge_count = \
+        struct.unpack_from('<IIQQ', header, 8)
+    if version != GRAPH_FORMAT_VERSION:
+        raise ValueError("Unsupported wiki graph format version: " + str(version))
+    sections = []
+    for i in range(section_count):
+        sections.append(struct.unpack_from('<QQ', header, 32 + 16 * i))
+    return vertex_count, edge_count, sections
+
+#------------------------------------------------------------------------------
+
+# Maps the file read only. The arrays of the returned WikiGraph are views
+# on the mapping, so pages are only read when they are first touched.
+
+def open_wiki_graph(pathname=None):
+    if pathname is None:
+        pathname = wiki_graph_pathname()
+    data = np.memmap(pathname, dtype=np.uint8, mode='r')
+    vertex_count, edge_count, sections = read_graph_header(data)
+    arrays = {}
+    for (name, dtype), (offset, size) in zip(GRAPH_SECTIONS, sections):
+        dtype = np.dtype(dtype)
+        arrays[name] = np.ndarray((size // dtype.itemsize,), dtype=dtype,
+                                  buffer=data, offset=offset)
+    names = NameTable(arrays['name_offsets'], arrays['name_bytes'],
+                      arrays['name_order'])
+    return WikiGraph(arrays['ids'], names,
+                     arrays['out_offsets'], arrays['out_targets'],
+                     arrays['out_types'],
+                     arrays['in_offsets'], arrays['in_sources'],
+                     arrays['in_types'],
+                     name_index=names)
+
+#------------------------------------------------------------------------------
+# Exporting WikiDB
+#------------------------------------------------------------------------------
+
+def export_wiki_graph(pathname=None, conn=None):
+    graph = load_wiki_graph(conn)
+    pathname = save_wiki_graph(graph, pathname)
+    print ("Saved graph snapshot to " + pathname)
+    return pathname
+
+#------------------------------------------------------------------------------
+# Process-wide Snapshot
+#------------------------------------------------------------------------------
+
+# Opens the exported snapshot when there is one, otherwise loads the graph
+# from WikiDB.
+
+_GRAPH = None
+
+def get_wiki_graph(reload=False, pathname=None):
+    global _GRAPH
+    if _GRAPH is None or reload:
+        if pathname is None:
+            pathname = wiki_graph_pathname()
+        if pathname is not None and os.path.exists(pathname):
+            _GRAPH = open_wiki_graph(pathname)
+        else:
+            _GRAPH = load_wiki_graph()
+    return _GRAPH
+
+#*****************************************************************************
+# Part 5: Main Runtime
+#*****************************************************************************
+
+# Exports WikiDB to the on-disk graph format:
+#
+#   python -m src.graph export [<pathname>]
+
+def main():
+    args = sys.argv
+    if len(args) < 2 or args[1] != 'export':
+        print ("Usage: python -m src.graph export [<pathname>]")
+        return False
+    pathname = args[2] if len(args) > 2 else None
+    export_wiki_graph(pathname)
+    return True
+
+#------------------------------------------------------------------------------
+
+if __name__== "__main__":
+  main()
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
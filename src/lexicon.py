@@ -20,6 +20,8 @@ from src.scraper import get_url_response
 from src.scraper import get_url_data
 from src.database import find_topic
 from src.database import find_topic_out_neighbors
+from src.database import find_out_neighbors_batch
+from src.database import find_vertex_names
 from src.database import find_edges
 from src.database import find_dictionary_word
 from src.database import find_undefined_words
@@ -342,13 +344,16 @@ TOPICS = ['Medecine',
 def find_new_words(topics=TOPICS):
     unknown = []
     count = 0
-    for topic in topics:
-        if find_topic(topic) is not None:
-            candidates = find_topic_out_neighbors(topic)
-            candidates = [topic] + candidates
-            uw, count= find_new_words_from_topics(candidates, count)
-            unknown += uw
-    return uw, count
+    neighbors = find_out_neighbors_batch(topics)
+    names = find_vertex_names(list(neighbors.keys()) + \
+                              [int(x) for ids in neighbors.values() for x in ids])
+    for topic_id, neighbor_ids in neighbors.items():
+        candidates = list(dict.fromkeys([names[x] for x in neighbor_ids.tolist() \
+                                         if x in names]))
+        candidates = [names[topic_id]] + candidates
+        uw, count= find_new_words_from_topics(candidates, count)
+        unknown += uw
+    return unknown, count
                 
 
 #********************************************************************
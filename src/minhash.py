@@ -0,0 +1,466 @@
+#*****************************************************************************
+# MINHASH INDEX
+#*****************************************************************************
+#
+# Part 1: MinHash Signatures
+# Part 2: LSH Index
+# Part 3: Similar Topics
+# Part 4: Saving and Loading
+# Part 5: Main Runtime
+#
+#*****************************************************************************
+
+# Approximate Jaccard similarity of the out neighbor sets of the topics.
+# Every topic with out neighbors gets a MinHash signature, and a banded
+# locality sensitive hashing (LSH) index over the signatures finds the
+# topics likely to be similar to a given one without comparing it to all
+# the others. This answers "which topics link to mostly the same topics as
+# Elephant" in well under a millisecond, where clustering.jaccard_index()
+# needs the neighbors of every candidate.
+#
+# Memory is about 450 bytes per indexed topic with the default 64
+# signatures and 16 bands.
+
+import os
+import sys
+import time
+import numpy as np
+
+# Project Imports
+from src.caches import hash_int64
+from src.database import wikidb_connection
+from src.database import find_topic_id
+from src.database import find_vertex_names
+from src.database import find_out_neighbors_batch
+from src.database import add_edge_listener
+from src.database import remove_edge_listener
+from src.graph import get_wiki_graph
+from src.utils import PYBAR_DIR, make_data_pathname
+
+#------------------------------------------------------------------------------
+
+DEFAULT_NUM_PERM = 64
+DEFAULT_BANDS = 16
+DEFAULT_THRESHOLD = 0.5
+
+# Buckets holding more topics than this are skipped by queries; they come
+# from tiny neighbor sets shared by many topics.
+MAX_BUCKET_SIZE = 1000
+
+# Number of edges hashed at once when computing signatures in bulk.
+SIGNATURE_CHUNK_SIZE = 4000000
+
+# The sorted bands are rebuilt once this fraction of the topics has been
+# updated since the last build.
+REBUILD_FRACTION = 0.01
+
+EMPTY_SIGNATURE = np.uint32(0xFFFFFFFF)
+
+MINHASH_FILENAME = 'minhash.npz'
+
+#*****************************************************************************
+# Part 1: MinHash Signatures
+#*****************************************************************************
+
+# Signature i of a set of vertex ids is the minimum over its elements x of
+# h_i(x) = ((h(x) ^ a_i) * b_i) >> 32, where h is the splitmix64 hash of x
+# and a_i, b_i (odd) are drawn from <seed>. Two sets agree on signature i
+# with a probability close to their Jaccard index.
+
+def permutation_parameters(num_perm, seed=0):
+    rng = np.random.default_rng(seed)
+    masks = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+    multipliers = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + \
+                  np.uint64(1)
+    return masks, multipliers
+
+#------------------------------------------------------------------------------
+
+# The signatures of each element of <elements>, as a (len(elements),
+# num_perm) array.
+
+def element_signatures(elements, masks, multipliers):
+    base = hash_int64(elements)
+    with np.errstate(over='ignore'):
+        values = ((base[:, None] ^ masks[None, :]) * multipliers[None, :]) >> np.uint64(32)
+    return values.astype(np.uint32)
+
+#------------------------------------------------------------------------------
+
+# The signatures of the sets given in CSR form, none of them empty, one row
+# per set. Rows are processed in chunks of about <chunk_size> elements.
+
+def minhash_signatures(offsets, elements, masks, multipliers,
+                       chunk_size=SIGNATURE_CHUNK_SIZE):
+    n = len(offsets) - 1
+    signatures = np.empty((n, len(masks)), dtype=np.uint32)
+    start = 0
+    while start < n:
+        end = int(np.searchsorted(offsets, offsets[start] + chunk_size, side='right')) - 1
+        end = min(max(end, start + 1), n)
+        first, last = offsets[start], offsets[end]
+        base = hash_int64(elements[first:last])
+        starts = offsets[start:end] - first
+        with np.errstate(over='ignore'):
+            for i in range(len(masks)):
+                values = ((base ^ masks[i]) * multipliers[i]) >> np.uint64(32)
+                signatures[start:end, i] = np.minimum.reduceat(values, starts)
+        start = end
+    return signatures
+
+#------------------------------------------------------------------------------
+
+# The LSH keys of <signatures>: the signatures are split into <bands> bands
+# of consecutive values and each band is hashed to a uint64.
+
+def band_keys(signatures, bands):
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    values = signatures.reshape(n, bands, rows)
+    keys = np.zeros((n, bands), dtype=np.uint64)
+    for r in range(rows):
+        keys = hash_int64((keys ^ values[:, :, r]).ravel(), r).reshape(n, bands)
+    return keys
+
+#*****************************************************************************
+# Part 2: LSH Index
+#*****************************************************************************
+
+# <ids> are the vertex ids of the rows of <signatures>, in ascending order.
+# For each band the keys of all the rows are sorted, so the rows sharing a
+# bucket with a topic are found with two binary searches per band.
+#
+# Updates change the signatures in place. The rows they touch are tracked
+# as dirty, with their current keys, and matched by a scan on queries until
+# the next build(); their stale entries in the sorted bands only add
+# candidates, which are all checked against the signatures. Vertices added
+# since the last build are appended after the sorted ids.
+
+class MinHashIndex:
+
+    def __init__(self, ids, signatures, bands=DEFAULT_BANDS, seed=0,
+                 band_order=None, sorted_keys=None):
+        if signatures.shape[1] % bands != 0:
+            raise ValueError("The number of bands, " + str(bands) + \
+                             ", must divide the signature size, " + \
+                             str(signatures.shape[1]))
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.signatures = signatures
+        self.bands = bands
+        self.seed = seed
+        self.masks, self.multipliers = permutation_parameters(signatures.shape[1], seed)
+        if band_order is None:
+            self.build()
+        else:
+            self.band_order = band_order
+            self.sorted_keys = sorted_keys
+            self.reset_updates()
+
+    def reset_updates(self):
+        self.sorted_count = len(self.ids)
+        self.new_rows = {}
+        self.dirty = set()
+        self.dirty_rows = np.zeros(0, dtype=np.int64)
+        self.dirty_keys = np.zeros((0, self.bands), dtype=np.uint64)
+
+    def build(self):
+        order = np.argsort(self.ids, kind='stable')
+        self.ids = self.ids[order]
+        self.signatures = self.signatures[order]
+        keys = band_keys(self.signatures, self.bands)
+        band_order = np.argsort(keys, axis=0, kind='stable')
+        self.sorted_keys = np.ascontiguousarray(np.take_along_axis(keys, band_order, 0).T)
+        self.band_order = np.ascontiguousarray(band_order.T.astype(np.int32))
+        self.reset_updates()
+
+    def vertex_count(self):
+        return len(self.ids)
+
+    def nbytes(self):
+        return self.ids.nbytes + self.signatures.nbytes + \
+               self.band_order.nbytes + self.sorted_keys.nbytes
+
+    #--------------------------------------------------------------------------
+    # Rows
+
+    # The row of <vertex_id>, or None.
+    def row(self, vertex_id):
+        row = self.new_rows.get(vertex_id)
+        if row is not None:
+            return row
+        position = int(np.searchsorted(self.ids[:self.sorted_count], vertex_id))
+        if position < self.sorted_count and self.ids[position] == vertex_id:
+            return position
+        return None
+
+    def ensure_rows(self, vertex_ids):
+        rows = [self.row(int(x)) for x in vertex_ids]
+        new_ids = sorted(set([int(x) for x, row in zip(vertex_ids, rows) if row is None]))
+        if new_ids != []:
+            first = len(self.ids)
+            self.ids = np.concatenate([self.ids, np.array(new_ids, dtype=np.int64)])
+            self.signatures = np.concatenate(
+                [self.signatures,
+                 np.full((len(new_ids), self.signatures.shape[1]), EMPTY_SIGNATURE)])
+            for i, vertex_id in enumerate(new_ids):
+                self.new_rows[vertex_id] = first + i
+            rows = [self.row(int(x)) for x in vertex_ids]
+        return np.array(rows, dtype=np.int64)
+
+    def mark_dirty(self, rows):
+        self.dirty.update(np.asarray(rows).tolist())
+        if len(self.dirty) > REBUILD_FRACTION * self.sorted_count:
+            self.build()
+        else:
+            self.dirty_rows = np.array(sorted(self.dirty), dtype=np.int64)
+            self.dirty_keys = band_keys(self.signatures[self.dirty_rows], self.bands)
+
+    #--------------------------------------------------------------------------
+    # Updates
+
+    # Adds the edges source -> target to the sets of the sources. MinHash
+    # signatures only decrease as elements are added, so this needs nothing
+    # but the signatures of the new targets.
+    def add_edges(self, source_ids, target_ids):
+        if len(source_ids) == 0:
+            return
+        rows = self.ensure_rows(source_ids)
+        values = element_signatures(target_ids, self.masks, self.multipliers)
+        np.minimum.at(self.signatures, rows, values)
+        self.mark_dirty(np.unique(rows))
+
+    # Replaces the sets of <vertex_ids> with <neighbor_lists>.
+    def set_neighbors(self, vertex_ids, neighbor_lists):
+        rows = self.ensure_rows(vertex_ids)
+        for row, neighbors in zip(rows, neighbor_lists):
+            if len(neighbors) > 0:
+                self.signatures[row] = element_signatures(
+                    neighbors, self.masks, self.multipliers).min(axis=0)
+            else:
+                self.signatures[row] = EMPTY_SIGNATURE
+        self.mark_dirty(rows)
+
+    # Edge listener (see database.add_edge_listener()). Listeners are
+    # called once the change has committed, so the sets of the sources of
+    # deleted edges can be read again from any connection.
+    def on_edges(self, event, source_ids, target_ids):
+        if event == 'add':
+            self.add_edges(source_ids, target_ids)
+        elif event == 'delete':
+            sources = np.unique(source_ids).tolist()
+            neighbors = find_out_neighbors_batch(sources)
+            empty = np.zeros(0, dtype=np.int64)
+            self.set_neighbors(sources, [neighbors.get(x, empty) for x in sources])
+
+    #--------------------------------------------------------------------------
+    # Queries
+
+    # The rows sharing at least one bucket with <row>.
+    def candidates(self, row):
+        keys = band_keys(self.signatures[row][None, :], self.bands)[0]
+        found = []
+        for band in range(self.bands):
+            sorted_keys = self.sorted_keys[band]
+            low = sorted_keys.searchsorted(keys[band])
+            high = sorted_keys.searchsorted(keys[band], side='right')
+            if 0 < high - low <= MAX_BUCKET_SIZE:
+                found.append(self.band_order[band, low:high])
+        if len(self.dirty_rows) > 0:
+            found.append(self.dirty_rows[(self.dirty_keys == keys).any(axis=1)])
+        if found == []:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.unique(np.concatenate(found))
+        return candidates[candidates != row]
+
+    # Returns the rows whose estimated Jaccard index with <row> is at least
+    # <threshold>, best first, and the estimates.
+    def similar(self, row, threshold=DEFAULT_THRESHOLD, k=20):
+        signature = self.signatures[row]
+        if signature[0] == EMPTY_SIGNATURE and (signature == EMPTY_SIGNATURE).all():
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        candidates = self.candidates(row)
+        signatures = self.signatures[candidates]
+        estimates = (signatures == signature).mean(axis=1)
+        keep = (estimates >= threshold) & (signatures != EMPTY_SIGNATURE).any(axis=1)
+        candidates, estimates = candidates[keep], estimates[keep]
+        order = np.argsort(-estimates, kind='stable')[:k]
+        return candidates[order], estimates[order]
+
+#------------------------------------------------------------------------------
+# Building the Index
+#------------------------------------------------------------------------------
+
+# Computes the signatures of the out neighbor sets of all the topics of
+# <graph> with at least <min_neighbors> out neighbors. The elements are
+# vertex ids rather than graph indices, so that signatures stay valid
+# across snapshots and can be updated from WikiDB.
+
+def build_minhash_index(graph=None, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS,
+                        min_neighbors=1, seed=0, verbose=True):
+    start = time.perf_counter()
+    if graph is None:
+        graph = get_wiki_graph()
+    degrees = graph.outdegrees()
+    selected = degrees >= max(min_neighbors, 1)
+    edges = np.repeat(selected, degrees)
+    elements = np.asarray(graph.ids, dtype=np.int64)[graph.out_targets[edges]]
+    offsets = np.zeros(int(selected.sum()) + 1, dtype=np.int64)
+    np.cumsum(degrees[selected], out=offsets[1:])
+    masks, multipliers = permutation_parameters(num_perm, seed)
+    signatures = minhash_signatures(offsets, elements, masks, multipliers)
+    if verbose:
+        print ("MinHash: " + str(len(signatures)) + " signatures computed in " + \
+               str(round(time.perf_counter() - start, 2)) + "s")
+    index = MinHashIndex(np.asarray(graph.ids)[selected], signatures, bands, seed)
+    if verbose:
+        print ("MinHash: index of " + str(round(index.nbytes() / 2**20, 1)) + \
+               " MB built in " + str(round(time.perf_counter() - start, 2)) + "s")
+    return index
+
+#*****************************************************************************
+# Part 3: Similar Topics
+#*****************************************************************************
+
+# The process-wide index is read from the saved file when there is one and
+# built from the graph snapshot otherwise. It follows the edges added and
+# deleted by this process; only the current index is registered as an
+# edge listener.
+
+_INDEX = None
+
+def get_minhash_index(reload=False, pathname=None):
+    global _INDEX
+    if _INDEX is None or reload:
+        # The replaced index must stop following the edges.
+        if _INDEX is not None:
+            remove_edge_listener(_INDEX.on_edges)
+        if pathname is None:
+            pathname = minhash_index_pathname()
+        if pathname is not None and os.path.exists(pathname):
+            _INDEX = load_minhash_index(pathname)
+        else:
+            _INDEX = build_minhash_index()
+        add_edge_listener(_INDEX.on_edges)
+    return _INDEX
+
+#------------------------------------------------------------------------------
+
+# Returns the vertex ids of the topics whose out neighbors are estimated to
+# be at least <threshold> similar to those of <vertex_id>, best first, with
+# the estimates.
+
+def find_similar_vertex_ids(vertex_id, threshold=DEFAULT_THRESHOLD, k=20, index=None):
+    if index is None:
+        index = get_minhash_index()
+    row = index.row(vertex_id)
+    if row is None:
+        return []
+    rows, estimates = index.similar(row, threshold, k)
+    return list(zip(index.ids[rows].tolist(), estimates.tolist()))
+
+#------------------------------------------------------------------------------
+
+# Same as above for topic names: returns (name, estimated Jaccard index)
+# pairs.
+
+def find_similar_topics(topic_name, threshold=DEFAULT_THRESHOLD, k=20, index=None,
+                        conn=None):
+    with wikidb_connection(conn) as conn:
+        topic_id = find_topic_id(topic_name, conn)
+        if topic_id is None:
+            return []
+        similar = find_similar_vertex_ids(topic_id, threshold, k, index)
+        names = find_vertex_names([x for x, _ in similar], conn)
+    return [(names[x], estimate) for x, estimate in similar if x in names]
+
+#------------------------------------------------------------------------------
+
+# Times find_similar_vertex_ids() for <queries> random indexed topics.
+
+def benchmark_similar_topics(index=None, queries=1000, threshold=DEFAULT_THRESHOLD,
+                             seed=0):
+    if index is None:
+        index = get_minhash_index()
+    rng = np.random.default_rng(seed)
+    vertex_ids = index.ids[rng.integers(0, index.vertex_count(), queries)]
+    times = []
+    found = 0
+    for vertex_id in vertex_ids:
+        start = time.perf_counter()
+        similar = find_similar_vertex_ids(int(vertex_id), threshold, index=index)
+        times.append(time.perf_counter() - start)
+        found += len(similar)
+    times = np.array(times) * 1000
+    results = {'queries' : queries,
+               'mean_found' : found / queries,
+               'median_ms' : float(np.median(times)),
+               'p99_ms' : float(np.percentile(times, 99))}
+    print ("Similar topics: " + str(queries) + " queries, median " + \
+           str(round(results['median_ms'], 3)) + "ms, p99 " + \
+           str(round(results['p99_ms'], 3)) + "ms")
+    return results
+
+#*****************************************************************************
+# Part 4: Saving and Loading
+#*****************************************************************************
+
+# The index is saved with the sorted bands, so loading it is a read of the
+# arrays. Pending updates are folded in first.
+
+def minhash_index_pathname():
+    if PYBAR_DIR is None:
+        return None
+    return make_data_pathname(MINHASH_FILENAME)
+
+#------------------------------------------------------------------------------
+
+def save_minhash_index(index, pathname=None):
+    if pathname is None:
+        pathname = minhash_index_pathname()
+    if pathname is None:
+        raise ValueError("No pathname given and PYBAR_DIR is not set.")
+    if index.new_rows or index.dirty:
+        index.build()
+    # np.savez() would add the extension otherwise.
+    with open(pathname, 'wb') as f:
+        np.savez(f, ids=index.ids, signatures=index.signatures,
+                 band_order=index.band_order, sorted_keys=index.sorted_keys,
+                 bands=index.bands, seed=index.seed)
+    return pathname
+
+#------------------------------------------------------------------------------
+
+def load_minhash_index(pathname=None):
+    if pathname is None:
+        pathname = minhash_index_pathname()
+    with np.load(pathname) as data:
+        return MinHashIndex(data['ids'], data['signatures'], int(data['bands']),
+                            int(data['seed']), data['band_order'], data['sorted_keys'])
+
+#*****************************************************************************
+# Part 5: Main Runtime
+#*****************************************************************************
+
+# Builds the index from the graph snapshot and saves it:
+#
+#   python -m src.minhash build [<num_perm> <bands>]
+
+def main():
+    args = sys.argv
+    if len(args) < 2 or args[1] != 'build':
+        print ("Usage: python -m src.minhash build [<num_perm> <bands>]")
+        return False
+    num_perm = int(args[2]) if len(args) > 2 else DEFAULT_NUM_PERM
+    bands = int(args[3]) if len(args) > 3 else DEFAULT_BANDS
+    index = build_minhash_index(num_perm=num_perm, bands=bands)
+    print ("Saved MinHash index to " + save_minhash_index(index))
+    return True
+
+#------------------------------------------------------------------------------
+
+if __name__== "__main__":
+  main()
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -6,6 +6,10 @@
 # Python multithreading for whatever reason seems to require that the
 # workers be in a different module.
 
+import numpy as np
+import scipy.sparse as sp
+from multiprocessing.shared_memory import SharedMemory
+
 import src.database as db
 import src.clustering as cs
 
@@ -15,19 +19,41 @@ def pworker (fn, entries, pn, return_dict):
     result = map(fn, entries)
     return_dict[pn] = result
 
-#------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+
+# Distance matrix tile workers (see clustering.pgenerate_distance_matrix).
+# Each worker process attaches to the shared result matrix and rebuilds the
+# neighbor matrix once, in init_pdm_worker().
+
+_PDM_STATE = {}
+
+def init_pdm_worker (shm_name, n, indptr, indices, column_count):
+    shm = SharedMemory(name=shm_name)
+    _PDM_STATE['shm'] = shm
+    _PDM_STATE['result'] = np.ndarray((n, n), dtype=np.float32, buffer=shm.buf)
+    _PDM_STATE['matrix'] = sp.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), indices, indptr),
+        shape=(len(indptr) - 1, column_count))
+
+#------------------------------------------------------------------------------
 
-def neighbor_worker (topic, tables, procnum, return_dict):
-    results = db._find_topic_in_neighbors (topic, tables)
-    return_dict[procnum] = results
+def pdm_tile_worker (tile):
+    (i1, i2), (j1, j2) = tile
+    matrix = _PDM_STATE['matrix']
+    result = _PDM_STATE['result']
+    block = cs.jaccard_matrix(matrix[i1:i2], matrix[j1:j2])
+    result[i1:i2, j1:j2] = block
+    if i1 != j1:
+        result[j1:j2, i1:i2] = block.T
+    return tile
 
 #------------------------------------------------------------------------------
 
 # This used the dsitance matrix
 
 def pdm_worker (l1, l2, procnum, return_dict):
-    conn = ensure_connection()
-    m = cs.generate_distance_matrix (l1, l2, conn)
+    with db.wikidb_connection() as conn:
+        m = cs.generate_distance_matrix (l1, l2, conn)
     return_dict[procnum] = m
 
 #------------------------------------------------------------------------------
@@ -0,0 +1,405 @@
+#*****************************************************************************
+# TOPIC RANKING
+#*****************************************************************************
+#
+# Part 1: Sparse Matrix-Vector Products
+# Part 2: PageRank
+# Part 3: Related Topics
+# Part 4: Storing Scores
+# Part 5: Main Runtime
+#
+#*****************************************************************************
+
+# PageRank scores of the topics, computed by power iteration over the CSR
+# snapshot of the wiki graph (see graph.py), and stored in the pagerank
+# column of wiki_vertices so that ranking queries are plain ORDER BYs.
+
+import io
+import sys
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from concurrent.futures import ThreadPoolExecutor
+
+# Project Imports
+from src.database import wikidb_connection
+from src.database import VERTICES_TABLE
+from src.graph import get_wiki_graph
+from src.traversal import edge_type_mask
+from src.traversal import gather_neighbors
+
+#------------------------------------------------------------------------------
+
+DEFAULT_DAMPING = 0.85
+DEFAULT_TOLERANCE = 1e-6
+DEFAULT_MAX_ITERATIONS = 100
+
+DEFAULT_RESTART = 0.15
+DEFAULT_EPSILON = 1e-5
+DEFAULT_MAX_PUSHES = 2000000
+
+#*****************************************************************************
+# Part 1: Sparse Matrix-Vector Products
+#*****************************************************************************
+
+# The in-adjacency of the graph as a sparse matrix: row v holds the
+# in-neighbors of v, so that (M @ x)[v] is the sum of x over them. The
+# matrix shares the graph's in_sources array when no edge type filter is
+# given. Rows are split into <threads> blocks which are multiplied
+# concurrently; scipy releases the GIL in its sparse kernels.
+
+class InAdjacency:
+
+    def __init__(self, graph, edge_types=None, threads=1):
+        n = graph.vertex_count()
+        offsets = graph.in_offsets
+        sources = graph.in_sources
+        mask = edge_type_mask(edge_types)
+        if mask is not None:
+            keep = mask[graph.in_types]
+            sources = sources[keep]
+            kept = np.zeros(len(keep) + 1, dtype=np.int64)
+            np.cumsum(keep, out=kept[1:])
+            offsets = kept[offsets]
+        if len(sources) < 2**31:
+            offsets = offsets.astype(np.int32)
+        self.vertex_count = n
+        self.sources = sources
+        # Out degrees restricted to the edges kept.
+        self.outdegrees = np.bincount(sources, minlength=n)
+        self.threads = max(1, threads)
+        bounds = np.linspace(0, n, self.threads + 1).astype(np.int64)
+        self.blocks = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            first, last = offsets[start], offsets[end]
+            matrix = sp.csr_matrix((np.ones(last - first),
+                                    sources[first:last],
+                                    offsets[start:end+1] - first),
+                                   shape=(end - start, n), copy=False)
+            self.blocks.append((start, end, matrix))
+        self.executor = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+
+    def multiply(self, x, out=None):
+        if out is None:
+            out = np.empty(self.vertex_count)
+        def multiply_block(block):
+            start, end, matrix = block
+            out[start:end] = matrix @ x
+        if self.executor is None:
+            for block in self.blocks:
+                multiply_block(block)
+        else:
+            list(self.executor.map(multiply_block, self.blocks))
+        return out
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+#*****************************************************************************
+# Part 2: PageRank
+#*****************************************************************************
+
+# Power iteration for
+#
+#   x = damping * (M @ (x / outdegree) + dangling mass * p) + (1 - damping) * p
+#
+# where p is the teleport distribution: uniform for PageRank, concentrated
+# on the seed vertices for personalized PageRank. The mass of vertices
+# without out edges goes back to p. Stops when the L1 change of x falls
+# below <tolerance>. Returns the scores, which sum to 1, as an array
+# indexed like the graph's vertices.
+
+def pagerank(graph, damping=DEFAULT_DAMPING, tolerance=DEFAULT_TOLERANCE,
+             max_iterations=DEFAULT_MAX_ITERATIONS, personalization=None,
+             edge_types=None, threads=1, adjacency=None, verbose=False):
+    n = graph.vertex_count()
+    if n == 0:
+        return np.zeros(0)
+    own_adjacency = adjacency is None
+    if own_adjacency:
+        adjacency = InAdjacency(graph, edge_types, threads)
+    try:
+        if personalization is None:
+            teleport = np.full(n, 1.0 / n)
+        else:
+            teleport = np.asarray(personalization, dtype=np.float64)
+            teleport = teleport / teleport.sum()
+        outdegrees = adjacency.outdegrees
+        dangling = outdegrees == 0
+        inverse = np.where(dangling, 0.0, 1.0 / np.maximum(outdegrees, 1))
+        x = teleport.copy()
+        y = np.empty(n)
+        start = time.perf_counter()
+        for iteration in range(max_iterations):
+            adjacency.multiply(x * inverse, out=y)
+            y *= damping
+            y += (damping * x[dangling].sum() + 1 - damping) * teleport
+            delta = np.abs(y - x).sum()
+            x, y = y, x
+            if verbose:
+                print ("PageRank iteration " + str(iteration + 1) + \
+                       ": delta " + str(delta))
+            if delta < tolerance:
+                break
+        if verbose:
+            print ("PageRank: " + str(iteration + 1) + " iterations in " + \
+                   str(round(time.perf_counter() - start, 2)) + "s")
+        return x
+    finally:
+        if own_adjacency:
+            adjacency.close()
+
+#------------------------------------------------------------------------------
+
+# <seeds> is a list of vertex indices or a dictionary of vertex index to
+# weight.
+
+def personalized_pagerank(graph, seeds, damping=DEFAULT_DAMPING,
+                          tolerance=DEFAULT_TOLERANCE,
+                          max_iterations=DEFAULT_MAX_ITERATIONS,
+                          edge_types=None, threads=1, adjacency=None):
+    if not isinstance(seeds, dict):
+        seeds = {seed : 1.0 for seed in seeds}
+    personalization = np.zeros(graph.vertex_count())
+    for seed, weight in seeds.items():
+        personalization[seed] = weight
+    return pagerank(graph, damping, tolerance, max_iterations, personalization,
+                    edge_types, threads, adjacency)
+
+#------------------------------------------------------------------------------
+
+def top_k_indices(scores, k):
+    k = min(k, len(scores))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+#*****************************************************************************
+# Part 3: Related Topics
+#*****************************************************************************
+
+# Ranks the topics around a seed topic by random walk with restart, i.e.
+# personalized PageRank, computed locally with the push method of
+# Andersen, Chung and Lang instead of over the whole graph. Each vertex
+# holds an estimate and a residual; the seed starts with a residual of 1.
+# Every vertex whose residual exceeds epsilon times its degree keeps
+# <restart> of it as estimate and spreads the rest evenly over its
+# neighbors. All such vertices are pushed together at each round, and the
+# search ends when none is left, so only the vicinity of the seed is ever
+# touched. The estimates are within epsilon * degree of the exact scores.
+#
+# Estimates and residuals are sparse vectors: sorted index arrays with
+# parallel value arrays. The walk follows the edges in <direction>, by
+# default both ways, like topics.find_related_topics().
+
+class SparseVector:
+
+    def __init__(self, indices=None, values=None):
+        self.indices = np.zeros(0, dtype=np.int64) if indices is None else indices
+        self.values = np.zeros(0) if values is None else values
+
+    def __len__(self):
+        return len(self.indices)
+
+    # Adds <values> at <indices>, which can contain duplicates.
+    def add(self, indices, values):
+        indices = np.concatenate([self.indices, indices])
+        values = np.concatenate([self.values, values])
+        self.indices, inverse = np.unique(indices, return_inverse=True)
+        self.values = np.bincount(inverse, weights=values,
+                                  minlength=len(self.indices))
+
+    # Removes and returns the entries selected by the boolean <mask>.
+    def take(self, mask):
+        indices, values = self.indices[mask], self.values[mask]
+        self.indices, self.values = self.indices[~mask], self.values[~mask]
+        return indices, values
+
+#------------------------------------------------------------------------------
+
+# The degrees of the vertices <indices> over the edges of <csrs> that carry
+# the walk, i.e. those whose type is allowed by <type_mask> when given.
+
+def walk_degrees(csrs, indices, type_mask=None):
+    degrees = np.zeros(len(indices), dtype=np.int64)
+    for offsets, neighbors, types in csrs:
+        lengths = offsets[indices + 1] - offsets[indices]
+        if type_mask is None:
+            degrees += lengths
+        else:
+            kept = type_mask[gather_neighbors(offsets, types, types, indices)]
+            owners = np.repeat(np.arange(len(indices)), lengths)
+            degrees += np.bincount(owners[kept], minlength=len(indices))
+    return degrees
+
+#------------------------------------------------------------------------------
+
+# Returns the estimates as a SparseVector. The search also stops after
+# <max_pushes> edges have been traversed, or after <time_budget> seconds.
+
+def push_pagerank(graph, seeds, restart=DEFAULT_RESTART, epsilon=DEFAULT_EPSILON,
+                  direction='both', edge_types=None, max_pushes=DEFAULT_MAX_PUSHES,
+                  time_budget=None):
+    type_mask = edge_type_mask(edge_types)
+    csrs = []
+    if direction in ['out', 'both']:
+        csrs.append((graph.out_offsets, graph.out_targets, graph.out_types))
+    if direction in ['in', 'both']:
+        csrs.append((graph.in_offsets, graph.in_sources, graph.in_types))
+    if csrs == []:
+        raise ValueError("Invalid direction: " + str(direction))
+    seeds = np.unique(np.asarray(seeds, dtype=np.int64))
+    estimates = SparseVector()
+    residuals = SparseVector(seeds, np.full(len(seeds), 1.0 / len(seeds)))
+    start = time.perf_counter()
+    pushes = 0
+    while len(residuals) > 0:
+        degrees = walk_degrees(csrs, residuals.indices, type_mask)
+        active = residuals.values > epsilon * np.maximum(degrees, 1)
+        if not active.any():
+            break
+        degrees = degrees[active]
+        indices, values = residuals.take(active)
+        # Vertices without edges keep all of their residual.
+        estimates.add(indices, np.where(degrees > 0, restart * values, values))
+        spread = (1 - restart) * values / np.maximum(degrees, 1)
+        for offsets, neighbors, types in csrs:
+            lengths = offsets[indices + 1] - offsets[indices]
+            targets = gather_neighbors(offsets, neighbors, types, indices)
+            weights = np.repeat(spread, lengths)
+            if type_mask is not None:
+                # Only the edges of the selected types carry the walk.
+                kept = gather_neighbors(offsets, types, types, indices)
+                targets, weights = targets[type_mask[kept]], weights[type_mask[kept]]
+            residuals.add(targets, weights)
+            pushes += len(targets)
+        if pushes > max_pushes:
+            break
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            break
+    # The residual left at a vertex would give it at least <restart> of it.
+    estimates.add(residuals.indices, restart * residuals.values)
+    return estimates
+
+#------------------------------------------------------------------------------
+
+# Returns the <k> topics most related to <topic>, with their scores, as a
+# list of (topic name, score) pairs in decreasing order of score. Uses the
+# process-wide snapshot unless a graph is given. When <accept> is given only
+# the topics for which accept(name) is true are returned; more candidates
+# are looked at until <k> are accepted or none is left.
+
+def find_related_topic_scores(topic, k=20, restart=DEFAULT_RESTART,
+                              epsilon=DEFAULT_EPSILON, direction='both',
+                              edge_types=None, time_budget=None, graph=None,
+                              accept=None):
+    if graph is None:
+        graph = get_wiki_graph()
+    index = graph.ensure_index(topic)
+    if index is None:
+        return []
+    estimates = push_pagerank(graph, [index], restart, epsilon, direction,
+                              edge_types, time_budget=time_budget)
+    scores = np.where(estimates.indices == index, 0.0, estimates.values)
+    candidates = int((scores > 0).sum())
+    m = k
+    while True:
+        top = top_k_indices(scores, min(m, candidates))
+        related = [(graph.vertex_name(estimates.indices[i]), float(scores[i])) \
+                   for i in top]
+        if accept is not None:
+            related = [x for x in related if accept(x[0])]
+        if len(related) >= k or m >= candidates:
+            return related[:k]
+        m *= 2
+
+#*****************************************************************************
+# Part 4: Storing Scores
+#*****************************************************************************
+
+# Scores are copied into a temporary table and written with a single
+# UPDATE ... FROM.
+
+def ensure_pagerank_column(conn):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE " + VERTICES_TABLE + \
+                " ADD COLUMN IF NOT EXISTS pagerank double precision;")
+    cur.execute("CREATE INDEX IF NOT EXISTS wiki_vertices_pagerank ON " + \
+                VERTICES_TABLE + " (pagerank DESC NULLS LAST);")
+    conn.commit()
+
+#------------------------------------------------------------------------------
+
+def store_pagerank(graph, scores, conn=None):
+    with wikidb_connection(conn) as conn:
+        ensure_pagerank_column(conn)
+        cur = conn.cursor()
+        cur.execute("CREATE TEMP TABLE stage_pagerank (id integer, score double precision) " + \
+                    "ON COMMIT DROP;")
+        buffer = io.StringIO()
+        pd.DataFrame({'id' : graph.ids, 'score' : scores}).to_csv(
+            buffer, header=False, index=False, float_format='%.12g')
+        buffer.seek(0)
+        cur.copy_expert("COPY stage_pagerank (id, score) FROM STDIN WITH (FORMAT csv)",
+                        buffer)
+        cur.execute("UPDATE " + VERTICES_TABLE + " as wv SET pagerank = sp.score " + \
+                    "FROM stage_pagerank as sp WHERE wv.id = sp.id;")
+        count = cur.rowcount
+        conn.commit()
+    return count
+
+#------------------------------------------------------------------------------
+
+# Computes the PageRank of all the topics of the current snapshot and
+# stores it in wiki_vertices.
+
+def update_topics_pagerank(damping=DEFAULT_DAMPING, tolerance=DEFAULT_TOLERANCE,
+                           threads=1, graph=None, conn=None):
+    if graph is None:
+        graph = get_wiki_graph()
+    scores = pagerank(graph, damping, tolerance, threads=threads, verbose=True)
+    count = store_pagerank(graph, scores, conn)
+    print ("PageRank stored for " + str(count) + " topics")
+    return count
+
+#------------------------------------------------------------------------------
+
+# Returns the <k> topics with the highest stored PageRank as (name, score)
+# pairs.
+
+def find_top_topics(k=100, conn=None):
+    with wikidb_connection(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT name, pagerank FROM " + VERTICES_TABLE + \
+                    " WHERE pagerank IS NOT NULL " + \
+                    "ORDER BY pagerank DESC LIMIT %s;", (k,))
+        return cur.fetchall()
+
+#*****************************************************************************
+# Part 5: Main Runtime
+#*****************************************************************************
+
+# Computes and stores the PageRank of all the topics:
+#
+#   python -m src.ranking pagerank [<threads>]
+
+def main():
+    args = sys.argv
+    if len(args) < 2 or args[1] != 'pagerank':
+        print ("Usage: python -m src.ranking pagerank [<threads>]")
+        return False
+    threads = int(args[2]) if len(args) > 2 else 1
+    update_topics_pagerank(threads=threads)
+    return True
+
+#------------------------------------------------------------------------------
+
+if __name__== "__main__":
+  main()
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
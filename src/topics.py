@@ -4,8 +4,9 @@
 
 import nltk
 
-from src.database import find_wiki_in_neighbors 
-from src.database import find_wiki_out_neighbors
+from src.database import find_topic_in_neighbors as find_wiki_in_neighbors
+from src.database import find_topic_out_neighbors as find_wiki_out_neighbors
+from src.ranking import find_related_topic_scores
 
 #------------------------------------------------------------------------------
 # Filter Topics
@@ -15,9 +16,11 @@ from src.database import find_wiki_out_neighbors
 
 def filter_topics (source, topics):
     # list1 = [x for x in topics if ('#' + source.lower()) not in x.lower()]
-    list1 = [x for x in topics if '#' not in x.lower()]
-    list2 = [x for x in list1 if '_(' not in x]
-    return list(set(list2))
+    list1 = [x for x in topics if keep_topic_p(x)]
+    return list(set(list1))
+
+def keep_topic_p (topic):
+    return '#' not in topic and '_(' not in topic
 
 
 #------------------------------------------------------------------------------
@@ -38,6 +41,15 @@ def find_related_topics (topic_name):
     topics = find_in_topics(topic_name) + find_out_topics(topic_name)
     return list(set(topics))
 
+#------------------------------------------------------------------------------
+
+# Returns the <k> topics most related to topic_name as (topic, score) pairs,
+# best first, ranked by random walk with restart over the in-memory graph
+# (see ranking.find_related_topic_scores).
+
+def find_ranked_related_topics (topic_name, k=20, **kwargs):
+    return find_related_topic_scores(topic_name, k, accept=keep_topic_p, **kwargs)
+
 #------------------------------------------------------------------------------
 # SUBTOPICS
 #------------------------------------------------------------------------------
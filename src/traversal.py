@@ -0,0 +1,405 @@
+#*****************************************************************************
+# GRAPH TRAVERSAL
+#*****************************************************************************
+#
+# Part 1: Visited Sets
+# Part 2: Frontier Expansion
+# Part 3: K-Hop Neighborhoods
+# Part 4: Shortest Paths
+# Part 5: Benchmarks
+#
+#*****************************************************************************
+
+# Multi-hop queries over the in-memory WikiGraph (see graph.py). Instead of
+# one find_topic_out_neighbors() query per topic, a breadth first search
+# expands a whole frontier at a time: the neighbor slices of all the
+# frontier vertices are gathered from the CSR arrays with a few numpy
+# operations and filtered against a bitset of the vertices already seen.
+
+import time
+import itertools
+import numpy as np
+
+# Project Imports
+from src.graph import get_wiki_graph
+from src.graph import edge_type_codes
+
+#------------------------------------------------------------------------------
+
+DIRECTIONS = ['out', 'in', 'both']
+
+#*****************************************************************************
+# Part 1: Visited Sets
+#*****************************************************************************
+
+# A set of vertex indices stored as one bit per vertex, i.e. 2.5MB for
+# 20,000,000 vertices. Membership tests and insertions take arrays of
+# indices.
+
+class VisitedSet:
+
+    def __init__(self, vertex_count):
+        self.bits = np.zeros((vertex_count + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def contains(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        return ((self.bits[indices >> 3] >> (indices & 7)) & 1).astype(bool)
+
+    # <indices> must be unique and not already in the set.
+    def add(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        np.bitwise_or.at(self.bits, indices >> 3,
+                         np.left_shift(1, indices & 7).astype(np.uint8))
+        self.count += len(indices)
+
+#*****************************************************************************
+# Part 2: Frontier Expansion
+#*****************************************************************************
+
+# Returns the neighbors of all the vertices of <frontier> in one CSR
+# direction, keeping only the edges whose type is allowed by <type_mask>
+# (see edge_type_mask()) when it is given. The result can contain
+# duplicates.
+
+def gather_neighbors(offsets, neighbors, types, frontier, type_mask=None):
+    starts = offsets[frontier]
+    lengths = offsets[frontier + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=neighbors.dtype)
+    # Position of every gathered edge: the start of its slice plus its
+    # rank within the slice.
+    slice_starts = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - slice_starts, lengths) + np.arange(total)
+    if type_mask is None:
+        return neighbors[positions]
+    else:
+        return neighbors[positions[type_mask[types[positions]]]]
+
+#------------------------------------------------------------------------------
+
+# Returns the sorted unique neighbors of <frontier> in <direction>. Vertices
+# in <visited> are left out.
+
+def expand_frontier(graph, frontier, direction='out', type_mask=None,
+                    visited=None):
+    if direction not in DIRECTIONS:
+        raise ValueError("Invalid direction: " + str(direction))
+    frontier = np.asarray(frontier, dtype=np.int64)
+    parts = []
+    if direction in ['out', 'both']:
+        parts.append(gather_neighbors(graph.out_offsets, graph.out_targets,
+                                      graph.out_types, frontier, type_mask))
+    if direction in ['in', 'both']:
+        parts.append(gather_neighbors(graph.in_offsets, graph.in_sources,
+                                      graph.in_types, frontier, type_mask))
+    candidates = np.concatenate(parts)
+    if visited is not None:
+        candidates = candidates[~visited.contains(candidates)]
+    # Sorting is cheaper than a pass over all the vertices unless the
+    # candidates are a sizeable fraction of them.
+    n = graph.vertex_count()
+    if len(candidates) * 32 < n:
+        return np.unique(candidates)
+    else:
+        marks = np.zeros(n, dtype=bool)
+        marks[candidates] = True
+        return np.flatnonzero(marks)
+
+#------------------------------------------------------------------------------
+
+# <edge_types> is a list of edge type names, e.g. ['strongly related'], or
+# None for all the edges. Returns a lookup table indexed by edge type code.
+
+def edge_type_mask(edge_types):
+    if edge_types is None:
+        return None
+    if isinstance(edge_types, str):
+        edge_types = [edge_types]
+    mask = np.zeros(256, dtype=bool)
+    mask[edge_type_codes(list(edge_types))] = True
+    return mask
+
+#*****************************************************************************
+# Part 3: K-Hop Neighborhoods
+#*****************************************************************************
+
+# Breadth first search from the vertex indices <sources> up to <k> hops.
+# Returns two parallel arrays: the indices of the vertices reached and
+# their distance in hops, sources included at distance 0. When <max_nodes>
+# is given the search stops once that many vertices have been reached; the
+# last level is then truncated, keeping the lowest indices.
+
+def k_hop_indices(graph, sources, k=2, direction='out', edge_types=None,
+                  max_nodes=None):
+    type_mask = edge_type_mask(edge_types)
+    frontier = np.unique(np.asarray(sources, dtype=np.int64))
+    if max_nodes is not None:
+        frontier = frontier[:max_nodes]
+    visited = VisitedSet(graph.vertex_count())
+    visited.add(frontier)
+    levels = [frontier]
+    for hop in range(1, k + 1):
+        if len(frontier) == 0:
+            break
+        if max_nodes is not None and len(visited) >= max_nodes:
+            break
+        frontier = expand_frontier(graph, frontier, direction, type_mask, visited)
+        if max_nodes is not None:
+            frontier = frontier[:max_nodes - len(visited)]
+        visited.add(frontier)
+        levels.append(frontier)
+    indices = np.concatenate(levels)
+    hops = np.repeat(np.arange(len(levels)), [len(x) for x in levels])
+    return indices, hops
+
+#------------------------------------------------------------------------------
+
+# Returns a dictionary of topic name to distance in hops for the topics
+# within <k> hops of <topic>, the topic itself excluded. <direction> is
+# 'out', 'in' or 'both'. Uses the process-wide snapshot unless a graph is
+# given.
+
+def find_topic_neighborhood(topic, k=2, direction='out', edge_types=None,
+                            max_nodes=None, graph=None):
+    if graph is None:
+        graph = get_wiki_graph()
+    index = graph.ensure_index(topic)
+    if index is None:
+        return {}
+    indices, hops = k_hop_indices(graph, [index], k, direction, edge_types,
+                                  max_nodes if max_nodes is None else max_nodes + 1)
+    return {graph.vertex_name(i) : int(h) for i, h in zip(indices, hops) if h > 0}
+
+#------------------------------------------------------------------------------
+
+# Same as find_topic_neighborhood() but only returns the topic names,
+# nearest first.
+
+def find_topic_neighbors(topic, k=2, direction='out', edge_types=None,
+                         max_nodes=None, graph=None):
+    neighborhood = find_topic_neighborhood(topic, k, direction, edge_types,
+                                           max_nodes, graph)
+    return sorted(neighborhood, key=neighborhood.get)
+
+#*****************************************************************************
+# Part 4: Shortest Paths
+#*****************************************************************************
+
+# Paths are found with a bidirectional breadth first search: one search
+# follows the out edges from the source, the other the in edges from the
+# target, and the side with the cheaper frontier (fewest edges to scan) is
+# expanded at each step. Both searches keep their levels, i.e. the vertices
+# at each distance, as sorted arrays, from which the paths are rebuilt once
+# the two searches meet.
+
+DEFAULT_MAX_HOPS = 6
+
+#------------------------------------------------------------------------------
+
+class PathSearch:
+
+    def __init__(self, graph, source, target, edge_types=None):
+        self.graph = graph
+        self.type_mask = edge_type_mask(edge_types)
+        self.forward_levels = [np.array([source], dtype=np.int64)]
+        self.backward_levels = [np.array([target], dtype=np.int64)]
+        self.forward_visited = VisitedSet(graph.vertex_count())
+        self.backward_visited = VisitedSet(graph.vertex_count())
+        self.forward_visited.add(self.forward_levels[0])
+        self.backward_visited.add(self.backward_levels[0])
+
+    def hops(self):
+        return len(self.forward_levels) + len(self.backward_levels) - 2
+
+    def frontier_cost(self, offsets, frontier):
+        return int((offsets[frontier + 1] - offsets[frontier]).sum())
+
+    # Expands one side and returns the vertices where the two searches
+    # meet, as an array of (vertex, forward distance, backward distance).
+    def step(self):
+        graph = self.graph
+        forward = self.frontier_cost(graph.out_offsets, self.forward_levels[-1]) <= \
+                  self.frontier_cost(graph.in_offsets, self.backward_levels[-1])
+        if forward:
+            levels, visited = self.forward_levels, self.forward_visited
+            other_levels, other_visited = self.backward_levels, self.backward_visited
+        else:
+            levels, visited = self.backward_levels, self.backward_visited
+            other_levels, other_visited = self.forward_levels, self.forward_visited
+        frontier = expand_frontier(graph, levels[-1], 'out' if forward else 'in',
+                                   self.type_mask, visited)
+        visited.add(frontier)
+        levels.append(frontier)
+        meeting = frontier[other_visited.contains(frontier)]
+        if len(meeting) == 0:
+            return []
+        distance = len(levels) - 1
+        results = []
+        for vertex in meeting:
+            other_distance = level_distance(other_levels, vertex)
+            if forward:
+                results.append((int(vertex), distance, other_distance))
+            else:
+                results.append((int(vertex), other_distance, distance))
+        return results
+
+    # The vertices one step back from <vertex> on a path from the source.
+    def predecessors(self, vertex, distance):
+        graph = self.graph
+        start, end = graph.in_offsets[vertex], graph.in_offsets[vertex + 1]
+        neighbors = graph.in_sources[start:end]
+        if self.type_mask is not None:
+            neighbors = neighbors[self.type_mask[graph.in_types[start:end]]]
+        return np.intersect1d(neighbors, self.forward_levels[distance - 1],
+                              assume_unique=True)
+
+    # The vertices one step forward from <vertex> on a path to the target.
+    def successors(self, vertex, distance):
+        graph = self.graph
+        start, end = graph.out_offsets[vertex], graph.out_offsets[vertex + 1]
+        neighbors = graph.out_targets[start:end]
+        if self.type_mask is not None:
+            neighbors = neighbors[self.type_mask[graph.out_types[start:end]]]
+        return np.intersect1d(neighbors, self.backward_levels[distance - 1],
+                              assume_unique=True)
+
+    def paths_to_source(self, vertex, distance):
+        if distance == 0:
+            yield [vertex]
+        else:
+            for predecessor in self.predecessors(vertex, distance):
+                for path in self.paths_to_source(int(predecessor), distance - 1):
+                    yield path + [vertex]
+
+    def paths_to_target(self, vertex, distance):
+        if distance == 0:
+            yield [vertex]
+        else:
+            for successor in self.successors(vertex, distance):
+                for path in self.paths_to_target(int(successor), distance - 1):
+                    yield [vertex] + path
+
+    # All the shortest paths through the meeting vertices.
+    def paths(self, meeting):
+        length = min([x[1] + x[2] for x in meeting])
+        for vertex, forward, backward in meeting:
+            if forward + backward == length:
+                for head in self.paths_to_source(vertex, forward):
+                    for tail in self.paths_to_target(vertex, backward):
+                        yield head + tail[1:]
+
+#------------------------------------------------------------------------------
+
+# Distance of <vertex> from the start of a search, given its sorted levels.
+
+def level_distance(levels, vertex):
+    for distance, level in enumerate(levels):
+        position = np.searchsorted(level, vertex)
+        if position < len(level) and level[position] == vertex:
+            return distance
+    return None
+
+#------------------------------------------------------------------------------
+
+# Returns up to <k> shortest paths from <source> to <target>, vertex
+# indices, as lists of indices. All the paths returned have the same,
+# minimal, length. Returns [] when there is no path of at most <max_hops>
+# edges, or when <time_budget> seconds have elapsed before one was found.
+
+def shortest_path_indices(graph, source, target, k=1, max_hops=DEFAULT_MAX_HOPS,
+                          edge_types=None, time_budget=None):
+    if source == target:
+        return [[source]]
+    start = time.perf_counter()
+    search = PathSearch(graph, source, target, edge_types)
+    while search.hops() < max_hops:
+        if len(search.forward_levels[-1]) == 0 or \
+           len(search.backward_levels[-1]) == 0:
+            return []
+        meeting = search.step()
+        if meeting != []:
+            return list(itertools.islice(search.paths(meeting), k))
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            return []
+    return []
+
+#------------------------------------------------------------------------------
+
+# Returns the topics on a shortest path from topic <source> to topic
+# <target>, both included, or None when there is none within <max_hops>.
+
+def find_topic_path(source, target, max_hops=DEFAULT_MAX_HOPS, edge_types=None,
+                    time_budget=None, graph=None):
+    paths = find_topic_paths(source, target, 1, max_hops, edge_types,
+                             time_budget, graph)
+    return paths[0] if paths != [] else None
+
+#------------------------------------------------------------------------------
+
+# Returns up to <k> shortest paths between two topics, as lists of topic
+# names.
+
+def find_topic_paths(source, target, k=3, max_hops=DEFAULT_MAX_HOPS,
+                     edge_types=None, time_budget=None, graph=None):
+    if graph is None:
+        graph = get_wiki_graph()
+    source = graph.ensure_index(source)
+    target = graph.ensure_index(target)
+    if source is None or target is None:
+        return []
+    paths = shortest_path_indices(graph, source, target, k, max_hops,
+                                  edge_types, time_budget)
+    return [graph.vertex_names(path) for path in paths]
+
+#*****************************************************************************
+# Part 5: Benchmarks
+#*****************************************************************************
+
+# Times shortest path queries between random pairs of vertices, with one
+# end of each pair among the <hubs> vertices of largest degree, which have
+# the most expensive frontiers. Uses the process-wide snapshot unless a
+# graph is given, e.g. one from graph.make_random_wiki_graph().
+
+def benchmark_shortest_paths(graph=None, queries=100, hubs=20, k=1,
+                             max_hops=DEFAULT_MAX_HOPS, seed=0):
+    if graph is None:
+        graph = get_wiki_graph()
+    rng = np.random.default_rng(seed)
+    n = graph.vertex_count()
+    degrees = graph.outdegrees() + graph.indegrees()
+    hub_indices = np.argsort(degrees)[::-1][:hubs]
+    times = []
+    found = 0
+    hops = []
+    for i in range(queries):
+        hub = int(rng.choice(hub_indices))
+        other = int(rng.integers(n))
+        source, target = (hub, other) if i % 2 == 0 else (other, hub)
+        start = time.perf_counter()
+        paths = shortest_path_indices(graph, source, target, k, max_hops)
+        times.append(time.perf_counter() - start)
+        if paths != []:
+            found += 1
+            hops.append(len(paths[0]) - 1)
+    times = np.array(times) * 1000
+    results = {'queries' : queries,
+               'found' : found,
+               'mean_hops' : float(np.mean(hops)) if hops != [] else None,
+               'mean_ms' : float(times.mean()),
+               'median_ms' : float(np.median(times)),
+               'p95_ms' : float(np.percentile(times, 95)),
+               'max_ms' : float(times.max())}
+    print ("Shortest paths: " + str(queries) + " queries, " + str(found) + \
+           " found, median " + str(round(results['median_ms'], 2)) + "ms, " + \
+           "p95 " + str(round(results['p95_ms'], 2)) + "ms, " + \
+           "max " + str(round(results['max_ms'], 2)) + "ms")
+    return results
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
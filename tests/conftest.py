@@ -0,0 +1,34 @@
+#*****************************************************************************
+# TEST FIXTURES
+#*****************************************************************************
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#------------------------------------------------------------------------------
+
+# A pooled connection to wikidb, rolled back after the test. Tests using it
+# are skipped when the database can't be reached.
+
+@pytest.fixture
+def wikidb_conn():
+    import src.database as db
+    try:
+        pool = db.get_pool()
+        conn = pool.getconn()
+    except Exception as err:
+        pytest.skip("wikidb is not available: " + str(err))
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+        db.clear_topic_caches()
+        db.clear_edge_index()
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -0,0 +1,132 @@
+#*****************************************************************************
+# CACHES TESTS
+#*****************************************************************************
+
+import time
+import numpy as np
+
+from src.caches import LRUCache
+from src.caches import MISSING
+from src.caches import BloomFilter
+from src.caches import Int64HashSet
+from src.caches import hash_int
+from src.caches import hash_int64
+
+#------------------------------------------------------------------------------
+# LRU Cache
+#------------------------------------------------------------------------------
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+    assert cache.stats()['evictions'] == 1
+
+#------------------------------------------------------------------------------
+
+def test_lru_cache_holds_none():
+    cache = LRUCache()
+    cache.put('unknown topic', None)
+    assert cache.get('unknown topic') is None
+    assert 'unknown topic' in cache
+    assert 'other topic' not in cache
+
+#------------------------------------------------------------------------------
+
+def test_lru_cache_expiration():
+    cache = LRUCache(ttl=0.05)
+    cache.put('a', 1)
+    cache.put('b', 2, ttl=60)
+    time.sleep(0.1)
+    assert cache.get('a') is MISSING
+    assert cache.get('b') == 2
+    assert cache.stats()['expirations'] == 1
+
+#------------------------------------------------------------------------------
+
+def test_lru_cache_stats():
+    cache = LRUCache()
+    cache.put('a', 1)
+    cache.get('a')
+    cache.get('b')
+    cache.invalidate('a')
+    assert cache.get('a') is MISSING
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (1, 2, 1)
+    assert cache.hit_ratio() == 1 / 3
+    cache.put('a', 1)
+    cache.clear()
+    assert len(cache) == 0
+
+def test_lru_cache_bounded_by_bytes():
+    cache = LRUCache(maxsize=100, maxbytes=1000, sizeof=lambda x: x.nbytes)
+    cache.put('a', np.zeros(50))
+    cache.put('b', np.zeros(50))
+    assert cache.stats()['nbytes'] == 800
+    cache.put('c', np.zeros(50))
+    assert 'a' not in cache and len(cache) == 2
+    cache.put('d', np.zeros(200))
+    assert 'd' not in cache and cache.stats()['nbytes'] == 800
+    cache.invalidate('b')
+    assert cache.stats()['nbytes'] == 400
+
+#------------------------------------------------------------------------------
+# Hashing
+#------------------------------------------------------------------------------
+
+def test_scalar_and_array_hashes_agree():
+    keys = [0, 1, 12345, 2**40 + 7, 2**62]
+    for seed in [0, 1]:
+        assert hash_int64(keys, seed).tolist() == [hash_int(x, seed) for x in keys]
+
+#------------------------------------------------------------------------------
+# Bloom Filter
+#------------------------------------------------------------------------------
+
+def test_bloom_filter_membership():
+    rng = np.random.default_rng(0)
+    keys = np.unique(rng.integers(0, 2**40, 20000))
+    bloom = BloomFilter(len(keys), error_rate=0.01)
+    assert bloom.add(keys) == len(keys)
+    assert bloom.contains(keys).all()
+    assert all([int(x) in bloom for x in keys[:100]])
+    others = np.setdiff1d(rng.integers(0, 2**40, 20000), keys)
+    assert bloom.contains(others).mean() < 0.02
+
+#------------------------------------------------------------------------------
+
+def test_bloom_filter_counts_new_keys_once():
+    bloom = BloomFilter(1000)
+    bloom.add([1, 2, 3, 3])
+    assert bloom.add([2, 3]) == 0
+    assert bloom.count == 3
+
+#------------------------------------------------------------------------------
+# Integer Hash Set
+#------------------------------------------------------------------------------
+
+def test_int64_hash_set_membership():
+    rng = np.random.default_rng(1)
+    keys = rng.integers(0, 2**50, 50000)
+    keys[:100] = keys[100:200]
+    hash_set = Int64HashSet(16)
+    for batch in np.array_split(keys, 7):
+        hash_set.add(batch)
+    unique = np.unique(keys)
+    assert len(hash_set) == len(unique)
+    assert hash_set.contains(unique).all()
+    others = np.setdiff1d(rng.integers(0, 2**50, 1000), unique)
+    assert not hash_set.contains(others).any()
+    assert int(unique[0]) in hash_set and int(others[0]) not in hash_set
+    assert hash_set.add(unique[:10]) == 0
+    assert hash_set.add([2**51]) == 1
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -0,0 +1,274 @@
+#*****************************************************************************
+# CLUSTERING TESTS
+#*****************************************************************************
+
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+
+import src.processes
+
+from src.clustering import jaccard_index
+from src.clustering import compare_topics
+from src.clustering import neighbor_matrix
+from src.clustering import jaccard_matrix
+from src.clustering import generate_distance_matrix
+from src.clustering import distance_matrix_tiles
+from src.clustering import pgenerate_distance_matrix
+from src.clustering import set_jaccard_index
+from src.clustering import Clustering
+from src.clustering import sr_clustering
+from src.clustering import Cluster
+from src.clustering import save_clustering
+from src.clustering import load_clustering
+from src.clustering import store_clustering
+from src.clustering import load_stored_clustering
+from src.clustering import find_topic_cluster
+from src.clustering import TOPIC_CLUSTERS_TABLE
+
+#------------------------------------------------------------------------------
+
+def random_neighbor_lists(count, seed=0):
+    rng = np.random.default_rng(seed)
+    lists = [np.unique(rng.integers(0, 60, rng.integers(0, 15))) for i in range(count)]
+    lists[0] = np.zeros(0, dtype=np.int64)
+    return lists
+
+#------------------------------------------------------------------------------
+# Sparse Jaccard Indices
+#------------------------------------------------------------------------------
+
+def test_neighbor_matrix():
+    lists = [np.array([5, 9]), np.zeros(0, dtype=np.int64), np.array([9, 12, 40])]
+    matrix = neighbor_matrix(lists)
+    assert matrix.shape == (3, 4)
+    assert np.diff(matrix.indptr).tolist() == [2, 0, 3]
+    assert matrix.toarray().tolist() == [[1, 1, 0, 0], [0, 0, 0, 0], [0, 1, 1, 1]]
+    assert neighbor_matrix([np.zeros(0, dtype=np.int64)] * 2).shape == (2, 0)
+
+#------------------------------------------------------------------------------
+
+def test_jaccard_matrix_matches_jaccard_index():
+    lists = random_neighbor_lists(50)
+    matrix = neighbor_matrix(lists)
+    m1, m2 = matrix[:20], matrix[20:]
+    # Blocks smaller than the rows, and not dividing them.
+    result = jaccard_matrix(m1, m2, block_size=7)
+    assert result.dtype == np.float32
+    assert result.shape == (20, 30)
+    expected = [[jaccard_index(l1.tolist(), l2.tolist()) for l2 in lists[20:]]
+                for l1 in lists[:20]]
+    assert np.allclose(result, expected, atol=1e-4)
+    assert np.array_equal(jaccard_matrix(m1, m2), result)
+
+#------------------------------------------------------------------------------
+
+def test_generate_distance_matrix(wikidb_conn):
+    cur = wikidb_conn.cursor()
+    cur.execute("SELECT name FROM wiki_vertices ORDER BY id LIMIT 12;")
+    topics = [row[0] for row in cur.fetchall()]
+    topics1, topics2 = topics[:5] + ['No_such_topic'], topics[5:]
+    df = generate_distance_matrix(topics1, topics2, wikidb_conn, block_size=2)
+    assert list(df.index) == topics1
+    assert list(df.columns) == topics2
+    for t1 in topics1:
+        for t2 in topics2:
+            assert abs(df.loc[t1, t2] - compare_topics(t1, t2, wikidb_conn)) < 1e-4
+
+#------------------------------------------------------------------------------
+# Parallel Distance Matrices
+#------------------------------------------------------------------------------
+
+def test_tiles_cover_upper_triangle_once():
+    for n, tile_size in [(1, 4), (10, 4), (12, 4), (7, 10)]:
+        covered = np.zeros((n, n), dtype=np.int64)
+        for (i1, i2), (j1, j2) in distance_matrix_tiles(n, tile_size):
+            assert i1 <= j1
+            assert i2 - i1 <= tile_size and j2 - j1 <= tile_size
+            covered[i1:i2, j1:j2] += 1
+        assert np.array_equal(np.triu(covered), np.triu(np.ones((n, n), dtype=np.int64)))
+        assert (np.tril(covered, -1) <= 1).all()
+    assert distance_matrix_tiles(0) == []
+
+#------------------------------------------------------------------------------
+
+# The tile workers run in this process, writing into a shared buffer.
+
+def test_tile_workers_fill_jaccard_matrix():
+    matrix = neighbor_matrix(random_neighbor_lists(23, seed=1))
+    n = matrix.shape[0]
+    shm = SharedMemory(create=True, size=n * n * 4)
+    try:
+        src.processes.init_pdm_worker(shm.name, n, matrix.indptr, matrix.indices,
+                                      matrix.shape[1])
+        for tile in distance_matrix_tiles(n, 5):
+            src.processes.pdm_tile_worker(tile)
+        result = np.ndarray((n, n), dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        src.processes._PDM_STATE.pop('result', None)
+        src.processes._PDM_STATE.pop('shm').close()
+        shm.close()
+        shm.unlink()
+    assert np.array_equal(result, jaccard_matrix(matrix, matrix))
+
+#------------------------------------------------------------------------------
+
+def test_pgenerate_distance_matrix(wikidb_conn):
+    cur = wikidb_conn.cursor()
+    cur.execute("SELECT name FROM wiki_vertices ORDER BY id LIMIT 9;")
+    topics = [row[0] for row in cur.fetchall()]
+    df = pgenerate_distance_matrix(topics, tile_size=4, workers=2, conn=wikidb_conn)
+    expected = generate_distance_matrix(topics, topics, wikidb_conn)
+    assert list(df.index) == topics and list(df.columns) == topics
+    assert np.array_equal(df.values, expected.values)
+
+#------------------------------------------------------------------------------
+# SR Clustering
+#------------------------------------------------------------------------------
+
+# Each topic joins the first cluster all of whose members are at least
+# <threshold> similar to it, comparing it with every cluster.
+
+def naive_clustering(vertex_ids, neighbors, threshold):
+    clusters = []
+    for vertex_id in vertex_ids:
+        for cluster in clusters:
+            if all([set_jaccard_index(neighbors[vertex_id], neighbors[x]) >= threshold
+                    for x in cluster]):
+                cluster.append(vertex_id)
+                break
+        else:
+            clusters.append([vertex_id])
+    return clusters
+
+# Topics drawing their neighbors from a few overlapping groups, so that
+# clusters of several topics form.
+
+def random_neighbors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    neighbors = {}
+    for vertex_id in rng.permutation(np.arange(10, 10 + 3 * count))[:count].tolist():
+        group = int(rng.integers(0, 6))
+        pool = np.arange(20 * group, 20 * group + 30)
+        neighbors[vertex_id] = frozenset(rng.choice(pool, int(rng.integers(0, 12)),
+                                                    replace=False).tolist())
+    return neighbors
+
+def injected_clustering(neighbors, threshold):
+    clustering = Clustering(threshold)
+    clustering.neighbors.update(neighbors)
+    return clustering
+
+#------------------------------------------------------------------------------
+
+def test_clustering_matches_naive_clustering():
+    neighbors = random_neighbors(200)
+    vertex_ids = list(neighbors)
+    for threshold in [0, 1, 20, 40]:
+        clustering = injected_clustering(neighbors, threshold)
+        for vertex_id in vertex_ids:
+            clustering.add_topic(vertex_id)
+        clusters = [c.member_ids().tolist() for c in clustering.clusters]
+        assert clusters == naive_clustering(vertex_ids, neighbors, threshold)
+        if threshold == 0:
+            assert len(clusters) == 1
+        for cluster in clustering.clusters:
+            for vertex_id in cluster.member_ids().tolist():
+                assert clustering.cluster_of(vertex_id) is cluster
+                assert cluster.member_p(vertex_id)
+    assert clustering.cluster_of(5) is None
+    assert clustering.cluster_of(10 ** 6) is None
+
+#------------------------------------------------------------------------------
+
+def test_sr_clustering_is_incremental(wikidb_conn):
+    cur = wikidb_conn.cursor()
+    cur.execute("SELECT name FROM wiki_vertices ORDER BY id LIMIT 60;")
+    topics = [row[0] for row in cur.fetchall()]
+    clusters = sr_clustering(topics + ['No_such_topic'], 10, wikidb_conn)
+    clustering = Clustering(10)
+    clustering.add_topics(topics[:25], wikidb_conn)
+    # Topics already clustered are skipped.
+    clustering.add_topics(topics[20:], wikidb_conn)
+    assert [c.member_ids().tolist() for c in clustering.clusters] == \
+           [c.member_ids().tolist() for c in clusters]
+    assert clustering.cluster_of(topics[0], wikidb_conn) is clustering.clusters[0]
+    expected = naive_clustering(list(clustering.neighbors), clustering.neighbors, 10)
+    assert [c.member_ids().tolist() for c in clusters] == expected
+    assert sum([len(c) for c in clusters]) == 60
+
+#------------------------------------------------------------------------------
+# Compact Clusters
+#------------------------------------------------------------------------------
+
+def test_cluster_members_grow():
+    cluster = Cluster(None, 0, [4, 8])
+    for vertex_id in range(100):
+        cluster.add_member(vertex_id)
+    assert len(cluster) == 102
+    assert cluster.member_ids().dtype == np.int32
+    assert cluster.member_ids().tolist() == [4, 8] + list(range(100))
+    assert len(Cluster(None, 0)) == 0
+
+#------------------------------------------------------------------------------
+
+def same_clusterings(c1, c2):
+    return [(c.name, c.member_ids().tolist()) for c in c1.clusters] == \
+           [(c.name, c.member_ids().tolist()) for c in c2.clusters] and \
+           np.array_equal(c1.assignments[c1.assignments >= 0],
+                          c2.assignments[c2.assignments >= 0]) and \
+           c1.threshold == c2.threshold
+
+def test_save_and_load_clustering(tmp_path):
+    neighbors = random_neighbors(100)
+    clustering = injected_clustering(neighbors, 20)
+    for vertex_id in neighbors:
+        clustering.add_topic(vertex_id)
+    offsets, member_ids, names = clustering.to_arrays()
+    assert offsets[-1] == len(member_ids) == 100
+    assert same_clusterings(Clustering.from_arrays(offsets, member_ids, names, 20),
+                            clustering)
+    pathname = save_clustering(clustering, str(tmp_path / 'clusters'))
+    assert pathname == str(tmp_path / 'clusters')
+    loaded = load_clustering(pathname)
+    assert same_clusterings(loaded, clustering)
+    for vertex_id in neighbors:
+        assert loaded.cluster_of(vertex_id).index == clustering.cluster_of(vertex_id).index
+    # A loaded clustering rebuilds its index before adding topics.
+    assert not loaded.indexed_p
+    more = random_neighbors(150, seed=1)
+    more = dict([(x, y) for x, y in more.items() if x not in neighbors])
+    loaded.neighbors.update(neighbors)
+    loaded.neighbors.update(more)
+    loaded.ensure_index()
+    for vertex_id in more:
+        loaded.add_topic(vertex_id)
+        clustering.neighbors[vertex_id] = more[vertex_id]
+        clustering.add_topic(vertex_id)
+    assert same_clusterings(loaded, clustering)
+    empty = load_clustering(save_clustering(Clustering(), str(tmp_path / 'empty')))
+    assert len(empty) == 0
+
+#------------------------------------------------------------------------------
+
+def test_store_clustering(wikidb_conn):
+    cur = wikidb_conn.cursor()
+    cur.execute("SELECT name FROM wiki_vertices ORDER BY id LIMIT 30;")
+    topics = [row[0] for row in cur.fetchall()]
+    clustering = Clustering(10)
+    clustering.add_topics(topics, wikidb_conn)
+    name = 'test_store_clustering'
+    try:
+        assert store_clustering(clustering, name, wikidb_conn) == 30
+        # Storing again replaces it.
+        assert store_clustering(clustering, name, wikidb_conn) == 30
+        assert same_clusterings(load_stored_clustering(name, wikidb_conn), clustering)
+        cluster = clustering.cluster_of(topics[3], wikidb_conn)
+        assert find_topic_cluster(topics[3].upper(), name, wikidb_conn) == cluster.members
+        assert load_stored_clustering('no_such_clustering', wikidb_conn) is None
+    finally:
+        cur.execute("DELETE FROM " + TOPIC_CLUSTERS_TABLE + " WHERE clustering=%s;", (name,))
+        wikidb_conn.commit()
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -0,0 +1,203 @@
+#*****************************************************************************
+# COMMUNITIES TESTS
+#*****************************************************************************
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from src.graph import make_random_wiki_graph
+from src.graph import make_csr_graph
+from src.graph import edge_type_code
+from src.communities import undirected_adjacency
+from src.communities import forward_adjacency
+from src.communities import wedge_chunks
+from src.communities import TriangleCounter
+from src.communities import triangle_counts
+from src.communities import clustering_coefficients
+from src.communities import transitivity
+from src.communities import union_find_components
+from src.communities import compact_labels
+from src.communities import weakly_connected_components
+from src.communities import most_frequent_labels
+from src.communities import label_propagation
+from src.communities import topic_communities
+
+#------------------------------------------------------------------------------
+
+def undirected_matrix(offsets, neighbors):
+    n = len(offsets) - 1
+    rows = np.repeat(np.arange(n), np.diff(offsets))
+    return sp.csr_matrix((np.ones(len(rows)), (rows, neighbors)), shape=(n, n))
+
+#------------------------------------------------------------------------------
+# Undirected Subgraphs
+#------------------------------------------------------------------------------
+
+def test_undirected_adjacency_is_symmetric():
+    graph = make_random_wiki_graph(300, 2000, seed=1)
+    offsets, neighbors = undirected_adjacency(graph, None)
+    matrix = undirected_matrix(offsets, neighbors)
+    assert (matrix != matrix.T).nnz == 0
+    assert matrix.diagonal().sum() == 0
+    assert matrix.max() == 1
+    strongly_related = undirected_adjacency(graph)[1]
+    assert 0 < len(strongly_related) < len(neighbors)
+
+#------------------------------------------------------------------------------
+# Triangle Counting
+#------------------------------------------------------------------------------
+
+# The triangles through each vertex are half the closed walks of length 3
+# from it.
+
+def test_triangle_counts_match_matrix_cube():
+    graph = make_random_wiki_graph(300, 3000, seed=2)
+    offsets, neighbors = undirected_adjacency(graph, None)
+    matrix = undirected_matrix(offsets, neighbors)
+    expected = (matrix @ matrix @ matrix).diagonal() / 2
+    for threads in [1, 3]:
+        degrees, triangles = triangle_counts(graph, None, threads)
+        assert np.array_equal(triangles, expected)
+        assert np.array_equal(degrees, np.diff(offsets))
+
+#------------------------------------------------------------------------------
+
+def test_triangle_counts_in_small_chunks():
+    graph = make_random_wiki_graph(300, 3000, seed=3)
+    offsets, neighbors = undirected_adjacency(graph, None)
+    counter = TriangleCounter(offsets, neighbors)
+    expected, total = counter.count()
+    forward_offsets, sources, _ = forward_adjacency(offsets, neighbors, counter.ranks)
+    counter.chunks, counter.partners, counter.wedge_count = \
+        wedge_chunks(forward_offsets, sources, 50)
+    assert len(counter.chunks) > 10
+    counts, chunked_total = counter.count(threads=4)
+    assert np.array_equal(counts, expected)
+    assert chunked_total == total == expected.sum() // 3
+
+#------------------------------------------------------------------------------
+
+def test_clustering_coefficients():
+    # A triangle 0, 1, 2 with a pendant vertex 3 on 2 and an isolated 4.
+    degrees = np.array([2, 2, 3, 1, 0])
+    triangles = np.array([1, 1, 1, 0, 0])
+    assert np.allclose(clustering_coefficients(degrees, triangles),
+                       [1, 1, 1 / 3, 0, 0])
+    assert transitivity(degrees, triangles) == 3 / 5
+
+#------------------------------------------------------------------------------
+# Connected Components
+#------------------------------------------------------------------------------
+
+# Two labellings describe the same partition when their labels map one to
+# one onto each other.
+
+def same_partition(labels1, labels2):
+    pairs = set(zip(np.asarray(labels1).tolist(), np.asarray(labels2).tolist()))
+    return len(pairs) == len(set(labels1.tolist())) == len(set(labels2.tolist()))
+
+#------------------------------------------------------------------------------
+
+def test_union_find_matches_scipy():
+    rng = np.random.default_rng(4)
+    n = 2000
+    sources = rng.integers(0, n, 1500)
+    targets = rng.integers(0, n, 1500)
+    roots = union_find_components(n, sources, targets)
+    assert np.array_equal(roots[roots], roots)
+    matrix = sp.csr_matrix((np.ones(len(sources)), (sources, targets)), shape=(n, n))
+    count, expected = connected_components(matrix, directed=True, connection='weak')
+    assert len(np.unique(roots)) == count
+    assert same_partition(roots, expected)
+
+#------------------------------------------------------------------------------
+
+def test_compact_labels_by_decreasing_size():
+    labels, sizes = compact_labels(np.array([7, 3, 7, 9, 7, 3]))
+    assert labels.tolist() == [0, 1, 0, 2, 0, 1]
+    assert sizes.tolist() == [3, 2, 1]
+
+#------------------------------------------------------------------------------
+
+def test_weakly_connected_components():
+    graph = make_random_wiki_graph(1000, 900, seed=5)
+    labels, sizes = weakly_connected_components(graph)
+    n = graph.vertex_count()
+    sources = np.repeat(np.arange(n), graph.outdegrees())
+    matrix = sp.csr_matrix((np.ones(len(sources)), (sources, graph.out_targets)),
+                           shape=(n, n))
+    count, expected = connected_components(matrix, directed=True, connection='weak')
+    assert len(sizes) == count
+    assert same_partition(labels, expected)
+    assert sizes.tolist() == sorted(sizes.tolist(), reverse=True)
+    assert np.bincount(labels).tolist() == sizes.tolist()
+
+#------------------------------------------------------------------------------
+# Label Propagation
+#------------------------------------------------------------------------------
+
+def test_most_frequent_labels():
+    # Edges 0 - 1, 0 - 2, 0 - 3, 1 - 2. A vertex keeps its label when it is
+    # among the most frequent, otherwise it takes the smallest of them.
+    offsets = np.array([0, 3, 5, 7, 8])
+    neighbors = np.array([1, 2, 3, 0, 2, 0, 1, 0])
+    labels = np.array([1, 2, 2, 3])
+    assert most_frequent_labels(offsets, neighbors, labels).tolist() == [2, 2, 2, 1]
+    labels = np.array([0, 1, 2, 3])
+    assert most_frequent_labels(offsets, neighbors, labels).tolist() == [1, 0, 0, 0]
+
+#------------------------------------------------------------------------------
+
+# Three cliques of 8 topics chained by single strongly related edges, plus
+# 'related' edges between the cliques which are not followed.
+
+def clique_graph():
+    strongly_related = edge_type_code('strongly related')
+    sources, targets, types = [], [], []
+    for clique in range(3):
+        members = range(8 * clique, 8 * clique + 8)
+        for a in members:
+            for b in members:
+                if a != b:
+                    sources.append(a)
+                    targets.append(b)
+                    types.append(strongly_related)
+    for a, b, edge_type in [(7, 8, strongly_related), (15, 16, strongly_related),
+                            (0, 20, edge_type_code('related')),
+                            (1, 21, edge_type_code('related'))]:
+        sources += [a, b]
+        targets += [b, a]
+        types += [edge_type, edge_type]
+    return make_csr_graph(np.arange(1, 25), ['Topic_' + str(i) for i in range(24)],
+                          np.array(sources), np.array(targets),
+                          np.array(types, dtype=np.uint8))
+
+#------------------------------------------------------------------------------
+
+def test_label_propagation_finds_cliques():
+    graph = clique_graph()
+    cliques = np.repeat(np.arange(3), 8)
+    for seed in range(5):
+        labels, sizes = topic_communities(graph, seed=seed)
+        assert same_partition(labels, cliques)
+        assert sizes.tolist() == [8, 8, 8]
+    offsets, neighbors = undirected_adjacency(graph, None)
+    labels = label_propagation(offsets, neighbors, seed=0)
+    assert len(np.unique(labels)) <= 3
+
+#------------------------------------------------------------------------------
+
+# Without strongly related edges every topic is a community of its own.
+
+def test_communities_without_edges():
+    graph = make_random_wiki_graph(50, 200, seed=6)
+    graph.out_types[:] = edge_type_code('related')
+    graph.in_types[:] = edge_type_code('related')
+    labels, sizes = topic_communities(graph)
+    assert sorted(labels.tolist()) == list(range(50))
+    assert sizes.tolist() == [1] * 50
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
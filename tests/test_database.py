@@ -0,0 +1,53 @@
+#*****************************************************************************
+# WIKIDB TESTS
+#*****************************************************************************
+
+import src.database as db
+
+#------------------------------------------------------------------------------
+# Edge Index
+#------------------------------------------------------------------------------
+
+def add_test_vertices(names, conn):
+    for name in names:
+        db.add_wiki_vertex(name, conn)
+    return [db.find_topic_id(name, conn) for name in names]
+
+def count_edges(source_id, target_id, conn):
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM " + db.edge_table_name('t') + \
+                " WHERE source=%s AND target=%s;", (source_id, target_id))
+    return cur.fetchone()[0]
+
+#------------------------------------------------------------------------------
+
+def test_edge_added_twice_in_one_transaction(wikidb_conn):
+    for authoritative in [False, True]:
+        db.load_edge_index(authoritative=authoritative, conn=wikidb_conn, verbose=False)
+        source_id, target_id = add_test_vertices(['Test edge source', 'Test edge target'],
+                                                 wikidb_conn)
+        db.add_wiki_edge('Test edge source', 'Test edge target', conn=wikidb_conn)
+        db.add_wiki_edge('Test edge source', 'Test edge target', conn=wikidb_conn)
+        assert count_edges(source_id, target_id, wikidb_conn) == 1
+        wikidb_conn.rollback()
+        db.clear_topic_caches()
+
+#------------------------------------------------------------------------------
+
+def test_edge_index_answers():
+    index = db.EdgeIndex(1000, authoritative=False)
+    index.add(db.edge_keys([1, 2], [3, 4]))
+    assert index.contains(db.edge_key(1, 3)) is True
+    assert index.contains(db.edge_key(5, 6)) is None
+    index.add_pending(db.edge_keys([5], [6]))
+    assert index.contains(db.edge_key(5, 6)) is None
+    index.discard(db.edge_key(1, 3))
+    assert index.contains(db.edge_key(1, 3)) is None
+    index = db.EdgeIndex(1000, authoritative=True)
+    index.add(db.edge_keys([1], [3]))
+    assert index.contains(db.edge_key(5, 6)) is False
+    assert index.contains(db.edge_key(1, 3)) is True
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+#*****************************************************************************
+# IN-MEMORY WIKI GRAPH TESTS
+#*****************************************************************************
+
+import pytest
+import numpy as np
+
+from src.graph import build_csr
+from src.graph import make_wiki_graph
+from src.graph import edge_type_code
+from src.graph import save_wiki_graph
+from src.graph import open_wiki_graph
+
+#------------------------------------------------------------------------------
+
+# Vertex ids are not dense and not given in order. The edge 30 -> 99 has an
+# unknown target and the edge 10 -> 20 is given twice.
+
+def make_test_graph():
+    ids = [30, 10, 20, 40]
+    names = ['Gamma', 'Alpha', 'Beta', 'Delta']
+    sources = [10, 10, 10, 20, 30, 30, 40, 10]
+    targets = [30, 20, 40, 30, 10, 99, 10, 20]
+    types = [edge_type_code('related')] * 8
+    types[3] = edge_type_code('subtopic')
+    return make_wiki_graph(ids, names, sources, targets, types)
+
+#------------------------------------------------------------------------------
+# Building CSR Arrays
+#------------------------------------------------------------------------------
+
+def test_build_csr_sorts_and_drops_duplicates():
+    keys = np.array([2, 0, 0, 2, 0])
+    values = np.array([1, 2, 1, 1, 2])
+    types = np.array([0, 1, 2, 0, 1])
+    offsets, neighbors, edge_types = build_csr(keys, values, types, 3)
+    assert offsets.tolist() == [0, 2, 2, 3]
+    assert neighbors.tolist() == [1, 2, 1]
+    assert neighbors.dtype == np.int32
+    assert edge_types.dtype == np.uint8
+
+#------------------------------------------------------------------------------
+# Wiki Graph
+#------------------------------------------------------------------------------
+
+def test_vertices_are_numbered_in_id_order():
+    graph = make_test_graph()
+    assert graph.ids.tolist() == [10, 20, 30, 40]
+    assert graph.vertex_names(range(4)) == ['Alpha', 'Beta', 'Gamma', 'Delta']
+    assert graph.vertex_index('gAMMA') == 2
+    assert graph.id_index(40) == 3
+    assert graph.id_index(50) is None
+    assert graph.ensure_index('Unknown') is None
+
+#------------------------------------------------------------------------------
+
+def test_neighbors_in_both_directions():
+    graph = make_test_graph()
+    assert graph.edge_count() == 6
+    assert graph.find_topic_out_neighbors('Alpha') == ['Beta', 'Gamma', 'Delta']
+    assert graph.find_topic_in_neighbors('Alpha') == ['Gamma', 'Delta']
+    assert graph.find_topic_out_neighbors('Gamma') == ['Alpha']
+    assert graph.outdegrees().tolist() == [3, 1, 1, 1]
+    assert graph.indegrees().tolist() == [2, 1, 2, 1]
+    assert graph.count_topic_in_neighbors(30) == 2
+
+#------------------------------------------------------------------------------
+
+def test_edge_types():
+    graph = make_test_graph()
+    assert graph.find_edge_type('Beta', 'Gamma') == 'subtopic'
+    assert graph.find_edge_type('Alpha', 'Beta') == 'related'
+    assert graph.find_edge_type('Beta', 'Alpha') is None
+
+#------------------------------------------------------------------------------
+# On-Disk Graph Format
+#------------------------------------------------------------------------------
+
+def test_save_and_open_round_trip(tmp_path):
+    graph = make_test_graph()
+    graph.names[0] = 'Alpha_\u00e9t\u00e9'
+    pathname = save_wiki_graph(graph, str(tmp_path / 'graph.bin'))
+    opened = open_wiki_graph(pathname)
+    for name in ['ids', 'out_offsets', 'out_targets', 'out_types',
+                 'in_offsets', 'in_sources', 'in_types']:
+        assert np.array_equal(getattr(opened, name), getattr(graph, name))
+    assert [opened.vertex_name(i) for i in range(4)] == graph.names
+    assert opened.vertex_index('ALPHA_\u00c9T\u00c9') == 0
+    assert opened.vertex_index('delta') == 3
+    assert opened.vertex_index('Epsilon') is None
+    assert opened.find_topic_out_neighbors('Beta') == ['Gamma']
+
+#------------------------------------------------------------------------------
+
+def test_open_rejects_other_files(tmp_path):
+    pathname = tmp_path / 'other.bin'
+    pathname.write_bytes(b'\0' * 4096)
+    with pytest.raises(ValueError):
+        open_wiki_graph(str(pathname))
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
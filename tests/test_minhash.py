@@ -0,0 +1,171 @@
+#*****************************************************************************
+# MINHASH INDEX TESTS
+#*****************************************************************************
+
+import numpy as np
+
+import src.database as db
+import src.minhash as mh
+from src.graph import make_wiki_graph
+from src.minhash import minhash_signatures
+from src.minhash import permutation_parameters
+from src.minhash import build_minhash_index
+from src.minhash import find_similar_vertex_ids
+from src.minhash import save_minhash_index
+from src.minhash import load_minhash_index
+from src.minhash import get_minhash_index
+
+#------------------------------------------------------------------------------
+
+NUM_PERM = 256
+BANDS = 64
+
+# Topics 1 to 3 have chosen overlaps:
+#   J(1, 2) = 90/110, J(1, 3) = 50/150, J(2, 3) = 50/150
+# and 300 more topics, 1000 on, have 20 random targets out of 8000.
+
+def neighbor_sets(seed=0):
+    rng = np.random.default_rng(seed)
+    sets = {1 : set(range(100, 200)),
+            2 : set(range(100, 190)) | set(range(200, 210)),
+            3 : set(range(100, 150)) | set(range(250, 300))}
+    for vertex_id in range(1000, 1300):
+        sets[vertex_id] = set(rng.choice(np.arange(2000, 10000), 20, replace=False).tolist())
+    return sets
+
+def make_graph(sets):
+    ids = sorted(set(sets) | set([x for s in sets.values() for x in s]))
+    sources = [x for x in sets for y in sorted(sets[x])]
+    targets = [y for x in sets for y in sorted(sets[x])]
+    return make_wiki_graph(ids, ['Topic_' + str(x) for x in ids], sources, targets)
+
+def exact_jaccard(s1, s2):
+    return len(s1 & s2) / len(s1 | s2)
+
+def build_index(sets):
+    return build_minhash_index(make_graph(sets), num_perm=NUM_PERM, bands=BANDS,
+                               verbose=False)
+
+def signature(index, vertex_id):
+    return index.signatures[index.row(vertex_id)]
+
+#------------------------------------------------------------------------------
+# Signatures
+#------------------------------------------------------------------------------
+
+def test_signatures_are_minimums_over_elements():
+    masks, multipliers = permutation_parameters(32, seed=3)
+    sets = [np.array([5, 9, 11]), np.array([7]), np.arange(40, 60)]
+    offsets = np.cumsum([0] + [len(s) for s in sets])
+    elements = np.concatenate(sets)
+    signatures = minhash_signatures(offsets, elements, masks, multipliers)
+    # Chunks of a few elements give the same signatures.
+    assert np.array_equal(minhash_signatures(offsets, elements, masks, multipliers,
+                                             chunk_size=2), signatures)
+    for i, s in enumerate(sets):
+        single = minhash_signatures(np.arange(len(s) + 1), s, masks, multipliers)
+        assert np.array_equal(single.min(axis=0), signatures[i])
+
+#------------------------------------------------------------------------------
+
+def test_estimates_match_exact_jaccard():
+    sets = neighbor_sets()
+    index = build_index(sets)
+    assert index.vertex_count() == len(sets)
+    # Only topics with out neighbors are indexed.
+    assert index.row(100) is None
+    for a, b in [(1, 2), (1, 3), (2, 3), (1000, 1001)]:
+        estimate = (signature(index, a) == signature(index, b)).mean()
+        assert abs(estimate - exact_jaccard(sets[a], sets[b])) < 0.1
+
+#------------------------------------------------------------------------------
+
+def test_similar_topics():
+    sets = neighbor_sets()
+    index = build_index(sets)
+    assert index.ids[index.candidates(index.row(1))].tolist() != []
+    similar = find_similar_vertex_ids(1, threshold=0.5, index=index)
+    assert [x for x, _ in similar] == [2]
+    assert abs(similar[0][1] - 90/110) < 0.1
+    similar = find_similar_vertex_ids(1, threshold=0.2, index=index)
+    assert [x for x, _ in similar] == [2, 3]
+    assert find_similar_vertex_ids(1000, threshold=0.5, index=index) == []
+    assert find_similar_vertex_ids(100, index=index) == []
+
+#------------------------------------------------------------------------------
+# Updates
+#------------------------------------------------------------------------------
+
+# Updated signatures are exactly those of an index built from the updated
+# sets, and queries see them before the next rebuild.
+
+def test_add_edges():
+    sets = neighbor_sets()
+    index = build_index(sets)
+    index.add_edges([3] * 40 + [7] * 90, list(range(150, 190)) + list(range(100, 190)))
+    assert len(index.dirty) == 2
+    sets[3] |= set(range(150, 190))
+    sets[7] = set(range(100, 190))
+    fresh = build_index(sets)
+    for vertex_id in [1, 2, 3, 7, 1000]:
+        assert np.array_equal(signature(index, vertex_id), signature(fresh, vertex_id))
+    assert 3 in [x for x, _ in find_similar_vertex_ids(1, threshold=0.45, index=index)]
+    assert 1 in [x for x, _ in find_similar_vertex_ids(3, threshold=0.45, index=index)]
+    assert sorted([x for x, _ in find_similar_vertex_ids(7, threshold=0.8, index=index)]) == \
+           [1, 2]
+
+#------------------------------------------------------------------------------
+
+def test_set_neighbors():
+    sets = neighbor_sets()
+    index = build_index(sets)
+    index.set_neighbors([2, 3], [np.arange(500, 520), np.zeros(0, dtype=np.int64)])
+    assert find_similar_vertex_ids(1, threshold=0.2, index=index) == []
+    assert find_similar_vertex_ids(3, threshold=0.0, index=index) == []
+    sets[2] = set(range(500, 520))
+    del sets[3]
+    fresh = build_index(sets)
+    assert np.array_equal(signature(index, 2), signature(fresh, 2))
+    index.build()
+    assert find_similar_vertex_ids(1, threshold=0.2, index=index) == []
+
+#------------------------------------------------------------------------------
+# Saving and Loading
+#------------------------------------------------------------------------------
+
+def test_save_and_load(tmp_path):
+    index = build_index(neighbor_sets())
+    index.add_edges([5], [100])
+    pathname = save_minhash_index(index, str(tmp_path / 'minhash.npz'))
+    loaded = load_minhash_index(pathname)
+    assert np.array_equal(loaded.ids, index.ids)
+    assert np.array_equal(loaded.signatures, index.signatures)
+    assert np.array_equal(loaded.sorted_keys, index.sorted_keys)
+    assert (loaded.bands, loaded.seed) == (BANDS, 0)
+    assert find_similar_vertex_ids(1, threshold=0.2, index=loaded) == \
+           find_similar_vertex_ids(1, threshold=0.2, index=index)
+
+#------------------------------------------------------------------------------
+
+def test_reloading_keeps_one_listener(tmp_path):
+    pathname = save_minhash_index(build_index(neighbor_sets()),
+                                  str(tmp_path / 'minhash.npz'))
+    listeners = list(db.EDGE_LISTENERS)
+    previous = mh._INDEX
+    try:
+        for i in range(3):
+            index = get_minhash_index(reload=True, pathname=pathname)
+        assert len(db.EDGE_LISTENERS) == len(listeners) + (previous is None)
+        assert index.on_edges in db.EDGE_LISTENERS
+        db.notify_edges('add', [1], [250])
+        assert np.array_equal(signature(index, 1),
+                              np.minimum(signature(load_minhash_index(pathname), 1),
+                                         signature(build_index({1 : {250}}), 1)))
+    finally:
+        db.remove_edge_listener(mh._INDEX.on_edges)
+        mh._INDEX = previous
+        db.EDGE_LISTENERS[:] = listeners
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -0,0 +1,137 @@
+#*****************************************************************************
+# TOPIC RANKING TESTS
+#*****************************************************************************
+
+import numpy as np
+
+from src.graph import make_csr_graph
+from src.graph import make_random_wiki_graph
+from src.graph import edge_type_code
+from src.ranking import pagerank
+from src.ranking import personalized_pagerank
+from src.ranking import top_k_indices
+from src.ranking import push_pagerank
+from src.ranking import find_related_topic_scores
+
+#------------------------------------------------------------------------------
+
+# PageRank from the dense Google matrix, with the mass of dangling vertices
+# sent to the teleport distribution.
+
+def dense_pagerank(graph, damping=0.85, teleport=None, edge_types=None):
+    n = graph.vertex_count()
+    sources = np.repeat(np.arange(n), graph.outdegrees())
+    targets = graph.out_targets
+    if edge_types is not None:
+        keep = np.isin(graph.out_types, [edge_type_code(x) for x in edge_types])
+        sources, targets = sources[keep], targets[keep]
+    adjacency = np.zeros((n, n))
+    np.add.at(adjacency, (sources, targets), 1)
+    outdegrees = adjacency.sum(axis=1)
+    teleport = np.full(n, 1.0 / n) if teleport is None else teleport / teleport.sum()
+    transition = np.where(outdegrees[:, None] > 0,
+                          adjacency / np.maximum(outdegrees, 1)[:, None],
+                          teleport[None, :])
+    google = damping * transition + (1 - damping) * teleport[None, :]
+    # The stationary distribution: the eigenvector of eigenvalue 1.
+    values, vectors = np.linalg.eig(google.T)
+    x = np.real(vectors[:, np.argmin(np.abs(values - 1))])
+    return x / x.sum()
+
+#------------------------------------------------------------------------------
+# PageRank
+#------------------------------------------------------------------------------
+
+def test_pagerank_of_a_small_graph():
+    # 0 -> 1, 1 -> 2, 2 -> 0, 2 -> 1, and 3 -> 2 with no in edges; 4 is
+    # dangling.
+    graph = make_csr_graph(np.arange(1, 6), list('ABCDE'),
+                           np.array([0, 1, 2, 2, 3, 3]), np.array([1, 2, 0, 1, 2, 4]),
+                           np.zeros(6, dtype=np.uint8))
+    scores = pagerank(graph, tolerance=1e-12, max_iterations=1000)
+    assert abs(scores.sum() - 1) < 1e-9
+    assert np.allclose(scores, dense_pagerank(graph), atol=1e-9)
+    assert top_k_indices(scores, 2).tolist() == [2, 1]
+
+#------------------------------------------------------------------------------
+
+def test_pagerank_of_a_random_graph():
+    graph = make_random_wiki_graph(300, 1200, seed=4)
+    expected = dense_pagerank(graph)
+    assert np.allclose(pagerank(graph, tolerance=1e-12, max_iterations=1000),
+                       expected, atol=1e-8)
+    assert np.allclose(pagerank(graph, tolerance=1e-12, max_iterations=1000, threads=3),
+                       expected, atol=1e-8)
+    types = ['strongly related']
+    assert np.allclose(pagerank(graph, tolerance=1e-12, max_iterations=1000,
+                                edge_types=types),
+                       dense_pagerank(graph, edge_types=types), atol=1e-8)
+
+#------------------------------------------------------------------------------
+
+def test_personalized_pagerank():
+    graph = make_random_wiki_graph(300, 1200, seed=5)
+    teleport = np.zeros(300)
+    teleport[[3, 7]] = [1.0, 3.0]
+    scores = personalized_pagerank(graph, {3 : 1.0, 7 : 3.0}, tolerance=1e-12,
+                                   max_iterations=1000)
+    assert np.allclose(scores, dense_pagerank(graph, teleport=teleport), atol=1e-8)
+
+#------------------------------------------------------------------------------
+# Related Topics
+#------------------------------------------------------------------------------
+
+# The exact scores approximated by push_pagerank(). The mass r arriving at
+# each vertex is the seed mass plus (1 - restart) of the mass arriving at
+# its neighbors, spread evenly over their edges; a vertex keeps <restart>
+# of it, or all of it when it has no edges to follow.
+
+def dense_push_pagerank(graph, seed, restart=0.15, direction='both', edge_types=None):
+    n = graph.vertex_count()
+    sources = np.repeat(np.arange(n), graph.outdegrees())
+    targets = graph.out_targets.astype(np.int64)
+    keep = np.ones(len(sources), dtype=bool) if edge_types is None else \
+           np.isin(graph.out_types, [edge_type_code(x) for x in edge_types])
+    adjacency = np.zeros((n, n))
+    if direction in ['out', 'both']:
+        np.add.at(adjacency, (sources[keep], targets[keep]), 1)
+    if direction in ['in', 'both']:
+        np.add.at(adjacency, (targets[keep], sources[keep]), 1)
+    degrees = adjacency.sum(axis=1)
+    transition = adjacency / np.maximum(degrees, 1)[:, None]
+    start = np.zeros(n)
+    start[seed] = 1.0
+    arrived = np.linalg.solve(np.eye(n) - (1 - restart) * transition.T, start)
+    return np.where(degrees > 0, restart * arrived, arrived)
+
+def push_scores(graph, seed, **kwargs):
+    estimates = push_pagerank(graph, [seed], epsilon=1e-10, max_pushes=10**9, **kwargs)
+    scores = np.zeros(graph.vertex_count())
+    scores[estimates.indices] = estimates.values
+    return scores
+
+#------------------------------------------------------------------------------
+
+def test_push_pagerank_matches_exact_scores():
+    graph = make_random_wiki_graph(200, 800, seed=6)
+    for direction in ['out', 'in', 'both']:
+        for edge_types in [None, ['strongly related']]:
+            scores = push_scores(graph, 5, direction=direction, edge_types=edge_types)
+            assert abs(scores.sum() - 1) < 1e-6
+            assert np.allclose(scores, dense_push_pagerank(graph, 5, 0.15, direction,
+                                                           edge_types), atol=1e-6)
+
+#------------------------------------------------------------------------------
+
+def test_related_topic_scores():
+    graph = make_random_wiki_graph(200, 800, seed=7)
+    related = find_related_topic_scores('Topic_5', k=10, epsilon=1e-10, graph=graph)
+    expected = dense_push_pagerank(graph, 5)
+    expected[5] = 0
+    assert [x[0] for x in related] == \
+           graph.vertex_names(np.argsort(-expected, kind='stable')[:10])
+    assert find_related_topic_scores('Unknown', graph=graph) == []
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -0,0 +1,35 @@
+#*****************************************************************************
+# TOPICS API TESTS
+#*****************************************************************************
+
+from src.graph import make_wiki_graph
+from src.topics import filter_topics
+from src.topics import find_ranked_related_topics
+
+#------------------------------------------------------------------------------
+
+def test_filter_topics():
+    topics = ['Paris', 'Paris#History', 'Mercury_(planet)', 'Mars']
+    assert sorted(filter_topics('Paris', topics)) == ['Mars', 'Paris']
+
+#------------------------------------------------------------------------------
+
+# A hub linked to 30 section topics, which are filtered out, and 10 plain
+# topics ranked below them.
+
+def test_ranked_related_topics_are_filtered_after_ranking():
+    names = ['Hub'] + ['Hub#Section_' + str(i) for i in range(30)] + \
+            ['Topic_' + str(i) for i in range(10)]
+    ids = list(range(1, len(names) + 1))
+    sources = [1] * 40 + list(range(2, 32)) * 2
+    targets = list(range(2, 42)) + [1] * 30 + list(range(3, 33))
+    graph = make_wiki_graph(ids, names, sources, targets)
+    related = find_ranked_related_topics('Hub', k=5, graph=graph)
+    assert len(related) == 5
+    assert all([x[0].startswith('Topic_') for x in related])
+    scores = [x[1] for x in related]
+    assert scores == sorted(scores, reverse=True)
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------
@@ -0,0 +1,119 @@
+#*****************************************************************************
+# GRAPH TRAVERSAL TESTS
+#*****************************************************************************
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import shortest_path
+
+from src.graph import make_random_wiki_graph
+from src.graph import make_wiki_graph
+from src.traversal import VisitedSet
+from src.traversal import k_hop_indices
+from src.traversal import find_topic_neighborhood
+from src.traversal import shortest_path_indices
+from src.traversal import find_topic_paths
+
+#------------------------------------------------------------------------------
+
+def adjacency_matrix(graph):
+    n = graph.vertex_count()
+    sources = np.repeat(np.arange(n), graph.outdegrees())
+    return sp.csr_matrix((np.ones(len(sources)), (sources, graph.out_targets)),
+                         shape=(n, n))
+
+# Hop distances from <source>, -1 when it is unreachable.
+def hop_distances(matrix, source):
+    distances = shortest_path(matrix, unweighted=True, indices=source)
+    return np.where(np.isinf(distances), -1, distances).astype(np.int64)
+
+#------------------------------------------------------------------------------
+# Visited Sets
+#------------------------------------------------------------------------------
+
+def test_visited_set():
+    visited = VisitedSet(20)
+    visited.add([0, 7, 8, 19])
+    assert len(visited) == 4
+    assert visited.contains([0, 1, 7, 8, 9, 19]).tolist() == \
+           [True, False, True, True, False, True]
+
+#------------------------------------------------------------------------------
+# K-Hop Neighborhoods
+#------------------------------------------------------------------------------
+
+def test_k_hop_distances_match_breadth_first_search():
+    graph = make_random_wiki_graph(500, 1500, seed=1)
+    matrix = adjacency_matrix(graph)
+    for source in [0, 17, 250]:
+        for direction, m in [('out', matrix), ('in', matrix.T.tocsr()),
+                             ('both', (matrix + matrix.T).tocsr())]:
+            expected = hop_distances(m, source)
+            indices, hops = k_hop_indices(graph, [source], 3, direction)
+            assert len(np.unique(indices)) == len(indices)
+            reached = (expected >= 0) & (expected <= 3)
+            assert sorted(indices.tolist()) == np.flatnonzero(reached).tolist()
+            assert np.array_equal(hops, expected[indices])
+
+#------------------------------------------------------------------------------
+
+def test_k_hop_max_nodes():
+    graph = make_random_wiki_graph(500, 3000, seed=2)
+    indices, hops = k_hop_indices(graph, [0], 4, 'both', max_nodes=25)
+    assert len(indices) == 25
+    assert hops.tolist() == sorted(hops.tolist())
+
+#------------------------------------------------------------------------------
+
+def test_topic_neighborhood_with_edge_types():
+    graph = make_wiki_graph([1, 2, 3, 4], ['A', 'B', 'C', 'D'],
+                            [1, 2, 1], [2, 3, 4], [0, 0, 1])
+    assert find_topic_neighborhood('A', 2, graph=graph) == {'B' : 1, 'C' : 2, 'D' : 1}
+    assert find_topic_neighborhood('A', 2, edge_types=['related'], graph=graph) == \
+           {'B' : 1, 'C' : 2}
+    assert find_topic_neighborhood('C', 1, direction='in', graph=graph) == {'B' : 1}
+    assert find_topic_neighborhood('Z', graph=graph) == {}
+
+#------------------------------------------------------------------------------
+# Shortest Paths
+#------------------------------------------------------------------------------
+
+def edge_set(graph):
+    n = graph.vertex_count()
+    sources = np.repeat(np.arange(n), graph.outdegrees())
+    return set(zip(sources.tolist(), graph.out_targets.tolist()))
+
+#------------------------------------------------------------------------------
+
+def test_shortest_paths_match_breadth_first_search():
+    graph = make_random_wiki_graph(400, 1000, seed=3)
+    matrix = adjacency_matrix(graph)
+    edges = edge_set(graph)
+    rng = np.random.default_rng(0)
+    for source, target in rng.integers(0, 400, (40, 2)).tolist():
+        distance = hop_distances(matrix, source)[target]
+        paths = shortest_path_indices(graph, source, target, k=5, max_hops=10)
+        if distance < 0:
+            assert paths == []
+            continue
+        assert 1 <= len(paths) <= 5
+        assert len(set(map(tuple, paths))) == len(paths)
+        for path in paths:
+            assert (path[0], path[-1]) == (source, target)
+            assert len(path) == distance + 1
+            assert all([(a, b) in edges for a, b in zip(path[:-1], path[1:])])
+
+#------------------------------------------------------------------------------
+
+def test_all_shortest_topic_paths():
+    graph = make_wiki_graph([1, 2, 3, 4, 5], ['A', 'B', 'C', 'D', 'E'],
+                            [1, 1, 2, 3, 4], [2, 3, 4, 4, 5])
+    paths = find_topic_paths('A', 'E', k=3, graph=graph)
+    assert sorted(paths) == [['A', 'B', 'D', 'E'], ['A', 'C', 'D', 'E']]
+    assert find_topic_paths('A', 'E', max_hops=2, graph=graph) == []
+    assert find_topic_paths('E', 'A', graph=graph) == []
+    assert find_topic_paths('A', 'A', graph=graph) == [['A']]
+
+#------------------------------------------------------------------------------
+# End of File
+#------------------------------------------------------------------------------